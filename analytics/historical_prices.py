@@ -1,11 +1,140 @@
 import csv
 import os
+import sys
 import json
+import sqlite3
+import argparse
+import heapq
+import logging
+import math
+import gzip
+import shutil
+import time
+import zlib
+from array import array
 from datetime import datetime
+from functools import lru_cache
 
-def read_csv(file_path):
+# Make the shared modules in the project root importable when run as 'py analytics/historical_prices.py'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from har_compact import COMPACTED_DIR, COMPACTED_FILE
+from har_files import atomic_write
+from har_metrics import RunMetrics, configure_logging, run_with_profile
+from har_products import PRODUCT_INDEX_FILE, ProductIndex
+from har_records import loads, order_date_ordinal
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=None)
+def ordinal_isoformat(ordinal):
     """
-    Reads data from a single CSV file, handling different encodings.
+    Converts a date ordinal back to the ISO timestamp used in the JSON output.
+    """
+    return datetime.fromordinal(ordinal).isoformat()
+
+class PriceSeries:
+    """
+    The price observations of one item, stored column by column.
+
+    Each observation is a date ordinal plus cost, quantity and normalized cost
+    in typed arrays, which takes a few dozen bytes instead of a dict and an
+    ISO date string per observation. Observations are kept in the order they
+    were added until sorted_by_date() is called.
+    """
+
+    __slots__ = ('ordinals', 'costs', 'quantities', 'normalized_costs')
+
+    def __init__(self):
+        self.ordinals = array('l')
+        self.costs = array('d')
+        self.quantities = array('d')
+        self.normalized_costs = array('d')
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def append(self, ordinal, cost, quantity):
+        self.ordinals.append(ordinal)
+        self.costs.append(cost)
+        self.quantities.append(quantity)
+        self.normalized_costs.append(cost / quantity if quantity else 0)
+
+    def copy(self):
+        series = PriceSeries()
+        series.extend(self)
+        return series
+
+    def extend(self, other):
+        self.ordinals.extend(other.ordinals)
+        self.costs.extend(other.costs)
+        self.quantities.extend(other.quantities)
+        self.normalized_costs.extend(other.normalized_costs)
+
+    def sorted_by_date(self):
+        """
+        Returns a copy sorted by date. Observations on the same date keep their order.
+        """
+        order = sorted(range(len(self.ordinals)), key=self.ordinals.__getitem__)
+        series = PriceSeries()
+        series.ordinals = array('l', [self.ordinals[i] for i in order])
+        series.costs = array('d', [self.costs[i] for i in order])
+        series.quantities = array('d', [self.quantities[i] for i in order])
+        series.normalized_costs = array('d', [self.normalized_costs[i] for i in order])
+        return series
+
+    def to_records(self):
+        """
+        Returns the observations as the dicts written to the JSON file.
+        """
+        return [
+            {
+                "date": ordinal_isoformat(ordinal),
+                "cost": cost,
+                "quantity": quantity,
+                "normalized_cost": normalized_cost if quantity else 0
+            }
+            for ordinal, cost, quantity, normalized_cost
+            in zip(self.ordinals, self.costs, self.quantities, self.normalized_costs)
+        ]
+
+    def to_lists(self):
+        """
+        Returns the date ordinals, costs, quantities and normalized costs as plain lists, for caching.
+        """
+        return [self.ordinals.tolist(), self.costs.tolist(), self.quantities.tolist(),
+                self.normalized_costs.tolist()]
+
+    @classmethod
+    def from_lists(cls, lists):
+        # Each column is converted in one call, without going through append()
+        series = cls()
+        series.ordinals = array('l', lists[0])
+        series.costs = array('d', lists[1])
+        series.quantities = array('d', lists[2])
+        series.normalized_costs = array('d', lists[3])
+        return series
+
+def _record_name(names, item_id, ordinal, item_name):
+    # Keep the name of the item ID's latest order
+    seen = names.get(item_id)
+    if seen is None or ordinal >= seen[0]:
+        names[item_id] = (ordinal, item_name)
+
+def read_csv_series(file_path, names=None):
+    """
+    Reads a single CSV file into one PriceSeries per item.
+
+    Rows with an item ID are grouped by the ID, so a product keeps one series
+    when its name changes. Rows without one, such as those in CSVs written
+    before item IDs were recorded, are grouped by item name.
+
+    Args:
+        file_path (str): The CSV file.
+        names (dict): When given, updated with {item_id: (ordinal, item_name)}
+            for the latest order of each item ID.
+
+    Returns:
+        dict: {item_id or item_name: PriceSeries}, or None if the file could not be read.
     """
     data = {}
     try:
@@ -15,23 +144,23 @@ def read_csv(file_path):
             for row in reader:
                 try:
                     # Unpack the row, handling potential errors
-                    _, date_str, item_name, _, quantity_str, cost_str = row
+                    _, date_str, item_name, _, quantity_str, cost_str = row[:6]
+                    item_id = row[6] if len(row) > 6 else ''
                     
                     # Convert cost and quantity to float
                     cost = float(cost_str)
                     quantity = float(quantity_str)
                     
-                    # Convert date string to datetime object
-                    date_obj = datetime.strptime(date_str, "%b %d, %Y")
+                    # Convert date string to a date ordinal
+                    ordinal = order_date_ordinal(date_str)
                     
-                    if item_name not in data:
-                        data[item_name] = []
-                    data[item_name].append({
-                        "date": date_obj.isoformat(),
-                        "cost": cost,
-                        "quantity": quantity,
-                        "normalized_cost": cost / quantity if quantity else 0
-                    })
+                    key = item_id or item_name
+                    series = data.get(key)
+                    if series is None:
+                        series = data[key] = PriceSeries()
+                    series.append(ordinal, cost, quantity)
+                    if item_id and names is not None:
+                        _record_name(names, item_id, ordinal, item_name)
                 except (ValueError, IndexError) as e:
                     print(f"Skipping row due to formatting error: {row}. Error: {e}")
                     continue
@@ -43,56 +172,643 @@ def read_csv(file_path):
         return None
     return data
 
-def process_and_save_data():
+def read_order_items(order_items, names=None):
+    """
+    Groups OrderItem records into one PriceSeries per item, like read_csv_series.
+
+    This lets a pipeline that parses HAR files in the same process, such as
+    parse_walmart_har(..., sink=ListSink()), skip writing and re-reading a CSV.
+
+    Args:
+        order_items (iterable): OrderItem records.
+        names (dict): When given, updated with the latest name of each item ID.
+
+    Returns:
+        dict: {item_id or item_name: PriceSeries}.
+    """
+    data = {}
+    for order_item in order_items:
+        try:
+            ordinal = order_date_ordinal(order_item.order_date)
+            cost = float(order_item.price)
+            quantity = float(order_item.quantity)
+        except ValueError as e:
+            print(f"Skipping item due to formatting error: {order_item}. Error: {e}")
+            continue
+        key = order_item.item_id or order_item.item_name
+        series = data.get(key)
+        if series is None:
+            series = data[key] = PriceSeries()
+        series.append(ordinal, cost, quantity)
+        if order_item.item_id and names is not None:
+            _record_name(names, order_item.item_id, ordinal, order_item.item_name)
+    return data
+
+def read_csv(file_path):
+    """
+    Reads data from a single CSV file, handling different encodings.
+    """
+    names = {}
+    data = read_csv_series(file_path, names)
+    if data is None:
+        return None
+    data = group_by_product(data, names)
+    return {item_name: series.to_records() for item_name, series in data.items()}
+
+CACHE_PREFIX = '.historical_prices_cache.'
+CACHE_VERSION = 5
+
+def aggregation_cache_path(analytics_dir, source):
+    """
+    Returns the aggregation cache file of a source, either the output
+    directory or a single CSV, so each source keeps a cache of its own.
+    """
+    key = zlib.crc32(os.path.abspath(source).encode('utf-8'))
+    return os.path.join(analytics_dir, f"{CACHE_PREFIX}{key:08x}.json")
+
+class AggregationCache:
+    """
+    The parsed series of each CSV file of one source, kept between runs.
+
+    Each file's series and item ID names are kept with the size and mtime the
+    file had when it was read, so only new and changed files are read again,
+    wherever they sort. It also holds a key for the outputs last written from
+    the files (see process_and_save_data). The series are loaded a whole
+    column at a time.
+
+    Args:
+        cache_path (str): The JSON file the cache is kept in.
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        # {file_path: [size, mtime_ns, {item: PriceSeries}, {item_id: (ordinal, name)}]}
+        self.files = {}
+        self.output_key = None
+        # Whether the files or outputs differ from the saved cache
+        self.changed = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, 'rb') as f:
+                data = loads(f.read())
+        except (OSError, ValueError):
+            return
+        if data.get('version') != CACHE_VERSION:
+            return
+        for file_path, (size, mtime_ns, series, names) in data['files'].items():
+            self.files[file_path] = [
+                size, mtime_ns,
+                {item: PriceSeries.from_lists(lists) for item, lists in series.items()},
+                {item_id: tuple(name) for item_id, name in names.items()},
+            ]
+        self.output_key = data['output_key']
+
+    def get(self, file_path, stat):
+        """
+        Returns:
+            tuple: The cached series and names of a file, or None if it isn't
+                cached or has changed since.
+        """
+        cached = self.files.get(file_path)
+        if cached is None or cached[:2] != [stat.st_size, stat.st_mtime_ns]:
+            return None
+        return cached[2], cached[3]
+
+    def put(self, file_path, stat, series, names):
+        self.files[file_path] = [stat.st_size, stat.st_mtime_ns, series, names]
+        self.changed = True
+
+    def keep_only(self, file_paths):
+        """
+        Forgets the files that are no longer read.
+        """
+        for file_path in set(self.files) - set(file_paths):
+            del self.files[file_path]
+            self.changed = True
+
+    def save(self):
+        """
+        Writes the cache, if it changed.
+        """
+        if not self.changed:
+            return
+        files = {file_path: [size, mtime_ns, {item: series.to_lists() for item, series in file_series.items()},
+                             file_names]
+                 for file_path, (size, mtime_ns, file_series, file_names) in self.files.items()}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            with atomic_write(self.cache_path) as f:
+                json.dump({'version': CACHE_VERSION, 'files': files, 'output_key': self.output_key}, f,
+                          separators=(',', ':'))
+            self.changed = False
+        except OSError as e:
+            print(f"Warning: Could not save the aggregation cache '{self.cache_path}'. Error: {e}")
+
+def _file_signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def read_csv_files(output_dir, csv_files, cache=None, metrics=None, names=None):
+    """
+    Reads and merges several CSV files, using the cached series of the files that haven't changed.
+
+    The series of every file are merged in the order of `csv_files`, so the
+    result is the same as reading every file again.
+
+    Args:
+        output_dir (str): The directory holding the CSV files.
+        csv_files (list): The CSV file names, in the order to merge them.
+        cache (AggregationCache): The cache of these files, updated with the
+            files that were read. The caller saves it. None reads every file.
+        metrics (RunMetrics): Records the time spent reading CSV files and
+            merging, and counts the files read, cached and failed and the rows
+            read.
+        names (dict): When given, updated with the latest name of each item ID
+            (see read_csv_series).
+
+    Returns:
+        dict: The merged {item_id or item_name: PriceSeries} data.
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    all_prices = {}
+    # The merged series that are copies, so the cached ones are never extended
+    copied = set()
+    file_paths = []
+    for file_name in csv_files:
+        file_path = os.path.join(output_dir, file_name)
+        file_paths.append(file_path)
+        stat = os.stat(file_path)
+        cached = cache.get(file_path, stat) if cache is not None else None
+        if cached is not None:
+            metrics.count('csv_files_cached')
+            file_data, file_names = cached
+        else:
+            file_names = {}
+            with metrics.timer('read_csv'):
+                file_data = read_csv_series(file_path, file_names)
+            if file_data is None:
+                metrics.count('csv_files_failed')
+                continue
+            metrics.count('csv_files_read')
+            if cache is not None:
+                cache.put(file_path, stat, file_data, file_names)
+
+        with metrics.timer('merge'):
+            if names is not None:
+                for item_id, (ordinal, item_name) in file_names.items():
+                    _record_name(names, item_id, ordinal, item_name)
+            for item, series in file_data.items():
+                merged = all_prices.get(item)
+                if merged is None:
+                    all_prices[item] = series
+                    continue
+                if item not in copied:
+                    merged = all_prices[item] = merged.copy()
+                    copied.add(item)
+                merged.extend(series)
+    if cache is not None:
+        cache.keep_only(file_paths)
+    metrics.count('rows_read', sum(len(series) for series in all_prices.values()))
+    return all_prices
+
+def read_sqlite(db_path, item_name=None, names=None):
+    """
+    Reads price observations from the SQLite database written by har_parser.py.
+
+    Like read_csv_series, line items with an item ID are grouped by the ID.
+
+    Args:
+        db_path (str): The path to the database.
+        item_name (str): Only read this item's history, using the item name index.
+        names (dict): When given, updated with the latest name of each item ID
+            (see read_csv_series).
+
+    Returns:
+        dict: {item_id or item_name: PriceSeries}, with each item's observations
+            in date order, or None if the database is missing.
+    """
+    if not os.path.exists(db_path):
+        print(f"Error: The database was not found at '{db_path}'")
+        return None
+
+    data = {}
+    connection = sqlite3.connect(db_path)
+    try:
+        # Databases written before item IDs were recorded don't have the column
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(line_items)")]
+        item_id_column = "line_items.item_id" if 'item_id' in columns else "''"
+        query = (
+            f"SELECT {item_id_column}, line_items.item_name, orders.order_day, line_items.price, line_items.quantity "
+            "FROM line_items JOIN orders ON orders.order_id = line_items.order_id"
+        )
+        params = ()
+        if item_name is not None:
+            query += " WHERE line_items.item_name = ?"
+            params = (item_name,)
+        query += " ORDER BY line_items.item_name, orders.order_day"
+
+        ordinals = {}
+        for item_id, item, order_day, cost, quantity in connection.execute(query, params):
+            ordinal = ordinals.get(order_day)
+            if ordinal is None:
+                ordinal = ordinals[order_day] = datetime.fromisoformat(order_day).toordinal()
+            key = item_id or item
+            series = data.get(key)
+            if series is None:
+                series = data[key] = PriceSeries()
+            series.append(ordinal, cost, quantity)
+            if item_id and names is not None:
+                _record_name(names, item_id, ordinal, item)
+    except sqlite3.Error as e:
+        print(f"Error: Could not read from database '{db_path}'. Error: {e}")
+        return None
+    finally:
+        connection.close()
+    return data
+
+def group_by_product(all_prices, names, product_index=None):
+    """
+    Combines the series read by item ID and by item name into one per product.
+
+    A series keyed by item ID is named after the product's canonical name in
+    the product index, or after the name on its latest order if the index
+    doesn't know the ID. A series keyed by item name joins the product that
+    has been sold under that name, if any. Series that end up with the same
+    name are merged.
+
+    Args:
+        all_prices (dict): {item_id or item_name: PriceSeries}.
+        names (dict): {item_id: (ordinal, item_name)}, as filled in by read_csv_series.
+        product_index (ProductIndex): The index written by har_parser.py, or None.
+
+    Returns:
+        dict: {item_name: PriceSeries}.
+    """
+    if not names and not (product_index and product_index.products):
+        return all_prices
+
+    ids_by_name = product_index.ids_by_name() if product_index else {}
+    products = {}
+    copied = set()
+    for key, series in all_prices.items():
+        item_id = key if key in names else ids_by_name.get(key)
+        item_name = product_index.canonical_name(item_id) if product_index and item_id else None
+        if item_name is None:
+            item_name = names[key][1] if key in names else key
+        merged = products.get(item_name)
+        if merged is None:
+            products[item_name] = series
+            continue
+        if item_name not in copied:
+            # Merge into a copy, so the series passed in (and cached) are left as they were
+            merged = products[item_name] = merged.copy()
+            copied.add(item_name)
+        merged.extend(series)
+    return products
+
+RANKING_METRICS = ('absolute_change', 'percent_change', 'unit_change', 'volatility', 'slope')
+
+def series_stats(series):
+    """
+    Computes the price-change statistics of one item in a single pass.
+
+    The series does not need to be sorted: the first and last observations are
+    the earliest and latest by date, taking the first and last of any that
+    share a date, which matches what a stable sort by date would put at the ends.
+
+    Args:
+        series (PriceSeries): The item's observations.
+
+    Returns:
+        dict: 'count', 'first_date', 'last_date', 'first_cost', 'last_cost',
+            'first_unit_cost', 'last_unit_cost' (normalized costs) and every metric
+            in RANKING_METRICS:
+            absolute_change (last cost - first cost), percent_change (of the cost),
+            unit_change (last - first normalized cost), volatility (population
+            standard deviation of the normalized cost) and slope (least-squares
+            change in normalized cost per day).
+    """
+    ordinals = series.ordinals
+    base_ordinal = ordinals[0]
+    first_ordinal = last_ordinal = base_ordinal
+    first = last = 0
+    mean = m2 = 0.0
+    sum_x = sum_xx = sum_y = sum_xy = 0.0
+
+    for index, (ordinal, y) in enumerate(zip(ordinals, series.normalized_costs)):
+        if ordinal < first_ordinal:
+            first_ordinal, first = ordinal, index
+        if ordinal >= last_ordinal:
+            last_ordinal, last = ordinal, index
+
+        # Welford's running mean and variance
+        delta = y - mean
+        mean += delta / (index + 1)
+        m2 += delta * (y - mean)
+
+        x = ordinal - base_ordinal
+        sum_x += x
+        sum_xx += x * x
+        sum_y += y
+        sum_xy += x * y
+
+    count = len(ordinals)
+    first_cost = series.costs[first]
+    last_cost = series.costs[last]
+    first_unit_cost = series.normalized_costs[first]
+    last_unit_cost = series.normalized_costs[last]
+    x_variance = count * sum_xx - sum_x * sum_x
+    return {
+        'count': count,
+        'first_date': ordinal_isoformat(first_ordinal),
+        'last_date': ordinal_isoformat(last_ordinal),
+        'first_cost': first_cost,
+        'last_cost': last_cost,
+        'first_unit_cost': first_unit_cost,
+        'last_unit_cost': last_unit_cost,
+        'absolute_change': last_cost - first_cost,
+        'percent_change': (last_cost - first_cost) / first_cost * 100 if first_cost else 0.0,
+        'unit_change': last_unit_cost - first_unit_cost,
+        'volatility': math.sqrt(m2 / count) if count else 0.0,
+        'slope': (count * sum_xy - sum_x * sum_y) / x_variance if x_variance else 0.0,
+    }
+
+def rank_items(all_prices, metric='absolute_change', limit=None, min_points=2):
+    """
+    Ranks items by the magnitude of a price-change metric.
+
+    Args:
+        all_prices (dict): {item_name: PriceSeries}.
+        metric (str): One of RANKING_METRICS.
+        limit (int): Only return the top `limit` items. They are picked with a
+            heap, which gives the same result as sorting and slicing.
+        min_points (int): Skip items with fewer observations than this.
+
+    Returns:
+        list: (item_name, stats) pairs, biggest movers first. Items with equal
+            scores keep their order in all_prices.
+    """
+    if metric not in RANKING_METRICS:
+        raise ValueError(f"Unknown ranking metric '{metric}'. Choose from: {', '.join(RANKING_METRICS)}")
+
+    ranked = ((item, series_stats(series)) for item, series in all_prices.items() if len(series) >= min_points)
+    key = lambda pair: abs(pair[1][metric])
+    if limit is not None:
+        return heapq.nlargest(limit, ranked, key=key)
+    return sorted(ranked, key=key, reverse=True)
+
+def write_price_json(f, items):
+    """
+    Writes {item_name: [observation, ...]} JSON one item at a time.
+
+    The output is the same as json.dump(..., indent=4) of the whole dict, but
+    only one item's observations are turned into dicts at any moment.
+
+    Args:
+        f: A text file open for writing.
+        items (iterable): (item_name, PriceSeries) pairs in output order.
+    """
+    first = True
+    for item, series in items:
+        records = json.dumps(series.to_records(), indent=4).replace('\n', '\n    ')
+        f.write('{\n    ' if first else ',\n    ')
+        f.write(f"{json.dumps(item)}: {records}")
+        first = False
+    f.write('{}' if first else '\n}')
+
+DASHBOARD_DATA_DIR = 'data'
+INDEX_FILE = 'index.json'
+SHARD_DIR = 'shards'
+ITEMS_PER_SHARD = 64
+INDEX_FIELDS = ('name', 'rank', 'shard', 'count', 'first_unit_cost', 'last_unit_cost', 'first_cost', 'last_cost',
+                'first_date', 'last_date') + RANKING_METRICS
+
+def write_compact_json(file_path, data):
+    """
+    Writes JSON without whitespace, plus a precompressed '.gz' copy next to it.
+    """
+    payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    for path, content in ((file_path, payload), (file_path + '.gz', gzip.compress(payload, mtime=0))):
+        with atomic_write(path, 'wb') as f:
+            f.write(content)
+
+def write_dashboard_data(data_dir, ranked_items, all_prices, metric):
+    """
+    Writes the dashboard's startup index and the per-bucket series shards.
+
+    The index lists every ranked item with its summary stats, every ranking
+    metric and the shard its series lives in, so the dashboard can draw the
+    item list, the summary table and pick the movers without loading any
+    history. Items are spread over
+    shards by a hash of their name, and each shard holds the date-sorted series
+    of its items in the same shape as historical_prices_data.json.
+
+    Each call writes its shards to a new generation directory under 'shards/',
+    which the index names as 'shard_dir'. The index is replaced once they are
+    all written and the older generations are removed after that, so the
+    index never names shards that are missing or from another run.
+
+    Args:
+        data_dir (str): The directory to write 'index.json' and 'shards/' into.
+        ranked_items (list): (item_name, stats) pairs from rank_items().
+        all_prices (dict): {item_name: PriceSeries}.
+        metric (str): The metric the items were ranked by.
+    """
+    generation = f"{time.time_ns():x}"
+    shard_root = os.path.join(data_dir, SHARD_DIR)
+    shard_dir = os.path.join(shard_root, generation)
+    os.makedirs(shard_dir)
+
+    shard_count = max(1, math.ceil(len(ranked_items) / ITEMS_PER_SHARD))
+    shards = {}
+    index_items = []
+    for rank, (item, stats) in enumerate(ranked_items, start=1):
+        shard = zlib.crc32(item.encode('utf-8')) % shard_count
+        shards.setdefault(shard, {})[item] = all_prices[item].sorted_by_date().to_records()
+        index_items.append([item, rank, shard] + [stats[field] for field in INDEX_FIELDS[3:]])
+
+    for shard, shard_data in shards.items():
+        write_compact_json(os.path.join(shard_dir, f"{shard}.json"), shard_data)
+
+    # The index goes last, so it never refers to shards that aren't written yet
+    write_compact_json(os.path.join(data_dir, INDEX_FILE), {
+        'metric': metric,
+        'shard_dir': f"{SHARD_DIR}/{generation}",
+        'shard_count': shard_count,
+        'fields': INDEX_FIELDS,
+        'items': index_items,
+    })
+
+    # Nothing refers to the older generations now; a page that loaded an older
+    # index fetches the new one when one of its shards is gone
+    for file_name in os.listdir(shard_root):
+        if file_name == generation:
+            continue
+        file_path = os.path.join(shard_root, file_name)
+        if os.path.isdir(file_path):
+            shutil.rmtree(file_path, ignore_errors=True)
+        else:
+            os.remove(file_path)
+
+def process_and_save_data(db_path=None, use_cache=True, metric='absolute_change', top=None, output_dir=None,
+                          analytics_dir=None, metrics=None, csv_path=None, order_items=None):
     """
     Combines data from all CSV files in the 'output' directory,
     sorts it by price change, and saves it to a single JSON file.
+
+    Items are aggregated by their Walmart item ID using the product index
+    next to the CSV files or database (see group_by_product), so a renamed
+    product keeps a single history under its current name.
+
+    Args:
+        db_path (str): Read the line items from this SQLite database (as written
+            by har_parser.py --format sqlite) instead of the CSV files.
+        use_cache (bool): Only read the CSV files that are new or changed since
+            the last run (see AggregationCache). If no files changed and the
+            outputs were written with the same options, they are left as they are.
+        metric (str): The price-change metric to rank items by, see RANKING_METRICS.
+        top (int): Only save the `top` biggest movers instead of every item.
+        output_dir (str): Read the CSV files from this directory instead of 'output'.
+        analytics_dir (str): Write the JSON, the cache and the dashboard data to
+            this directory instead of 'analytics'.
+        metrics (RunMetrics): Records the time spent reading, ranking and
+            writing, and counts the files, rows and items processed.
+        csv_path (str): Read this single CSV, such as the deduplicated file
+            written by har_compact.py, instead of every CSV in the output directory.
+        order_items (iterable): Use these OrderItem records, such as the ones
+            collected by a ListSink, instead of reading any files.
     """
+    if metrics is None:
+        metrics = RunMetrics()
     base_dir = os.path.dirname(os.path.dirname(__file__))
-    output_dir = os.path.join(base_dir, 'output')
-    analytics_dir = os.path.join(base_dir, 'analytics')
+    output_dir = output_dir or os.path.join(base_dir, 'output')
+    analytics_dir = analytics_dir or os.path.join(base_dir, 'analytics')
     
     all_prices = {}
-    
-    if not os.path.exists(output_dir):
-        print(f"Error: The directory '{output_dir}' was not found.")
-        return
+    names = {}
+    cache = None
 
-    csv_files = [f for f in os.listdir(output_dir) if f.endswith('.csv')]
-    if not csv_files:
-        print("No CSV files found in the 'output' directory.")
-        return
+    if db_path is not None:
+        with metrics.timer('read_sqlite'):
+            all_prices = read_sqlite(db_path, names=names)
+        if all_prices is None:
+            return
+        metrics.count('rows_read', sum(len(series) for series in all_prices.values()))
+        index_dir = os.path.dirname(db_path)
+    elif order_items is not None:
+        with metrics.timer('read_items'):
+            all_prices = read_order_items(order_items, names)
+        metrics.count('rows_read', sum(len(series) for series in all_prices.values()))
+        index_dir = output_dir
+    elif csv_path is not None:
+        if not os.path.exists(csv_path):
+            print(f"Error: The file was not found at '{csv_path}'")
+            return
+        if use_cache:
+            with metrics.timer('read_cache'):
+                cache = AggregationCache(aggregation_cache_path(analytics_dir, csv_path))
+        all_prices = read_csv_files(os.path.dirname(csv_path), [os.path.basename(csv_path)], cache, metrics, names)
+        index_dir = output_dir
+    else:
+        if not os.path.exists(output_dir):
+            print(f"Error: The directory '{output_dir}' was not found.")
+            return
 
-    for file_name in csv_files:
-        file_path = os.path.join(output_dir, file_name)
-        file_data = read_csv(file_path)
-        if file_data:
-            for item, prices in file_data.items():
-                if item not in all_prices:
-                    all_prices[item] = []
-                all_prices[item].extend(prices)
+        csv_files = sorted(f for f in os.listdir(output_dir) if f.endswith('.csv'))
+        if not csv_files:
+            print("No CSV files found in the 'output' directory.")
+            return
 
-    # Filter out items with only one data point
-    filtered_prices = {item: prices for item, prices in all_prices.items() if len(prices) > 1}
+        if use_cache:
+            with metrics.timer('read_cache'):
+                cache = AggregationCache(aggregation_cache_path(analytics_dir, output_dir))
+        all_prices = read_csv_files(output_dir, csv_files, cache, metrics, names)
+        index_dir = output_dir
 
-    # Sort the data for each item by date
-    for item, prices in filtered_prices.items():
-        filtered_prices[item] = sorted(prices, key=lambda x: x['date'])
+    output_file_path = os.path.join(analytics_dir, 'historical_prices_data.json')
+    data_dir = os.path.join(analytics_dir, DASHBOARD_DATA_DIR)
+    index_path = os.path.join(data_dir, INDEX_FILE)
+    product_index_path = os.path.join(index_dir, PRODUCT_INDEX_FILE)
+    # The outputs are shared by every source, so they are only up to date if
+    # they are still the files this source last wrote
+    options = [metric, top, _file_signature(product_index_path)]
+    if (cache is not None and not cache.changed
+            and cache.output_key == options + [_file_signature(output_file_path), _file_signature(index_path)]):
+        logger.info("No CSV files changed since the last run; '%s' is up to date.", output_file_path)
+        return
 
-    # Sort the items themselves based on the biggest price change
-    sorted_items = sorted(filtered_prices.keys(), key=lambda item: abs(filtered_prices[item][-1]['cost'] - filtered_prices[item][0]['cost']), reverse=True)
+    with metrics.timer('group_products'):
+        series_count = len(all_prices)
+        product_index = ProductIndex(product_index_path)
+        all_prices = group_by_product(all_prices, names, product_index)
+    if len(all_prices) < series_count:
+        metrics.count('series_merged', series_count - len(all_prices))
+
+    # Rank the items with more than one data point by the biggest price change
+    with metrics.timer('rank'):
+        ranked_items = rank_items(all_prices, metric, limit=top)
+    metrics.count('items', len(all_prices))
+    metrics.count('items_ranked', len(ranked_items))
 
-    # Create the final sorted dictionary
-    final_data = {item: filtered_prices[item] for item in sorted_items}
-    
     # Save the organized data to a JSON file in the analytics directory
-    output_file_path = os.path.join(analytics_dir, 'historical_prices_data.json')
+    written = False
     try:
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-            json.dump(final_data, f, indent=4)
-        print(f"Data successfully saved to JSON at '{output_file_path}'")
+        with metrics.timer('write_json'), open(output_file_path, 'w', encoding='utf-8') as f:
+            # Only the items being saved need their data sorted by date
+            write_price_json(f, ((item, all_prices[item].sorted_by_date()) for item, _ in ranked_items))
+        logger.info("Data successfully saved to JSON at '%s'", output_file_path)
     except Exception as e:
         print(f"Error saving JSON file: {e}")
+    else:
+        # Save the index and shards the dashboard loads on demand
+        try:
+            with metrics.timer('write_dashboard'):
+                write_dashboard_data(data_dir, ranked_items, all_prices, metric)
+            logger.info("Dashboard index and shards saved to '%s'", data_dir)
+            written = True
+        except OSError as e:
+            print(f"Error saving dashboard data: {e}")
+
+    if cache is not None:
+        # Only a run whose outputs were all written can be skipped next time
+        cache.output_key = (options + [_file_signature(output_file_path), _file_signature(index_path)]
+                            if written else None)
+        cache.changed = True
+        with metrics.timer('save_cache'):
+            cache.save()
 
 if __name__ == "__main__":
-    process_and_save_data()
+    arg_parser = argparse.ArgumentParser(description="Aggregate order CSVs into price history JSON for the dashboard.")
+    arg_parser.add_argument('--sqlite', nargs='?', const=os.path.join('output', 'walmart_orders.db'), default=None,
+                            metavar='DB_PATH', help="Read from the SQLite database written by har_parser.py "
+                                                    "--format sqlite (default path: output/walmart_orders.db).")
+    arg_parser.add_argument('--compacted', nargs='?', const=os.path.join('output', COMPACTED_DIR, COMPACTED_FILE),
+                            default=None, metavar='CSV_PATH',
+                            help="Read the deduplicated CSV written by har_compact.py instead of the output "
+                                 f"directory (default path: output/{COMPACTED_DIR}/{COMPACTED_FILE}).")
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help="Re-read every CSV file instead of only the ones that changed.")
+    arg_parser.add_argument('--metric', choices=RANKING_METRICS, default='absolute_change',
+                            help="The price-change metric to rank items by (default: absolute_change).")
+    arg_parser.add_argument('--top', type=int, default=None,
+                            help="Only save the N biggest movers instead of every item.")
+    arg_parser.add_argument('--profile', metavar='PATH',
+                            help="Save per-stage timings and counters for the run to this JSON file.")
+    arg_parser.add_argument('--cprofile', action='store_true',
+                            help="With --profile, also run under cProfile and save the stats next to the JSON.")
+    args = arg_parser.parse_args()
+    configure_logging()
+
+    metrics = RunMetrics()
+    run = lambda: process_and_save_data(db_path=args.sqlite, use_cache=not args.no_cache, metric=args.metric,
+                                        top=args.top, metrics=metrics, csv_path=args.compacted)
+    if args.profile:
+        run_with_profile(run, metrics, args.profile, use_cprofile=args.cprofile)
+    else:
+        run()
@@ -0,0 +1,420 @@
+import argparse
+import asyncio
+import gzip
+import heapq
+import json
+import logging
+import os
+import zlib
+from collections import OrderedDict
+from datetime import date
+from email.utils import formatdate
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from analytics.historical_prices import DASHBOARD_DATA_DIR, INDEX_FILE, RANKING_METRICS
+from analytics.spend_rollups import PERIODS, SPEND_FILE, period_key
+from har_metrics import configure_logging
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_FILES = {'/graph.html': 'graph.html'}
+CONTENT_TYPES = {'.html': 'text/html; charset=utf-8', '.json': 'application/json'}
+# Responses smaller than this aren't worth compressing
+MIN_GZIP_SIZE = 1024
+RESPONSE_CACHE_SIZE = 512
+MAX_HEADER_LINES = 100
+# Request bodies are never used, and are read and dropped in chunks of this size
+BODY_CHUNK_SIZE = 65536
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           414: 'URI Too Long', 431: 'Request Header Fields Too Large', 503: 'Service Unavailable'}
+
+class PriceData:
+    """
+    The dashboard data written by historical_prices.py and spend_rollups.py,
+    loaded into memory.
+
+    Holds the index stats of every item, the series from every shard and the
+    spend rollups, and is replaced as a whole when either script writes new
+    data, so a request always sees one consistent version. Either part may be
+    missing until its script has run.
+
+    Args:
+        data_dir (str): The directory holding 'index.json', the shards it names and 'spend.json'.
+    """
+
+    def __init__(self, data_dir):
+        self.metric = None
+        self.items = OrderedDict()
+        self.series = {}
+        index_path = os.path.join(data_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            self.metric = index['metric']
+            for row in index['items']:
+                stats = dict(zip(index['fields'], row))
+                self.items[stats['name']] = stats
+
+            shard_dir = os.path.join(data_dir, *index['shard_dir'].split('/'))
+            for shard in {stats['shard'] for stats in self.items.values()}:
+                with open(os.path.join(shard_dir, f"{shard}.json"), 'r', encoding='utf-8') as f:
+                    self.series.update(json.load(f))
+        self.lowercase_names = [(name.lower(), name) for name in self.items]
+
+        self.spend = {period: [] for period in PERIODS}
+        spend_path = os.path.join(data_dir, SPEND_FILE)
+        if os.path.exists(spend_path):
+            with open(spend_path, 'r', encoding='utf-8') as f:
+                spend = json.load(f)
+            for period in PERIODS:
+                self.spend[period] = [dict(zip(spend['fields'], row)) for row in spend[period]]
+
+    def search(self, query, limit):
+        query = query.lower()
+        matches = (name for lowercase_name, name in self.lowercase_names if query in lowercase_name)
+        return [self.items[name] for _, name in zip(range(limit), matches)]
+
+    def item(self, name):
+        if name not in self.series:
+            raise HttpError(404, f"Unknown item '{name}'")
+        return {'stats': self.items[name], 'series': self.series[name]}
+
+    def top(self, metric, limit):
+        if metric not in RANKING_METRICS:
+            raise HttpError(400, f"Unknown metric '{metric}'. Choose from: {', '.join(RANKING_METRICS)}")
+        return heapq.nlargest(limit, self.items.values(), key=lambda stats: abs(stats[metric]))
+
+    def date_range(self, start, end, names, limit):
+        # ISO dates compare correctly as strings; 'end' covers the whole end day
+        start = start or ''
+        end = (end + 'T99') if end else '￿'
+        names = names or self.items
+        result = {}
+        for name in names:
+            if name not in self.series:
+                raise HttpError(404, f"Unknown item '{name}'")
+            observations = [p for p in self.series[name] if start <= p['date'] <= end]
+            if observations:
+                result[name] = observations
+                if len(result) >= limit:
+                    break
+        return result
+
+    def spend_buckets(self, period, category, start, end):
+        if period not in PERIODS:
+            raise HttpError(400, f"Unknown period '{period}'. Choose from: {', '.join(PERIODS)}")
+        try:
+            start_key = period_key(period, date.fromisoformat(start)) if start else ''
+            end_key = period_key(period, date.fromisoformat(end)) if end else None
+        except ValueError:
+            raise HttpError(400, "'start' and 'end' must be ISO dates")
+        return [bucket for bucket in self.spend[period]
+                if start_key <= bucket['period'] and (end_key is None or bucket['period'] <= end_key)
+                and (category is None or bucket['category'] == category)]
+
+class DashboardServer:
+    """
+    Serves graph.html, the data files and query endpoints with asyncio.
+
+    Endpoints (all GET):
+        /api/search?q=...&limit=N           Items whose name contains q, with stats.
+        /api/item?name=...                  One item's stats and price series.
+        /api/top?metric=...&n=N             The N biggest movers by a ranking metric.
+        /api/range?start=...&end=...&name=  Observations between two ISO dates,
+                                            for the named items or all of them.
+        /api/spend?period=month&category=   Spend, quantity and distinct items per
+            &start=...&end=...              week or month and category, from the
+                                            spend rollups.
+
+    Responses are gzip-compressed when the client accepts it, carry an ETag and
+    answer a matching If-None-Match with 304. The data is reloaded in a worker
+    thread whenever historical_prices.py or spend_rollups.py writes new data,
+    without blocking requests in progress.
+
+    Args:
+        analytics_dir (str): The directory holding graph.html and 'data/'.
+        reload_interval (float): Seconds between checks for new data.
+    """
+
+    def __init__(self, analytics_dir=ANALYTICS_DIR, reload_interval=2.0):
+        self.analytics_dir = analytics_dir
+        self.data_dir = os.path.join(analytics_dir, DASHBOARD_DATA_DIR)
+        self.reload_interval = reload_interval
+        self.data = None
+        self.version = None
+        self._responses = OrderedDict()
+
+    def _index_version(self):
+        versions = []
+        for file_name in (INDEX_FILE, SPEND_FILE):
+            try:
+                stat = os.stat(os.path.join(self.data_dir, file_name))
+            except FileNotFoundError:
+                versions.append('')
+                continue
+            versions.append(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+        return '-'.join(versions) if any(versions) else None
+
+    async def reload_if_changed(self):
+        """
+        Loads the data again if the index or spend file changed since it was last loaded.
+        """
+        version = self._index_version()
+        if version is None or version == self.version:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(None, PriceData, self.data_dir)
+        except (OSError, ValueError, KeyError) as e:
+            # historical_prices.py may still be writing; try again on the next check
+            print(f"Warning: Could not load the dashboard data. Error: {e}")
+            return
+        self.data, self.version = data, version
+        self._responses.clear()
+        logger.info("Loaded dashboard data for %d items.", len(data.items))
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload_if_changed()
+
+    def _api_response(self, path, query):
+        if self.data is None:
+            raise HttpError(503, "No dashboard data yet. Run analytics/historical_prices.py first.")
+        params = parse_qs(query)
+        get = lambda key, default=None: params.get(key, [default])[0]
+        try:
+            limit = int(get('limit', get('n', 50)))
+        except ValueError:
+            raise HttpError(400, "'limit' and 'n' must be integers")
+
+        if path == '/api/search':
+            return self.data.search(get('q', ''), limit)
+        if path == '/api/item':
+            if get('name') is None:
+                raise HttpError(400, "Missing 'name'")
+            return self.data.item(get('name'))
+        if path == '/api/top':
+            return self.data.top(get('metric', self.data.metric), limit)
+        if path == '/api/range':
+            return self.data.date_range(get('start'), get('end'), params.get('name'), limit)
+        if path == '/api/spend':
+            return self.data.spend_buckets(get('period', 'month'), get('category'), get('start'), get('end'))
+        raise HttpError(404, f"Unknown endpoint '{path}'")
+
+    def _cached_api_response(self, path, query):
+        """
+        Returns the encoded body and ETag of an API response, computing it at
+        most once per data version.
+        """
+        key = (self.version, path, query)
+        cached = self._responses.get(key)
+        if cached is None:
+            body = json.dumps(self._api_response(path, query), separators=(',', ':')).encode('utf-8')
+            cached = (body, gzip.compress(body) if len(body) >= MIN_GZIP_SIZE else None,
+                      f'"{self.version}-{zlib.crc32(body):08x}"')
+            self._responses[key] = cached
+            if len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+        else:
+            self._responses.move_to_end(key)
+        return cached
+
+    def _static_file(self, path):
+        """
+        Resolves a request path to graph.html or a file under 'data/'.
+
+        Returns:
+            tuple: The file's path and the path of its '.gz' sibling, if it has one.
+        """
+        if path in ('/', '/index.html'):
+            path = '/graph.html'
+        if path in STATIC_FILES:
+            file_path = os.path.join(self.analytics_dir, STATIC_FILES[path])
+        elif path.startswith('/data/'):
+            data_dir = os.path.realpath(self.data_dir)
+            file_path = os.path.realpath(os.path.join(data_dir, path[len('/data/'):]))
+            if not file_path.startswith(data_dir + os.sep):
+                raise HttpError(404, "Not found")
+        else:
+            raise HttpError(404, "Not found")
+        if not os.path.isfile(file_path):
+            raise HttpError(404, "Not found")
+        gzip_path = file_path + '.gz'
+        return file_path, gzip_path if os.path.isfile(gzip_path) else None
+
+    def _respond(self, method, target, headers):
+        """
+        Builds the response to one request.
+
+        Returns:
+            tuple: The status, a dict of response headers and the body.
+        """
+        if method not in ('GET', 'HEAD'):
+            raise HttpError(405, "Only GET and HEAD are supported")
+        url = urlsplit(target)
+        path = unquote(url.path)
+        accepts_gzip = 'gzip' in headers.get('accept-encoding', '')
+
+        if path.startswith('/api/'):
+            body, gzip_body, etag = self._cached_api_response(path, url.query)
+            content_type = CONTENT_TYPES['.json']
+        else:
+            file_path, gzip_path = self._static_file(path)
+            stat = os.stat(file_path)
+            etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+            content_type = CONTENT_TYPES.get(os.path.splitext(file_path)[1], 'application/octet-stream')
+            if headers.get('if-none-match') == etag:
+                body = gzip_body = None
+            else:
+                with open(file_path, 'rb') as f:
+                    body = f.read()
+                gzip_body = None
+                if accepts_gzip and gzip_path:
+                    with open(gzip_path, 'rb') as f:
+                        gzip_body = f.read()
+                elif accepts_gzip and len(body) >= MIN_GZIP_SIZE:
+                    gzip_body = gzip.compress(body)
+
+        response_headers = {
+            'Content-Type': content_type,
+            'ETag': etag,
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+        }
+        if headers.get('if-none-match') == etag:
+            return 304, response_headers, b''
+        if accepts_gzip and gzip_body is not None:
+            response_headers['Content-Encoding'] = 'gzip'
+            body = gzip_body
+        return 200, response_headers, body
+
+    async def _read_request(self, reader):
+        """
+        Reads the request line and headers of the next request, and skips its body.
+
+        Returns:
+            tuple: The method, target, HTTP version and a dict of lowercased
+                header names to values, or None if the client closed the
+                connection or sent something that isn't a request.
+
+        Raises:
+            HttpError: If the request line or headers are too long or the
+                Content-Length is invalid. The connection can't be read any
+                further after that.
+        """
+        try:
+            request_line = await reader.readline()
+        except ValueError:
+            # asyncio raises it for a line longer than the stream's limit (64 KiB)
+            raise HttpError(414, "The request line is too long")
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            return None
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            try:
+                line = await reader.readline()
+            except ValueError:
+                raise HttpError(431, "A request header is too long")
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HttpError(431, f"More than {MAX_HEADER_LINES - 1} request headers")
+
+        # Skip the body, so the next request on the connection is read from after it
+        try:
+            remaining = int(headers.get('content-length') or 0)
+        except ValueError:
+            remaining = -1
+        if remaining < 0:
+            raise HttpError(400, "Invalid Content-Length")
+        while remaining:
+            remaining -= len(await reader.readexactly(min(remaining, BODY_CHUNK_SIZE)))
+        return method, target, version, headers
+
+    def _write_response(self, writer, method, status, response_headers, body, keep_alive):
+        response_headers['Content-Length'] = str(len(body))
+        response_headers['Date'] = formatdate(usegmt=True)
+        response_headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        head += ''.join(f"{name}: {value}\r\n" for name, value in response_headers.items())
+        writer.write(head.encode('latin-1') + b'\r\n')
+        if method != 'HEAD':
+            writer.write(body)
+
+    @staticmethod
+    def _error_response(error):
+        body = json.dumps({'error': error.message}).encode('utf-8')
+        return error.status, {'Content-Type': CONTENT_TYPES['.json']}, body
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves requests on one connection until the client closes it.
+        """
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as e:
+                    self._write_response(writer, 'GET', *self._error_response(e), keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, version, headers = request
+
+                try:
+                    status, response_headers, body = self._respond(method, target, headers)
+                except HttpError as e:
+                    status, response_headers, body = self._error_response(e)
+
+                # A chunked body can't be skipped, so the connection ends with this request
+                keep_alive = (headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                              and 'transfer-encoding' not in headers)
+                self._write_response(writer, method, status, response_headers, body, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        await self.reload_if_changed()
+        watcher = asyncio.create_task(self.watch())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info("Serving the price dashboard at http://%s:%d/graph.html", host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Serve the price dashboard and its query API.")
+    arg_parser.add_argument('--host', default='127.0.0.1', help="The address to listen on (default: 127.0.0.1).")
+    arg_parser.add_argument('--port', type=int, default=8000, help="The port to listen on (default: 8000).")
+    arg_parser.add_argument('--reload-interval', type=float, default=2.0,
+                            help="Seconds between checks for newly generated data (default: 2).")
+    args = arg_parser.parse_args()
+    configure_logging()
+
+    try:
+        asyncio.run(DashboardServer(reload_interval=args.reload_interval).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,368 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+from datetime import date
+from itertools import groupby
+from operator import itemgetter
+
+# Make the shared modules in the project root importable when run as 'py analytics/spend_rollups.py'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analytics.historical_prices import DASHBOARD_DATA_DIR, write_compact_json
+from har_compact import COMPACTED_DIR, COMPACTED_FILE
+from har_files import atomic_write
+from har_metrics import RunMetrics, configure_logging, run_with_profile
+from har_records import order_date_ordinal
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FILE = '.spend_rollups.json'
+ROLLUP_VERSION = 1
+SPEND_FILE = 'spend.json'
+PERIODS = ('week', 'month')
+SPEND_FIELDS = ('period', 'category', 'spend', 'quantity', 'distinct_items')
+
+def period_key(period, day):
+    """
+    Returns the bucket a day falls in: its ISO week ('2024-W05') or its month ('2024-01').
+
+    Keys of the same period sort in date order.
+    """
+    if period == 'week':
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == 'month':
+        return f"{day.year}-{day.month:02d}"
+    raise ValueError(f"Unknown period '{period}'. Choose from: {', '.join(PERIODS)}")
+
+class SpendRollups:
+    """
+    Weekly and monthly spend, quantity and distinct items per `is_food` category.
+
+    Each bucket holds the spend in cents, the total quantity and how many line
+    items each distinct item (by item ID, or name if it has none) had. Adding
+    an order only touches its week and month, and answering a query only reads
+    the buckets. Integer cents keep the totals exactly the same whatever order
+    the orders were added in.
+
+    The order IDs already counted are recorded, so an order in several CSVs
+    or parsed again is only counted once. An order is never revised once
+    counted; use a rebuild if earlier CSVs were wrong. The rollups also record
+    the size and mtime of the CSV files they have read, so unchanged files are
+    skipped without being opened.
+
+    Args:
+        rollup_path (str): The JSON file the rollups are kept in, or None to
+            keep them in memory only.
+    """
+
+    def __init__(self, rollup_path=None):
+        self.rollup_path = rollup_path
+        self.files = {}
+        self.orders = set()
+        self.buckets = {period: {} for period in PERIODS}
+        self._unsaved = False
+        self._load()
+
+    def _load(self):
+        if not self.rollup_path or not os.path.exists(self.rollup_path):
+            return
+        try:
+            with open(self.rollup_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read the spend rollups '{self.rollup_path}'. Rebuilding them. Error: {e}")
+            return
+        if data.get('version') != ROLLUP_VERSION:
+            return
+        self.files = data['files']
+        self.orders = set(data['orders'])
+        self.buckets = data['buckets']
+
+    def add_order(self, order_id, day, line_items):
+        """
+        Adds an order's line items to its week and month.
+
+        Args:
+            order_id (str): The order ID.
+            day (date): The order date.
+            line_items (list): (is_food, item_key, quantity, price) tuples, where
+                price is the line's total price.
+
+        Returns:
+            bool: Whether the order was added, rather than already counted.
+        """
+        if order_id in self.orders:
+            return False
+        self.orders.add(order_id)
+        for period in PERIODS:
+            categories = self.buckets[period].setdefault(period_key(period, day), {})
+            for is_food, item_key, quantity, price in line_items:
+                bucket = categories.get(is_food)
+                if bucket is None:
+                    bucket = categories[is_food] = [0, 0, {}]
+                bucket[0] += round(price * 100)
+                bucket[1] += quantity
+                bucket[2][item_key] = bucket[2].get(item_key, 0) + 1
+        self._unsaved = True
+        return True
+
+    def file_unchanged(self, file_path, stat):
+        return self.files.get(file_path) == [stat.st_size, stat.st_mtime_ns]
+
+    def record_file(self, file_path, stat):
+        self.files[file_path] = [stat.st_size, stat.st_mtime_ns]
+        self._unsaved = True
+
+    def query(self, period, category=None, start=None, end=None):
+        """
+        Returns the buckets of a period, oldest first.
+
+        Args:
+            period (str): 'week' or 'month'.
+            category (str): Only return this `is_food` category.
+            start (date): Only return buckets from the one holding this day on.
+            end (date): Only return buckets up to the one holding this day.
+
+        Returns:
+            list: A dict per bucket and category, with the fields in SPEND_FIELDS.
+        """
+        start_key = period_key(period, start) if start else ''
+        end_key = period_key(period, end) if end else None
+        rows = []
+        for key in sorted(self.buckets[period]):
+            if key < start_key or (end_key is not None and key > end_key):
+                continue
+            categories = self.buckets[period][key]
+            for is_food in sorted(categories):
+                if category is not None and is_food != category:
+                    continue
+                cents, quantity, items = categories[is_food]
+                rows.append({'period': key, 'category': is_food, 'spend': cents / 100, 'quantity': quantity,
+                             'distinct_items': len(items)})
+        return rows
+
+    def save(self):
+        """
+        Writes the rollups, if they changed.
+
+        Returns:
+            bool: Whether the rollups were written.
+        """
+        if not self.rollup_path or not self._unsaved:
+            return False
+        os.makedirs(os.path.dirname(self.rollup_path) or '.', exist_ok=True)
+        with atomic_write(self.rollup_path) as f:
+            json.dump({'version': ROLLUP_VERSION, 'files': self.files, 'orders': sorted(self.orders),
+                       'buckets': self.buckets}, f, separators=(',', ':'))
+        self._unsaved = False
+        return True
+
+    def write_dashboard_data(self, data_dir):
+        """
+        Writes every bucket to 'spend.json' in the dashboard data directory,
+        without the per-item counts.
+        """
+        os.makedirs(data_dir, exist_ok=True)
+        data = {'fields': SPEND_FIELDS}
+        for period in PERIODS:
+            data[period] = [[row[field] for field in SPEND_FIELDS] for row in self.query(period)]
+        write_compact_json(os.path.join(data_dir, SPEND_FILE), data)
+
+def read_csv_orders(file_path):
+    """
+    Reads the line items of a CSV file grouped by order.
+
+    An order captured more than once in the file keeps only its last capture.
+    A capture starts at line 0 or, in CSVs written before line numbers were
+    recorded, wherever the order ID differs from the row before.
+
+    Returns:
+        dict: {order_id: (date, [(is_food, item_key, quantity, price), ...])},
+            or None if the file could not be read.
+    """
+    orders = {}
+    last_order_id = None
+    try:
+        with open(file_path, mode='r', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            next(reader, None)  # Skip the header row
+            for row in reader:
+                try:
+                    order_id, date_str, item_name, is_food, quantity_str, price_str = row[:6]
+                    item_id = row[6] if len(row) > 6 else ''
+                    line_number = row[7] if len(row) > 7 else ''
+                    line_item = (is_food, item_id or item_name, float(quantity_str), float(price_str))
+                    new_capture = line_number == '0' if line_number else order_id != last_order_id
+                    order = orders.get(order_id)
+                    if order is None or new_capture:
+                        order = orders[order_id] = (date.fromordinal(order_date_ordinal(date_str)), [])
+                    order[1].append(line_item)
+                    last_order_id = order_id
+                except ValueError as e:
+                    print(f"Skipping row due to formatting error: {row}. Error: {e}")
+    except FileNotFoundError:
+        print(f"Error: The file was not found at '{file_path}'")
+        return None
+    except UnicodeDecodeError:
+        print(f"Error: Could not decode file '{file_path}'. Please ensure it is UTF-8 encoded.")
+        return None
+    return orders
+
+def update_from_csv_files(rollups, file_paths, metrics):
+    """
+    Adds the orders of new and changed CSV files to the rollups.
+    """
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        if rollups.file_unchanged(file_path, stat):
+            metrics.count('csv_files_unchanged')
+            continue
+        with metrics.timer('read_csv'):
+            orders = read_csv_orders(file_path)
+        if orders is None:
+            metrics.count('csv_files_failed')
+            continue
+        metrics.count('csv_files_read')
+        with metrics.timer('update'):
+            for order_id, (day, line_items) in orders.items():
+                metrics.count('orders_added' if rollups.add_order(order_id, day, line_items) else 'orders_skipped')
+        rollups.record_file(file_path, stat)
+
+def update_from_sqlite(rollups, db_path, metrics):
+    """
+    Adds the orders in the SQLite database that aren't counted yet to the rollups.
+
+    Returns:
+        bool: False if the database is missing or could not be read.
+    """
+    if not os.path.exists(db_path):
+        print(f"Error: The database was not found at '{db_path}'")
+        return False
+
+    connection = sqlite3.connect(db_path)
+    try:
+        # Databases written before item IDs were recorded don't have the column
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(line_items)")]
+        item_key = "COALESCE(NULLIF(line_items.item_id, ''), line_items.item_name)" if 'item_id' in columns \
+            else "line_items.item_name"
+        query = (
+            f"SELECT orders.order_id, orders.order_day, line_items.is_food, {item_key}, line_items.quantity, "
+            "line_items.price FROM line_items JOIN orders ON orders.order_id = line_items.order_id "
+            "ORDER BY orders.order_id"
+        )
+        with metrics.timer('update'):
+            for order_id, rows in groupby(connection.execute(query), key=itemgetter(0)):
+                if order_id in rollups.orders:
+                    metrics.count('orders_skipped')
+                    continue
+                rows = list(rows)
+                rollups.add_order(order_id, date.fromisoformat(rows[0][1]), [row[2:] for row in rows])
+                metrics.count('orders_added')
+    except sqlite3.Error as e:
+        print(f"Error: Could not read from database '{db_path}'. Error: {e}")
+        return False
+    finally:
+        connection.close()
+    return True
+
+def update_spend_rollups(db_path=None, csv_path=None, output_dir=None, analytics_dir=None, rebuild=False,
+                         metrics=None):
+    """
+    Adds new orders to the spend rollups and saves them for the CLI and dashboard.
+
+    The rollups are kept in the analytics directory, and every bucket is also
+    written to 'data/spend.json' for the dashboard server.
+
+    Args:
+        db_path (str): Read the orders from this SQLite database instead of the CSV files.
+        csv_path (str): Read this single CSV, such as the file written by
+            har_compact.py, instead of every CSV in the output directory.
+        output_dir (str): Read the CSV files from this directory instead of 'output'.
+        analytics_dir (str): Keep the rollups in this directory instead of 'analytics'.
+        rebuild (bool): Discard the saved rollups and count every order again.
+        metrics (RunMetrics): Records the time spent reading and updating, and
+            counts the files read and the orders added or already counted.
+
+    Returns:
+        SpendRollups: The updated rollups, or None if there was nothing to read.
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    base_dir = os.path.dirname(os.path.dirname(__file__))
+    output_dir = output_dir or os.path.join(base_dir, 'output')
+    analytics_dir = analytics_dir or os.path.join(base_dir, 'analytics')
+
+    rollup_path = os.path.join(analytics_dir, ROLLUP_FILE)
+    if rebuild and os.path.exists(rollup_path):
+        os.remove(rollup_path)
+    rollups = SpendRollups(rollup_path)
+
+    if db_path is not None:
+        if not update_from_sqlite(rollups, db_path, metrics):
+            return None
+    elif csv_path is not None:
+        if not os.path.exists(csv_path):
+            print(f"Error: The file was not found at '{csv_path}'")
+            return None
+        update_from_csv_files(rollups, [csv_path], metrics)
+    else:
+        if not os.path.exists(output_dir):
+            print(f"Error: The directory '{output_dir}' was not found.")
+            return None
+        csv_files = sorted(f for f in os.listdir(output_dir) if f.endswith('.csv'))
+        if not csv_files:
+            print("No CSV files found in the 'output' directory.")
+            return None
+        update_from_csv_files(rollups, [os.path.join(output_dir, f) for f in csv_files], metrics)
+
+    with metrics.timer('save'):
+        if rollups.save():
+            rollups.write_dashboard_data(os.path.join(analytics_dir, DASHBOARD_DATA_DIR))
+            logger.info("Spend rollups saved to '%s'", rollup_path)
+    return rollups
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Update the weekly and monthly spend rollups and print them.")
+    arg_parser.add_argument('--sqlite', nargs='?', const=os.path.join('output', 'walmart_orders.db'), default=None,
+                            metavar='DB_PATH', help="Read from the SQLite database written by har_parser.py "
+                                                    "--format sqlite (default path: output/walmart_orders.db).")
+    arg_parser.add_argument('--compacted', nargs='?', const=os.path.join('output', COMPACTED_DIR, COMPACTED_FILE),
+                            default=None, metavar='CSV_PATH',
+                            help="Read the deduplicated CSV written by har_compact.py instead of the output "
+                                 f"directory (default path: output/{COMPACTED_DIR}/{COMPACTED_FILE}).")
+    arg_parser.add_argument('--rebuild', action='store_true',
+                            help="Discard the saved rollups and count every order again.")
+    arg_parser.add_argument('--period', choices=PERIODS, default='month',
+                            help="The buckets to print (default: month).")
+    arg_parser.add_argument('--category', default=None,
+                            help="Only print this category, such as 'food' or 'nonfood'.")
+    arg_parser.add_argument('--start', type=date.fromisoformat, default=None,
+                            help="Only print buckets from the one holding this date (YYYY-MM-DD) on.")
+    arg_parser.add_argument('--end', type=date.fromisoformat, default=None,
+                            help="Only print buckets up to the one holding this date (YYYY-MM-DD).")
+    arg_parser.add_argument('--profile', metavar='PATH',
+                            help="Save per-stage timings and counters for the run to this JSON file.")
+    args = arg_parser.parse_args()
+    configure_logging()
+
+    metrics = RunMetrics()
+
+    def run():
+        rollups = update_spend_rollups(db_path=args.sqlite, csv_path=args.compacted, rebuild=args.rebuild,
+                                       metrics=metrics)
+        if rollups is None:
+            return
+        print(f"{'Period':<10}{'Category':<10}{'Spend':>12}{'Quantity':>10}{'Items':>7}")
+        for row in rollups.query(args.period, args.category, args.start, args.end):
+            print(f"{row['period']:<10}{row['category']:<10}{row['spend']:>12.2f}{row['quantity']:>10g}"
+                  f"{row['distinct_items']:>7}")
+
+    if args.profile:
+        run_with_profile(run, metrics, args.profile)
+    else:
+        run()
@@ -0,0 +1,189 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from analytics.historical_prices import process_and_save_data
+from benchmarks.synthetic import SyntheticCorpus
+from har_parser import CategoryStore, parse_walmart_har
+from har_sinks import ListSink
+
+BASELINE_VERSION = 1
+DEFAULT_SIZES = (100, 1000)
+# The HAR parsing modes measured, as parse_walmart_har keyword arguments
+PARSE_STAGES = {
+    'parse_load': {},
+    'parse_stream': {'stream': True},
+    'parse_prefilter': {'prefilter': True},
+}
+
+def _parse_hars(har_paths, work_dir, **parse_options):
+    category_store = CategoryStore(os.path.join(work_dir, 'food_or_non_food.json'))
+    for har_path in har_paths:
+        parse_walmart_har(har_path, work_dir, category_store=category_store, sink=ListSink(), **parse_options)
+
+def _run_analytics(csv_dir, work_dir):
+    process_and_save_data(use_cache=False, output_dir=csv_dir, analytics_dir=work_dir)
+
+def measure(function, repeat=3, memory=True):
+    """
+    Times a function and measures its peak Python memory.
+
+    The function's output is sent to os.devnull. The timing runs are done
+    without tracemalloc, which slows allocations down, and the memory is
+    measured in one extra run.
+
+    Args:
+        function (callable): The stage to run, taking no arguments.
+        repeat (int): The number of timed runs; the fastest one is kept.
+        memory (bool): Whether to measure peak memory.
+
+    Returns:
+        dict: 'wall_time' in seconds and 'peak_memory' in bytes (None if not measured).
+    """
+    wall_times = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            wall_times.append(time.perf_counter() - start)
+
+        peak_memory = None
+        if memory:
+            tracemalloc.start()
+            try:
+                function()
+                peak_memory = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    return {'wall_time': min(wall_times), 'peak_memory': peak_memory}
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=3, memory=True, files=4, corpus_options=None):
+    """
+    Generates a corpus for each size and measures every stage on it.
+
+    Args:
+        sizes (iterable): The numbers of orders to generate.
+        repeat (int): The number of timed runs per stage.
+        memory (bool): Whether to measure peak memory.
+        files (int): The number of HAR/CSV files each corpus is split over.
+        corpus_options (dict): Extra SyntheticCorpus arguments.
+
+    Returns:
+        dict: The results keyed by '<stage>@<orders>', each with the wall time,
+            peak memory, the number of entries (HAR entries or CSV rows), the
+            input size in bytes and the resulting entries/s and MB/s.
+    """
+    results = {}
+    for size in sizes:
+        corpus_dir = tempfile.mkdtemp(prefix='walmart_bench_')
+        try:
+            corpus = SyntheticCorpus(orders=size, **(corpus_options or {}))
+            har_paths = corpus.write_hars(os.path.join(corpus_dir, 'har'), files)
+            csv_dir = os.path.join(corpus_dir, 'csv')
+            csv_paths = corpus.write_csvs(csv_dir, files)
+            work_dir = os.path.join(corpus_dir, 'work')
+            os.makedirs(work_dir)
+
+            har_entries = size * (corpus.noise_entries + 1)
+            csv_rows = sum(len(order_items) for _, _, order_items in corpus.iter_orders())
+            stages = {name: (lambda options=options: _parse_hars(har_paths, work_dir, **options),
+                             har_entries, har_paths)
+                      for name, options in PARSE_STAGES.items()}
+            stages['analytics'] = (lambda: _run_analytics(csv_dir, work_dir), csv_rows, csv_paths)
+
+            for name, (function, entries, input_paths) in stages.items():
+                result = measure(function, repeat, memory)
+                input_bytes = sum(os.path.getsize(path) for path in input_paths)
+                result.update({
+                    'entries': entries,
+                    'input_bytes': input_bytes,
+                    'entries_per_second': entries / result['wall_time'],
+                    'mb_per_second': input_bytes / 1e6 / result['wall_time'],
+                })
+                results[f"{name}@{size}"] = result
+        finally:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+    return results
+
+def compare_results(baseline, results, tolerance=0.25):
+    """
+    Finds the stages that got slower or use more memory than in the baseline.
+
+    Args:
+        baseline (dict): The results saved by an earlier run.
+        results (dict): The results of this run.
+        tolerance (float): The allowed increase, as a fraction of the baseline.
+
+    Returns:
+        list: A message for each regression. Empty if there are none.
+    """
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for field in ('wall_time', 'peak_memory'):
+            if result.get(field) is None or previous.get(field) is None:
+                continue
+            if result[field] > previous[field] * (1 + tolerance):
+                change = (result[field] / previous[field] - 1) * 100
+                regressions.append(f"{key}: {field} went from {previous[field]:.4g} to {result[field]:.4g} "
+                                   f"(+{change:.0f}%)")
+    return regressions
+
+def print_results(results):
+    print(f"{'stage':<24}{'wall (s)':>10}{'entries/s':>12}{'MB/s':>9}{'peak MB':>10}")
+    for key, result in results.items():
+        peak = f"{result['peak_memory'] / 1e6:.1f}" if result['peak_memory'] is not None else '-'
+        print(f"{key:<24}{result['wall_time']:>10.3f}{result['entries_per_second']:>12.0f}"
+              f"{result['mb_per_second']:>9.1f}{peak:>10}")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark HAR parsing and the price analytics on synthetic data.")
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                            help="The numbers of orders to benchmark (default: 100 1000).")
+    arg_parser.add_argument('--repeat', type=int, default=3,
+                            help="Timed runs per stage; the fastest is reported (default: 3).")
+    arg_parser.add_argument('--files', type=int, default=4,
+                            help="The number of HAR/CSV files each corpus is split over (default: 4).")
+    arg_parser.add_argument('--no-memory', action='store_true', help="Skip the peak memory measurement.")
+    arg_parser.add_argument('--save', metavar='PATH', help="Save the results as a JSON baseline.")
+    arg_parser.add_argument('--compare', metavar='PATH',
+                            help="Compare with a saved baseline and exit with status 1 on a regression.")
+    arg_parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="The allowed slowdown or memory growth for --compare (default: 0.25).")
+    args = arg_parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.repeat, not args.no_memory, args.files)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': BASELINE_VERSION,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2)
+        print(f"Baseline saved to '{args.save}'")
+
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error: Could not read the baseline '{args.compare}'. Error: {e}")
+            sys.exit(2)
+        regressions = compare_results(baseline.get('results', {}), results, args.tolerance)
+        for message in regressions:
+            print(f"Regression: {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against '{args.compare}'.")
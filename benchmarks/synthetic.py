@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+
+from har_parser import ORDER_URL_FRAGMENT
+from har_sinks import OrderItem, CsvSink
+
+ADJECTIVES = ('Organic', 'Great Value', 'Fresh', 'Large', 'Family Size', 'Low Fat', 'Whole', 'Unscented',
+              'Original', 'Extra Strong', 'Sparkling', 'Frozen', 'Gluten Free', 'Classic', 'Honey')
+PRODUCTS = ('Milk 1 gal', 'Bananas', 'Bread Loaf', 'Eggs 12 ct', 'Cheddar Cheese', 'Paper Towels', 'Dish Soap',
+            'Chicken Breast', 'Ground Coffee', 'Laundry Detergent', 'Apples 3 lb', 'Yogurt', 'Toothpaste',
+            'Rice 5 lb', 'Orange Juice', 'Trash Bags', 'Peanut Butter', 'Cereal', 'Shampoo', 'Spinach')
+
+class SyntheticCorpus:
+    """
+    Generates realistic Walmart HAR captures and the matching order CSVs.
+
+    Everything is derived from `seed`, so the same arguments always give the
+    same orders, items, prices and noise, byte for byte. Each item has a fixed
+    item ID and a base price that drifts by a few percent per order, orders are spread over the
+    days since `start_date`, and every capture mixes its getOrder responses
+    with other fetch/script entries carrying large response bodies, headers
+    and call stacks, which is what makes real captures big.
+
+    Args:
+        orders (int): The number of orders across all captures.
+        items_per_order (int): The average number of line items per order.
+        noise_entries (int): The number of non-order entries per order.
+        noise_size (int): The approximate size in bytes of each noise response body.
+        catalog_size (int): The number of distinct item names to draw from.
+        seed (int): The random seed.
+        start_date (date): The date of the first order.
+    """
+
+    def __init__(self, orders=100, items_per_order=8, noise_entries=5, noise_size=20000, catalog_size=300,
+                 seed=0, start_date=date(2023, 1, 1)):
+        self.orders = orders
+        self.items_per_order = items_per_order
+        self.noise_entries = noise_entries
+        self.noise_size = noise_size
+        self.seed = seed
+        self.start_date = start_date
+
+        rng = random.Random(seed)
+        names = [f"{adjective} {product}" for adjective in ADJECTIVES for product in PRODUCTS]
+        rng.shuffle(names)
+        while len(names) < catalog_size:
+            names.append(f"{rng.choice(ADJECTIVES)} {rng.choice(PRODUCTS)} {len(names)}")
+        self.catalog = {name: round(rng.uniform(0.5, 40.0), 2) for name in names[:catalog_size]}
+        self._names = list(self.catalog)
+        item_ids = rng.sample(range(10 ** 8, 10 ** 9), len(self._names))
+        self.item_ids = {name: str(item_id) for name, item_id in zip(self._names, item_ids)}
+
+    def iter_orders(self):
+        """
+        Yields every order as (order_id, order_date, [OrderItem]).
+
+        The order date uses the 'Mon D, YYYY' format of getOrder titles.
+        """
+        rng = random.Random(self.seed + 1)
+        prices = dict(self.catalog)
+        names = self._names
+        order_day = self.start_date
+        for number in range(self.orders):
+            order_day += timedelta(days=rng.randint(0, 6))
+            order_id = str(200000000000000 + number * 7919)
+            order_date = f"{order_day:%b} {order_day.day}, {order_day.year}"
+
+            count = max(1, min(len(names), round(rng.gauss(self.items_per_order, self.items_per_order / 4))))
+            order_items = []
+            for name in rng.sample(names, count):
+                prices[name] = round(max(0.25, prices[name] * rng.uniform(0.95, 1.06)), 2)
+                quantity = rng.choice((1, 1, 1, 2, 2, 3))
+                order_items.append(OrderItem(order_id, order_date, name, 'unknown', quantity,
+                                             f"{prices[name] * quantity:.2f}", self.item_ids[name], len(order_items)))
+            yield order_id, order_date, order_items
+
+    def _order_entry(self, order_id, order_date, order_items, rng):
+        items = [
+            {
+                "productInfo": {"name": item.item_name, "usItemId": item.item_id},
+                "quantity": item.quantity,
+                "priceInfo": {"linePrice": {"value": item.price, "displayValue": f"${item.price}"}},
+            }
+            for item in order_items
+        ]
+        order = {"data": {"order": {
+            "id": order_id,
+            "title": f"{order_date} order",
+            "groups_2101": [{"status": {"message": "Delivered"}, "items": items}],
+        }}}
+        return {
+            "_resourceType": "fetch",
+            "_initiator": self._initiator(rng),
+            "request": {
+                "method": "POST",
+                "url": f"https://www.walmart.com{ORDER_URL_FRAGMENT}{order_id}?orderId={order_id}",
+                "headers": self._headers(rng),
+            },
+            "response": {
+                "status": 200,
+                "headers": self._headers(rng),
+                "content": {"mimeType": "application/json", "text": json.dumps(order)},
+            },
+        }
+
+    def _noise_entry(self, number, rng):
+        resource_type = rng.choice(('fetch', 'script', 'xhr', 'document'))
+        # A JSON body that is as costly to decode as real recommendation/ads payloads
+        records = [{"id": rng.randrange(10 ** 9), "name": rng.choice(self._names), "score": rng.random()}
+                   for _ in range(max(1, self.noise_size // 80))]
+        return {
+            "_resourceType": resource_type,
+            "_initiator": self._initiator(rng),
+            "request": {
+                "method": "GET",
+                "url": f"https://www.walmart.com/orchestra/home/graphql/{resource_type}/{number}",
+                "headers": self._headers(rng),
+            },
+            "response": {
+                "status": 200,
+                "headers": self._headers(rng),
+                "content": {"mimeType": "application/json", "text": json.dumps({"data": records})},
+            },
+        }
+
+    @staticmethod
+    def _headers(rng):
+        return [{"name": f"x-header-{i}", "value": f"{rng.getrandbits(64):016x}"} for i in range(12)]
+
+    @staticmethod
+    def _initiator(rng):
+        frames = [{"functionName": f"f{i}", "url": "https://i5.walmartimages.com/app.js",
+                   "lineNumber": rng.randrange(10000), "columnNumber": rng.randrange(500)} for i in range(6)]
+        return {"type": "script", "stack": {"callFrames": frames, "parent": {"callFrames": frames[:3]}}}
+
+    def iter_entries(self, orders):
+        """
+        Yields the HAR entries for a list of orders, with the noise interleaved.
+        """
+        for order_id, order_date, order_items in orders:
+            rng = random.Random(f"{self.seed}-{order_id}")
+            for number in range(self.noise_entries):
+                yield self._noise_entry(number, rng)
+            yield self._order_entry(order_id, order_date, order_items, rng)
+
+    def write_har(self, file_path, orders):
+        """
+        Writes one HAR capture holding the given orders, one entry at a time.
+
+        Returns:
+            int: The number of entries written.
+        """
+        count = 0
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write('{"log": {"version": "1.2", "creator": {"name": "synthetic"}, "entries": [')
+            for entry in self.iter_entries(orders):
+                f.write(', ' if count else '')
+                json.dump(entry, f)
+                count += 1
+            f.write(']}}')
+        return count
+
+    def _split(self, files):
+        orders = list(self.iter_orders())
+        size = max(1, -(-len(orders) // files))
+        return [orders[i:i + size] for i in range(0, len(orders), size)]
+
+    def write_hars(self, har_dir, files=1):
+        """
+        Splits the orders over `files` captures named 'capture_<n>.har'.
+
+        Returns:
+            list: The paths of the HAR files written.
+        """
+        os.makedirs(har_dir, exist_ok=True)
+        paths = []
+        for number, orders in enumerate(self._split(files)):
+            path = os.path.join(har_dir, f"capture_{number:04d}.har")
+            self.write_har(path, orders)
+            paths.append(path)
+        return paths
+
+    def write_csvs(self, output_dir, files=1):
+        """
+        Writes the CSVs har_parser.py would produce from write_hars(output_dir, files).
+
+        Returns:
+            list: The paths of the CSV files written.
+        """
+        paths = []
+        for orders in self._split(files):
+            sink = CsvSink(output_dir)
+            for _, _, order_items in orders:
+                for item in order_items:
+                    sink.write(item)
+            paths.append(sink.close())
+        return paths
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Generate synthetic Walmart HAR captures and order CSVs.")
+    arg_parser.add_argument('output_dir', help="Where to write the 'har' and 'csv' directories.")
+    arg_parser.add_argument('--orders', type=int, default=100, help="The number of orders (default: 100).")
+    arg_parser.add_argument('--items-per-order', type=int, default=8,
+                            help="The average number of items per order (default: 8).")
+    arg_parser.add_argument('--noise-entries', type=int, default=5,
+                            help="The number of non-order entries per order (default: 5).")
+    arg_parser.add_argument('--noise-size', type=int, default=20000,
+                            help="The size in bytes of each non-order response body (default: 20000).")
+    arg_parser.add_argument('--files', type=int, default=1, help="The number of captures to split the orders over.")
+    arg_parser.add_argument('--seed', type=int, default=0, help="The random seed (default: 0).")
+    args = arg_parser.parse_args()
+
+    corpus = SyntheticCorpus(args.orders, args.items_per_order, args.noise_entries, args.noise_size, seed=args.seed)
+    har_paths = corpus.write_hars(os.path.join(args.output_dir, 'har'), args.files)
+    csv_paths = corpus.write_csvs(os.path.join(args.output_dir, 'csv'), args.files)
+    print(f"Wrote {len(har_paths)} HAR files and {len(csv_paths)} CSV files to '{args.output_dir}'")
@@ -0,0 +1,96 @@
+import json
+import os
+
+from har_manifest import file_sha256
+from har_records import loads
+from har_sinks import _TempFileSink
+
+ORDER_CACHE_SUFFIX = '.orders.jsonl'
+ORDER_CACHE_VERSION = 1
+# Every cache starts with its header, so a cache is recognised by its first bytes
+ORDER_CACHE_MAGIC = f'{{"walmart_order_cache": {ORDER_CACHE_VERSION},'.encode('utf-8')
+
+def slim_order_entry(entry):
+    """
+    Keeps only the parts of a getOrder HAR entry that the parser reads.
+
+    Returns:
+        dict: The entry's resource type, request URL and response text.
+    """
+    content = entry['response'].get('content', {})
+    return {
+        '_resourceType': entry.get('_resourceType'),
+        'request': {'url': entry['request']['url']},
+        'response': {'content': {'text': content['text']} if 'text' in content else {}},
+    }
+
+class OrderCacheSink(_TempFileSink):
+    """
+    Streams the getOrder entries of a HAR to a compact JSON Lines cache.
+
+    The first line is a header naming the source HAR and its SHA-256, and
+    every following line is one slimmed entry (see slim_order_entry). The
+    cache is a few hundred KB where the capture can be several GB, and
+    parse_walmart_har reads it like a HAR, so orders can be parsed again after
+    a parser change without the original capture.
+
+    Args:
+        output_path (str): The path of the cache file to write.
+        har_file_path (str): The HAR the entries come from. It is hashed when
+            the first entry is written, unless `sha256` is given.
+        sha256 (str): The HAR's SHA-256, if it is already known.
+    """
+
+    suffix = ORDER_CACHE_SUFFIX + '.tmp'
+
+    def __init__(self, output_path, har_file_path, sha256=None):
+        super().__init__(os.path.dirname(output_path) or '.')
+        self.output_path = output_path
+        self.har_file_path = har_file_path
+        self.sha256 = sha256
+
+    def _open(self):
+        super()._open()
+        self.sha256 = self.sha256 or file_sha256(self.har_file_path)
+        header = {'walmart_order_cache': ORDER_CACHE_VERSION, 'source': os.path.basename(self.har_file_path),
+                  'sha256': self.sha256}
+        self._file.write(json.dumps(header))
+        self._file.write('\n')
+
+    def _write(self, entry):
+        self._file.write(json.dumps(slim_order_entry(entry), ensure_ascii=False, separators=(',', ':')))
+        self._file.write('\n')
+
+    def _final_path(self):
+        return self.output_path
+
+def is_order_cache(file_path):
+    """
+    Checks whether a file is an order cache written by OrderCacheSink.
+    """
+    with open(file_path, 'rb') as f:
+        return f.read(len(ORDER_CACHE_MAGIC)) == ORDER_CACHE_MAGIC
+
+class OrderCacheReader:
+    """
+    Yields the entries of an order cache, one line at a time.
+
+    It can stand in for HarEntryScanner when parsing: it is iterable, has
+    `found_entries` and close().
+
+    Args:
+        cache_path (str): The path of the cache file.
+    """
+
+    def __init__(self, cache_path):
+        self._file = open(cache_path, 'rb')
+        self.header = json.loads(self._file.readline())
+        self.found_entries = True
+
+    def close(self):
+        self._file.close()
+
+    def __iter__(self):
+        for line in self._file:
+            if line.strip():
+                yield loads(line)
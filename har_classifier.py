@@ -0,0 +1,191 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+from collections import Counter
+
+from har_metrics import configure_logging
+
+RULES_FILE = 'classification_rules.json'
+ITEM_TYPES = ('food', 'nonfood')
+
+logger = logging.getLogger(__name__)
+
+# The characters a keyword can't start after or end before, as in the regex (?<!\w) and (?!\w)
+_NON_WORD = re.compile(r'\W')
+
+class RuleClassifier:
+    """
+    Classifies item names as 'food' or 'nonfood' from a list of rules.
+
+    Each rule has a 'name', a 'type' and any of:
+        brands: Names the item name starts with, such as "Marketside".
+        keywords: Words or phrases found anywhere in the name, such as
+            "paper towels". A trailing 's' or 'es' also matches.
+        patterns: Regular expressions searched for in the name.
+    Everything is matched against the lowercased item name, and the first rule
+    in the list that matches wins.
+
+    Brands and keywords are looked up in dicts holding the first rule of each,
+    using the slices of the name between word boundaries, so a name is not
+    scanned once per rule. Patterns are only searched for in the rules ahead
+    of the best brand or keyword match. The result for each name is remembered.
+
+    Args:
+        rules (list): The rules, as dicts, in priority order.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        # {lowercased brand, or keyword with or without an 's' or 'es': index of the first rule with it}
+        self._brands = {}
+        self._keywords = {}
+        # The parts of the brands and keywords before a non-word character in
+        # them, the only slices of a name that a longer slice can still match
+        self._brand_prefixes = set()
+        self._keyword_prefixes = set()
+        # [(rule index, [compiled pattern, ...]), ...] in rule order
+        self._patterns = []
+        for index, rule in enumerate(rules):
+            if rule.get('type') not in ITEM_TYPES:
+                raise ValueError(f"Rule {rule.get('name', index)!r} must have a 'type' of {' or '.join(ITEM_TYPES)}")
+            for brand in map(str.lower, rule.get('brands', [])):
+                self._brands.setdefault(brand, index)
+                self._brand_prefixes.update(brand[:m.start()] for m in _NON_WORD.finditer(brand))
+            for keyword in map(str.lower, rule.get('keywords', [])):
+                for word in (keyword, keyword + 's', keyword + 'es'):
+                    self._keywords.setdefault(word, index)
+                self._keyword_prefixes.update(keyword[:m.start()] for m in _NON_WORD.finditer(keyword))
+            if rule.get('patterns'):
+                self._patterns.append((index, [re.compile(pattern) for pattern in rule['patterns']]))
+        self._brands.pop('', None)
+        self._keywords.pop('', None)
+        self._cache = {}
+
+    @classmethod
+    def from_file(cls, rules_file=RULES_FILE):
+        """
+        Loads the rules from a JSON file with a 'rules' list.
+
+        Returns:
+            RuleClassifier: The classifier, or None if the file is missing or invalid.
+        """
+        if not os.path.exists(rules_file):
+            return None
+        try:
+            with open(rules_file, 'r', encoding='utf-8') as f:
+                return cls(json.load(f)['rules'])
+        except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+            print(f"Warning: Could not load the classification rules '{rules_file}'. Error: {e}")
+            return None
+
+    def classify(self, item_name):
+        """
+        Finds the first rule that matches an item name.
+
+        Args:
+            item_name (str): The name of the item.
+
+        Returns:
+            tuple: The item type and the name of the rule that matched, or None
+                if no rule matched.
+        """
+        try:
+            return self._cache[item_name]
+        except KeyError:
+            pass
+        index = self._first_rule(item_name.lower())
+        if index is None:
+            result = None
+        else:
+            rule = self.rules[index]
+            result = (rule['type'], rule.get('name', f"r{index}"))
+        self._cache[item_name] = result
+        return result
+
+    def _first_rule(self, name):
+        """
+        Returns:
+            int: The index of the first rule matching a lowercased name, or None.
+        """
+        bounds = [m.start() for m in _NON_WORD.finditer(name)]
+        # A brand or keyword ends at a non-word character or the end of the name...
+        ends = bounds + [len(name)]
+        best = None
+        for end in ends:
+            index = self._brands.get(name[:end])
+            if index is not None and (best is None or index < best):
+                best = index
+            if name[:end] not in self._brand_prefixes:
+                break
+        keywords = self._keywords
+        prefixes = self._keyword_prefixes
+        end_index = 0
+        # ...and a keyword starts at the beginning or after a non-word character
+        for start in [0] + [bound + 1 for bound in bounds]:
+            while ends[end_index] < start:
+                end_index += 1
+            for end in ends[end_index:]:
+                word = name[start:end]
+                index = keywords.get(word)
+                if index is not None and (best is None or index < best):
+                    best = index
+                if word not in prefixes:
+                    break
+        for index, patterns in self._patterns:
+            if best is not None and index > best:
+                break
+            if any(pattern.search(name) for pattern in patterns):
+                return index
+        return best
+
+def write_audit(audit_path, matched_items):
+    """
+    Writes the item name, assigned type and matching rule of each classified item to a CSV.
+
+    Args:
+        audit_path (str): The CSV file to write.
+        matched_items (dict): {item_name: (item_type, rule_name)}.
+    """
+    with open(audit_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['item_name', 'type', 'rule'])
+        for item_name, (item_type, rule_name) in matched_items.items():
+            writer.writerow([item_name, item_type, rule_name])
+
+if __name__ == "__main__":
+    from har_parser import CATEGORY_FILE, CategoryStore
+
+    arg_parser = argparse.ArgumentParser(description="Classify the 'unknown' items in the category file using rules.")
+    arg_parser.add_argument('--category-file', default=CATEGORY_FILE,
+                            help=f"The category JSON file to update (default: {CATEGORY_FILE}).")
+    arg_parser.add_argument('--rules', default=RULES_FILE, help=f"The rules file (default: {RULES_FILE}).")
+    arg_parser.add_argument('--audit', metavar='PATH',
+                            help="Write each classified item with the rule that matched it to this CSV file.")
+    arg_parser.add_argument('--rerun', action='store_true',
+                            help="Also run the rules again over the items they classified before, e.g. after "
+                                 "editing the rules. Types set by hand are never changed.")
+    arg_parser.add_argument('--dry-run', action='store_true', help="Report what would change without saving it.")
+    args = arg_parser.parse_args()
+    configure_logging()
+
+    if not os.path.exists(args.rules):
+        print(f"Error: The rules file '{args.rules}' was not found.")
+    else:
+        category_store = CategoryStore(args.category_file, rules_file=args.rules)
+        unknown_count = sum(1 for item_type in category_store.item_data.values() if item_type == 'unknown')
+        if args.rerun:
+            unknown_count += len(category_store.classified)
+        matched_items = category_store.reclassify(rerun=args.rerun)
+
+        for rule_name, count in Counter(rule_name for _, rule_name in matched_items.values()).most_common():
+            logger.info("  %-32s %6d", rule_name, count)
+        logger.info("Classified %d of %d %s items.", len(matched_items), unknown_count,
+                    "unknown and rule-classified" if args.rerun else "unknown")
+        if args.audit:
+            write_audit(args.audit, matched_items)
+            logger.info("Audit saved to '%s'", args.audit)
+        if not args.dry_run:
+            category_store.flush()
@@ -0,0 +1,207 @@
+import argparse
+import csv
+import heapq
+import logging
+import os
+import shutil
+import tempfile
+from operator import itemgetter
+
+from har_files import atomic_write
+from har_metrics import RunMetrics, configure_logging, run_with_profile
+from har_records import order_date_ordinal
+from har_sinks import CSV_FIELDNAMES
+
+COMPACTED_DIR = 'compacted'
+COMPACTED_FILE = 'walmart_order_items.csv'
+# Every column up to the price. Older CSVs have no item ID or line number.
+MIN_COLUMNS = 6
+# Rows held in memory before a sorted run is written to disk
+RUN_ROWS = 100000
+# Runs merged at once, which keeps the number of open files bounded
+MERGE_FAN_IN = 64
+
+logger = logging.getLogger(__name__)
+
+_ordinal = itemgetter(0)
+
+def _read_rows(csv_path, metrics):
+    """
+    Yields the date ordinal and row of every valid row of an order CSV.
+
+    Rows are padded to CSV_FIELDNAMES, so CSVs written before a column was
+    added merge with newer ones. Rows without a line number are numbered by
+    their position in the run of rows of their order.
+    """
+    width = len(CSV_FIELDNAMES)
+    last_order_id = None
+    line_number = 0
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Skip the header row
+        for row in reader:
+            try:
+                if len(row) < MIN_COLUMNS:
+                    raise ValueError(f"expected at least {MIN_COLUMNS} columns, got {len(row)}")
+                ordinal = order_date_ordinal(row[1])
+            except ValueError as e:
+                print(f"Skipping row due to formatting error: {row}. Error: {e}")
+                metrics.count('rows_skipped')
+                continue
+            row = (row + [''] * (width - len(row)))[:width]
+            line_number = line_number + 1 if row[0] == last_order_id else 0
+            last_order_id = row[0]
+            if not row[7]:
+                row[7] = str(line_number)
+            yield ordinal, row
+
+def _write_run(run_path, rows):
+    # Runs keep the date ordinal in front, so merging never parses dates again
+    with open(run_path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows([ordinal] + row for ordinal, row in rows)
+
+def _iter_run(run_path):
+    with open(run_path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            yield int(row[0]), row[1:]
+
+def _merge_runs(runs):
+    # Ties go to the earlier run, so rows on the same date keep their input order
+    return heapq.merge(*(_iter_run(run) if isinstance(run, str) else iter(run) for run in runs), key=_ordinal)
+
+def compact_csvs(csv_paths, output_path, metrics=None, run_rows=RUN_ROWS, fan_in=MERGE_FAN_IN):
+    """
+    Merges order CSVs into one date-sorted CSV without duplicate rows.
+
+    Overlapping captures produce CSVs that share orders. The rows of every
+    CSV are sorted by order date in runs of `run_rows`, which are written to
+    temporary files, and the runs are combined with a k-way merge, `fan_in`
+    files at a time. A row is a duplicate if an earlier row has the same
+    order ID, line number, item name, quantity and price, so a repeat capture
+    of an order is dropped while two identical lines of one order are both
+    kept. The earlier row is kept, taking the duplicate's item ID if it had
+    none. Duplicates always share an
+    order date, so only the current date's rows and keys are held in memory,
+    however many files and rows there are.
+
+    Args:
+        csv_paths (list): The CSV files to merge, in order of preference for
+            rows on the same date.
+        output_path (str): The consolidated CSV to write. It is replaced atomically.
+        metrics (RunMetrics): Records the time spent sorting runs and merging,
+            and counts the files and rows read, skipped, dropped as duplicates
+            and written.
+        run_rows (int): The number of rows sorted in memory at a time.
+        fan_in (int): The number of runs merged at once.
+
+    Returns:
+        str: The output path, or None if the CSVs held no rows.
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    output_dir = os.path.dirname(output_path) or '.'
+    os.makedirs(output_dir, exist_ok=True)
+    run_dir = tempfile.mkdtemp(prefix='.compact_', dir=output_dir)
+    try:
+        # Sort the rows into runs. The last one stays in memory.
+        runs = []
+        rows = []
+        with metrics.timer('sort_runs'):
+            for csv_path in csv_paths:
+                metrics.count('csv_files_read')
+                for ordinal_row in _read_rows(csv_path, metrics):
+                    rows.append(ordinal_row)
+                    if len(rows) >= run_rows:
+                        rows.sort(key=_ordinal)
+                        runs.append(os.path.join(run_dir, f"run_{len(runs):06d}.csv"))
+                        _write_run(runs[-1], rows)
+                        rows = []
+            rows.sort(key=_ordinal)
+            if rows:
+                runs.append(rows)
+        if not runs:
+            return None
+
+        with metrics.timer('merge'):
+            # Merge in passes until the runs can all be open at once
+            merge_pass = 0
+            while len(runs) > fan_in:
+                merged_runs = []
+                for start in range(0, len(runs), fan_in):
+                    merged_runs.append(os.path.join(run_dir, f"merge_{merge_pass}_{start // fan_in:06d}.csv"))
+                    _write_run(merged_runs[-1], _merge_runs(runs[start:start + fan_in]))
+                runs = merged_runs
+                merge_pass += 1
+
+            rows_read = rows_written = 0
+            day_rows = []
+            seen = {}
+            current_ordinal = None
+            with atomic_write(output_path, newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(CSV_FIELDNAMES)
+                for ordinal, row in _merge_runs(runs):
+                    rows_read += 1
+                    if ordinal != current_ordinal:
+                        writer.writerows(day_rows)
+                        day_rows = []
+                        seen.clear()
+                        current_ordinal = ordinal
+                    key = (row[0], row[7], row[2], row[4], row[5])
+                    kept = seen.get(key)
+                    if kept is not None:
+                        # Rows from older CSVs have no item ID; take it from the newer duplicate
+                        if not kept[6]:
+                            kept[6] = row[6]
+                        continue
+                    seen[key] = row
+                    day_rows.append(row)
+                    rows_written += 1
+                writer.writerows(day_rows)
+        metrics.count('rows_read', rows_read)
+        metrics.count('rows_written', rows_written)
+        metrics.count('rows_duplicate', rows_read - rows_written)
+        return output_path
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+def find_csv_files(output_dir):
+    """
+    Returns:
+        list: The order CSVs directly in output_dir, sorted by name.
+    """
+    return [os.path.join(output_dir, file_name) for file_name in sorted(os.listdir(output_dir))
+            if file_name.endswith('.csv')]
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Merge the order CSVs into one date-sorted CSV without duplicate rows.")
+    arg_parser.add_argument('--output-dir', default="output",
+                            help="The directory holding the CSVs written by har_parser.py (default: output).")
+    arg_parser.add_argument('--output', default=None,
+                            help="The consolidated CSV to write "
+                                 f"(default: <output-dir>/{COMPACTED_DIR}/{COMPACTED_FILE}).")
+    arg_parser.add_argument('--profile', metavar='PATH',
+                            help="Save per-stage timings and counters for the run to this JSON file.")
+    args = arg_parser.parse_args()
+    configure_logging()
+
+    if not os.path.isdir(args.output_dir):
+        print(f"Error: The directory '{args.output_dir}' was not found.")
+    else:
+        csv_paths = find_csv_files(args.output_dir)
+        output_path = args.output or os.path.join(args.output_dir, COMPACTED_DIR, COMPACTED_FILE)
+        metrics = RunMetrics()
+
+        def run():
+            if compact_csvs(csv_paths, output_path, metrics) is None:
+                print(f"No CSV rows found in '{args.output_dir}'.")
+                return
+            logger.info("Merged %d rows from %d CSV files into '%s', dropping %d duplicates.",
+                        metrics.counters['rows_written'], len(csv_paths), output_path,
+                        metrics.counters['rows_duplicate'])
+
+        if args.profile:
+            run_with_profile(run, metrics, args.profile)
+        else:
+            run()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+@contextmanager
+def atomic_write(path, mode='w', newline=None):
+    """
+    Opens a new temp file next to `path` for writing and renames it over
+    `path` when the block ends, so readers see either the old file or the
+    complete new one. Each call gets its own temp file, so concurrent writers
+    never write into each other's. If the block raises, the temp file is
+    removed and `path` is left as it was.
+
+    Args:
+        path (str): The file to write.
+        mode (str): 'w' to write text as UTF-8, or 'wb' to write bytes.
+        newline (str): Passed to open() for text, such as '' for the csv module.
+
+    Yields:
+        The open temp file.
+    """
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory or '.')
+    try:
+        try:
+            if 'b' in mode:
+                f = os.fdopen(fd, mode)
+            else:
+                f = os.fdopen(fd, mode, newline=newline, encoding='utf-8')
+        except BaseException:
+            os.close(fd)
+            raise
+        with f:
+            yield f
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from har_files import atomic_write
+
+MANIFEST_FILE = '.har_manifest.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(file_path, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Computes the SHA-256 of a file without reading it into memory all at once.
+
+    Args:
+        file_path (str): The path to the file.
+        chunk_size (int): How many bytes to hash at a time.
+
+    Returns:
+        str: The hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class HarManifest:
+    """
+    Records which HAR files have already been turned into CSVs.
+
+    The manifest lives in the output directory as a JSON file keyed by the
+    absolute path of each HAR. Every record holds the file's size, mtime,
+    content hash, the CSV it produced and the order IDs it contained. A file
+    whose size and mtime match its record is known to be unchanged without
+    reading it. Otherwise its hash is computed and compared with the hashes of
+    every recorded file, so a capture that was copied or touched is still
+    recognised.
+
+    Args:
+        output_dir (str): The directory holding the CSV files and the manifest.
+    """
+
+    def __init__(self, output_dir):
+        self.manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+        self.files = self._load()
+        self._paths_by_hash = {record['sha256']: path for path, record in self.files.items()}
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('files', {})
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read the manifest '{self.manifest_path}'. Starting a new one. Error: {e}")
+            return {}
+
+    def find(self, har_file_path):
+        """
+        Looks up the manifest record for a HAR file, hashing it only if needed.
+
+        Args:
+            har_file_path (str): The path to the .har file.
+
+        Returns:
+            tuple: The matching record (or None) and the file's SHA-256 (or None
+                if it did not need to be computed).
+        """
+        stat = os.stat(har_file_path)
+        record = self.files.get(os.path.abspath(har_file_path))
+        if record and record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns:
+            return record, record['sha256']
+
+        sha256 = file_sha256(har_file_path)
+        path = self._paths_by_hash.get(sha256)
+        return (self.files[path] if path else None), sha256
+
+    def record(self, har_file_path, sha256, output_csv_path, order_ids):
+        """
+        Adds or replaces the record for a HAR file that has just been parsed.
+
+        Args:
+            har_file_path (str): The path to the .har file.
+            sha256 (str): The file's SHA-256, or None to compute it now.
+            output_csv_path (str): The CSV that was written, or None.
+            order_ids (list): The order IDs found in the file.
+        """
+        stat = os.stat(har_file_path)
+        sha256 = sha256 or file_sha256(har_file_path)
+        path = os.path.abspath(har_file_path)
+        self.files[path] = {
+            'sha256': sha256,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'csv_path': output_csv_path,
+            'order_ids': order_ids,
+            'processed_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        self._paths_by_hash[sha256] = path
+
+    def save(self):
+        """
+        Writes the manifest.
+        """
+        os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+        with atomic_write(self.manifest_path) as f:
+            json.dump({'files': self.files}, f, indent=2)
@@ -0,0 +1,136 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+LOG_FORMAT = '%(message)s'
+PROFILE_TOP_FUNCTIONS = 25
+
+logger = logging.getLogger(__name__)
+
+def configure_logging(verbose=False):
+    """
+    Sends log messages to the console, with per-request detail when `verbose`.
+    """
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO, format=LOG_FORMAT)
+
+class RunMetrics:
+    """
+    Counters and per-stage timers for one run of har_parser.py or historical_prices.py.
+
+    Timers accumulate seconds per stage name, so a stage entered once per
+    entry or item adds up to its total cost for the run. Metrics from worker
+    processes travel back as to_dict() output and are combined with merge().
+    """
+
+    def __init__(self):
+        self.counters = Counter()
+        self.timers = Counter()
+        self.started = time.perf_counter()
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def add_time(self, name, seconds):
+        self.timers[name] += seconds
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += time.perf_counter() - start
+
+    def timed_iter(self, iterable, name):
+        """
+        Yields from an iterable, adding the time spent producing each item to `name`.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.timers[name] += time.perf_counter() - start
+                return
+            self.timers[name] += time.perf_counter() - start
+            yield item
+
+    def merge(self, metrics):
+        """
+        Adds the counters and timers of another run, as returned by its to_dict().
+        """
+        self.counters.update(metrics.get('counters', {}))
+        self.timers.update(metrics.get('timers', {}))
+
+    def to_dict(self):
+        return {
+            'wall_time': round(time.perf_counter() - self.started, 6),
+            'timers': {name: round(seconds, 6) for name, seconds in sorted(self.timers.items())},
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def log_summary(self):
+        data = self.to_dict()
+        logger.info("Metrics (wall time %.3fs):", data['wall_time'])
+        for name, seconds in data['timers'].items():
+            logger.info("  %-24s %10.3fs", name, seconds)
+        for name, value in data['counters'].items():
+            logger.info("  %-24s %10d", name, value)
+
+def run_with_profile(function, metrics, profile_path=None, use_cprofile=False):
+    """
+    Runs a function and saves its metrics, optionally under cProfile.
+
+    Args:
+        function (callable): The run to measure, taking no arguments.
+        metrics (RunMetrics): The metrics the run records into.
+        profile_path (str): Write the metrics to this JSON file. With
+            use_cprofile, the raw profile is saved next to it with a '.prof'
+            suffix, for pstats or snakeviz.
+        use_cprofile (bool): Run the function under cProfile and add the most
+            expensive functions, by cumulative time, to the JSON.
+
+    Returns:
+        The function's return value.
+    """
+    profiler = cProfile.Profile() if use_cprofile else None
+    if profiler:
+        profiler.enable()
+    try:
+        return function()
+    finally:
+        if profiler:
+            profiler.disable()
+        metrics.log_summary()
+        if profile_path:
+            _save_profile(profile_path, metrics, profiler)
+
+def _save_profile(profile_path, metrics, profiler):
+    data = metrics.to_dict()
+    if profiler:
+        stats_path = os.path.splitext(profile_path)[0] + '.prof'
+        profiler.dump_stats(stats_path)
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        data['cprofile'] = {'stats_file': stats_path, 'top_functions': [
+            {
+                'function': f"{os.path.basename(file_name)}:{line}({function_name})",
+                'calls': calls,
+                'total_time': round(total_time, 6),
+                'cumulative_time': round(cumulative_time, 6),
+            }
+            for (file_name, line, function_name), (_, calls, total_time, cumulative_time, _)
+            in sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_FUNCTIONS]
+        ]}
+    try:
+        with open(profile_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        logger.info("Profile saved to '%s'", profile_path)
+    except OSError as e:
+        print(f"Warning: Could not save the profile '{profile_path}'. Error: {e}")
@@ -1,183 +1,706 @@
 import json
-import sys
-import csv
 import os
-from datetime import datetime
-import re
+import argparse
+import glob
+import logging
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
 
-def get_item_type(item_name):
+from har_cache import ORDER_CACHE_SUFFIX, OrderCacheReader, OrderCacheSink, is_order_cache
+from har_classifier import RULES_FILE, RuleClassifier
+from har_files import atomic_write
+from har_stream import HarDecompressionError, HarEntryScanner, HarOrderPrefilter, open_har
+from har_manifest import HarManifest
+from har_metrics import RunMetrics, configure_logging, run_with_profile
+from har_products import PRODUCT_INDEX_FILE, ProductIndex
+from har_records import extract_order, loads, parse_order_date
+from har_sinks import CsvSink, JsonLinesSink, SqliteSink
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_FILE = 'food_or_non_food.json'
+# Saved next to the category file, e.g. 'food_or_non_food.classified.json'
+CLASSIFIED_SUFFIX = '.classified.json'
+SQLITE_FILE = 'walmart_orders.db'
+
+class CategoryStore:
+    """
+    Keeps the contents of food_or_non_food.json in memory for the length of a run.
+
+    The file is read once when the store is created. New items are classified
+    by the rules in the rules file, or recorded as 'unknown' if none match, and
+    items already in the file as 'unknown' get another chance with the rules.
+    Types set to 'food' or 'nonfood' in the file are never changed, except by
+    reclassify(rerun=True) for the types a rule set.
+
+    The type and rule of every item classified by a rule are kept in a
+    sidecar next to the category file (CLASSIFIED_SUFFIX), so they can be
+    told apart from types set by hand. An entry whose type no longer matches
+    the category file was changed by hand and is dropped. Changes
+    are kept in memory and written back by flush(), either once at the end of
+    a run or every `flush_every` changes. Writes go to a temporary file that is
+    then renamed over the original, so an interrupted run never leaves a
+    truncated JSON file behind.
+
+    Args:
+        json_file_path (str): The path to the category JSON file.
+        flush_every (int): Flush after this many new items. None only flushes
+            when flush() is called.
+        rules_file (str): The classification rules (see RuleClassifier), or
+            None to record every new item as 'unknown'.
+    """
+
+    def __init__(self, json_file_path=CATEGORY_FILE, flush_every=None, rules_file=RULES_FILE):
+        self.json_file_path = json_file_path
+        self.flush_every = flush_every
+        self.item_data = self._load()
+        self.classified_path = os.path.splitext(json_file_path)[0] + CLASSIFIED_SUFFIX
+        # {item_name: [item_type, rule_name]} for every type a rule set
+        self.classified = self._load_classified()
+        self.classifier = RuleClassifier.from_file(rules_file) if rules_file else None
+        # The items added or classified by this store, and the rule behind each classification
+        self.new_items = []
+        self.matched_rules = {}
+        self._unsaved = 0
+        self._classified_changed = False
+
+    def _load(self):
+        # Check if the JSON file exists and load it, otherwise start with an empty dictionary
+        if os.path.exists(self.json_file_path):
+            with open(self.json_file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def _load_classified(self):
+        if not os.path.exists(self.classified_path):
+            return {}
+        with open(self.classified_path, 'r', encoding='utf-8') as f:
+            classified = json.load(f)
+        return {item_name: entry for item_name, entry in classified.items()
+                if self.item_data.get(item_name) == entry[0]}
+
+    def get_type(self, item_name):
+        """
+        Returns the type of an item, classifying it or recording it as 'unknown' if it is new.
+
+        Args:
+            item_name (str): The name of the item.
+
+        Returns:
+            str: The type of the item ('food', 'nonfood', or 'unknown').
+        """
+        item_type = self.item_data.get(item_name)
+        if item_type is not None and item_type != 'unknown':
+            return item_type
+
+        classification = self.classifier.classify(item_name) if self.classifier else None
+        if classification is None:
+            if item_type is not None:
+                return item_type
+            new_type = 'unknown'
+        else:
+            new_type, rule_name = classification
+            self.matched_rules[item_name] = rule_name
+            self.classified[item_name] = [new_type, rule_name]
+            self._classified_changed = True
+            logger.debug("Classified '%s' as %s by rule '%s'", item_name, new_type, rule_name)
+
+        self.item_data[item_name] = new_type
+        self.new_items.append(item_name)
+        self._unsaved += 1
+        if self.flush_every and self._unsaved >= self.flush_every:
+            self.flush()
+        return new_type
+
+    def reclassify(self, rerun=False):
+        """
+        Runs the rules over every item still marked 'unknown'.
+
+        Args:
+            rerun (bool): Also run them again over the items a rule classified
+                before, such as after the rules have changed. Items no rule
+                matches any more go back to 'unknown'. Types set by hand are
+                never changed.
+
+        Returns:
+            dict: {item_name: (item_type, rule_name)} for each item a rule matched.
+        """
+        item_names = [item_name for item_name, item_type in self.item_data.items()
+                      if item_type == 'unknown' or (rerun and item_name in self.classified)]
+        matched_items = {}
+        for item_name in item_names:
+            if self.classified.pop(item_name, None) is not None:
+                self.item_data[item_name] = 'unknown'
+                self._classified_changed = True
+                self._unsaved += 1
+            item_type = self.get_type(item_name)
+            if item_type != 'unknown':
+                matched_items[item_name] = (item_type, self.matched_rules[item_name])
+        return matched_items
+
+    def flush(self):
+        """
+        Writes any new items back to the JSON file.
+
+        The sidecar of rule-set types is written first, so an interrupted
+        flush never leaves a type set by a rule looking like it was set by hand.
+        """
+        if not self._unsaved:
+            return
+        if self._classified_changed:
+            with atomic_write(self.classified_path) as f:
+                json.dump(self.classified, f, indent=2)
+            self._classified_changed = False
+        with atomic_write(self.json_file_path) as f:
+            json.dump(self.item_data, f, indent=2)
+        self._unsaved = 0
+
+def get_item_type(item_name, category_store=None):
     """
     Checks and updates a local JSON file to determine if an item is a food, nonfood, or unknown.
 
     Args:
         item_name (str): The name of the item.
+        category_store (CategoryStore): A loaded store to look the item up in. When
+            omitted, the JSON file is loaded and saved for this single lookup.
 
     Returns:
         str: The type of the item ('food', 'nonfood', or 'unknown').
     """
-    json_file_path = 'food_or_non_food.json'
-    
-    # Check if the JSON file exists and load it, otherwise start with an empty dictionary
-    if os.path.exists(json_file_path):
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            item_data = json.load(f)
-    else:
-        item_data = {}
+    if category_store is not None:
+        return category_store.get_type(item_name)
 
-    # If the item name is in the JSON, return its type
-    if item_name in item_data:
-        return item_data[item_name]
-    else:
-        # If not, add it with 'unknown' and save the updated file
-        item_data[item_name] = 'unknown'
-        with open(json_file_path, 'w', encoding='utf-8') as f:
-            json.dump(item_data, f, indent=2)
-        return 'unknown'
+    store = CategoryStore()
+    item_type = store.get_type(item_name)
+    store.flush()
+    return item_type
+
+ORDER_URL_FRAGMENT = '/orchestra/orders/graphql/getOrder/'
+
+# A recursive function to find and remove 'callFrames'
+def remove_callframes_recursive(d):
+    if isinstance(d, dict):
+        if 'callFrames' in d:
+            del d['callFrames']
+        for key, value in d.items():
+            remove_callframes_recursive(value)
 
-def parse_walmart_har(har_file_path, output_dir):
+def is_order_entry(entry):
+    """
+    Checks whether a HAR entry is a getOrder request made by the orders page.
+
+    Args:
+        entry (dict): A single entry from the HAR 'log.entries' list.
+
+    Returns:
+        bool: True if the entry holds an order response.
+    """
+    url = entry['request']['url']
+    resource_type = entry.get('_resourceType', 'N/A')
+    return ORDER_URL_FRAGMENT in url and resource_type in ['xhr', 'fetch']
+
+def parse_order_entry(entry, category_store=None, metrics=None):
+    """
+    Extracts the order date and line items from a matching getOrder HAR entry.
+
+    Args:
+        entry (dict): A HAR entry for which is_order_entry() is True.
+        category_store (CategoryStore): The store used to classify items.
+        metrics (RunMetrics): Records the time spent decoding and classifying.
+
+    Returns:
+        tuple: The order ID, the order date and a list of OrderItem records, or
+            None if the entry could not be parsed.
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    logger.debug("Found a matching request: %s", entry['request']['url'])
+
+    # Remove header and call stack information to make the file cleaner
+    if 'headers' in entry['request']:
+        del entry['request']['headers']
+    if 'headers' in entry['response']:
+        del entry['response']['headers']
+    if '_initiator' in entry:
+        remove_callframes_recursive(entry['_initiator'])
+
+    start = perf_counter()
+    try:
+        # The order data is a JSON string located in the 'text' key
+        response_json_text = entry['response']['content']['text']
+        response_json = loads(response_json_text)
+    except (KeyError, json.JSONDecodeError) as e:
+        print(f"Warning: Failed to parse data from a matching request. Error: {e}")
+        return None
+    finally:
+        metrics.add_time('decode', perf_counter() - start)
+
+    def classify(item_name):
+        start = perf_counter()
+        item_type = get_item_type(item_name, category_store)
+        metrics.add_time('classify', perf_counter() - start)
+        return item_type
+
+    order = extract_order(response_json, classify)
+    if order is None:
+        print("Warning: Could not find order ID or title. Skipping this request.")
+        return None
+    logger.debug("--> Successfully extracted data for Order ID: %s", order.order_id)
+    for order_item in order.line_items:
+        logger.debug("----> Collected item: %s (Type: %s)", order_item.item_name, order_item.is_food)
+
+    return order.order_id, order.order_date, order.line_items
+
+def iter_order_items(entries, category_store=None, order_ids=None, metrics=None, product_index=None,
+                     order_cache=None):
+    """
+    Yields the line items of every getOrder response in a sequence of HAR entries.
+
+    This is the extraction core behind parse_walmart_har. It works on any
+    iterable of entries (a loaded HAR, HarEntryScanner, HarOrderPrefilter) and
+    yields records as each order is parsed, so callers can stream them
+    anywhere without going through a CSV.
+
+    Args:
+        entries (iterable): HAR entries, as dicts.
+        category_store (CategoryStore): The store used to classify items.
+        order_ids (list): When given, the ID of every parsed order is appended to it.
+        metrics (RunMetrics): Records the time spent reading ('load'), matching
+            ('filter'), decoding and classifying, and counts the entries scanned,
+            matched and skipped, the orders parsed or failed and the items collected.
+        product_index (ProductIndex): When given, every item with an item ID is
+            recorded in it under its name and order date.
+        order_cache (OrderCacheSink): When given, every matching entry is
+            written to it, including those that fail to parse.
+
+    Yields:
+        OrderItem: One record per line item.
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    for entry in metrics.timed_iter(entries, 'load'):
+        metrics.count('entries_scanned')
+        # Check if the URL and resource type match our criteria
+        start = perf_counter()
+        is_order = is_order_entry(entry)
+        metrics.add_time('filter', perf_counter() - start)
+        if not is_order:
+            metrics.count('entries_skipped')
+            continue
+        metrics.count('entries_matched')
+        if order_cache is not None:
+            with metrics.timer('cache'):
+                order_cache.write(entry)
+        parsed_order = parse_order_entry(entry, category_store, metrics)
+        if parsed_order is None:
+            metrics.count('orders_failed')
+            continue
+        order_id, order_date, order_items = parsed_order
+        metrics.count('orders_parsed')
+        metrics.count('items_collected', len(order_items))
+        if order_ids is not None:
+            order_ids.append(order_id)
+        if product_index is not None:
+            _index_products(product_index, order_date, order_items)
+        yield from order_items
+
+def _index_products(product_index, order_date, order_items):
+    try:
+        order_day = parse_order_date(order_date).date().isoformat()
+    except ValueError:
+        # The title had no recognisable date, so there is nothing to rank the names by
+        return
+    for order_item in order_items:
+        if order_item.item_id:
+            product_index.add(order_item.item_id, order_item.item_name, order_day)
+
+def parse_walmart_har(har_file_path, output_dir, category_store=None, stream=False, prefilter=False,
+                      offset_index=False, sink=None, metrics=None, product_index=None, order_cache_dir=None,
+                      har_sha256=None):
     """
     Parses a HAR file to extract and save Walmart order item details to a CSV.
 
+    Items are written to the sink as they are parsed, so nothing is held in
+    memory beyond the order currently being read. Captures compressed with
+    gzip, bzip2 or xz, or inside a zip archive, are decompressed as they are
+    read in every mode (see open_har). An order cache written with
+    `order_cache_dir` can be parsed in place of the HAR it came from, and is
+    recognised by its header whatever the other options.
+
     Args:
-        har_file_path (str): The path to the .har file.
+        har_file_path (str): The path to the .har file, compressed or not, or to an order cache.
         output_dir (str): The directory where the CSV file will be created.
+        category_store (CategoryStore): The store used to classify items. When
+            omitted, one is loaded for this run and flushed when parsing ends.
+            A store passed in by the caller is left for the caller to flush.
+        stream (bool): Read 'log.entries' one entry at a time instead of loading
+            the whole file, keeping memory bounded on very large captures.
+        prefilter (bool): Scan the raw (memory-mapped) bytes for entries that
+            mention the getOrder URL and only decode those.
+        offset_index (bool): With prefilter, save the offsets of the matching
+            entries next to the HAR and reuse them on later runs.
+        sink: Where the items go (CsvSink, JsonLinesSink, SqliteSink, ListSink, ...).
+            Defaults to a CsvSink in output_dir.
+        metrics (RunMetrics): Records the per-stage times and counters of the
+            run (see iter_order_items), plus the time spent writing.
+        product_index (ProductIndex): Records the item ID and name of every item.
+            The caller saves it.
+        order_cache_dir (str): Also save the getOrder entries to an order cache
+            named '<har name>.orders.jsonl' in this directory (see OrderCacheSink).
+            Ignored when the input is an order cache itself.
+        har_sha256 (str): The HAR's SHA-256, if the caller already has it, so
+            the order cache doesn't hash the file again.
+
+    Returns:
+        dict: The 'output' returned by the sink's close() (for files, the path
+            written, or None if no items were found), the 'order_ids' found in
+            the file and the 'order_cache' written (or None), or None if the file
+            could not be read.
     """
-    all_order_items = []
-    order_dates = []
+    order_ids = []
+    if sink is None:
+        sink = CsvSink(output_dir)
+    if metrics is None:
+        metrics = RunMetrics()
+    scanner = None
     
     try:
-        with open(har_file_path, 'r', encoding='utf-8') as f:
-            har_data = json.load(f)
+        with metrics.timer('load'):
+            cache_input = is_order_cache(har_file_path)
+            if cache_input:
+                scanner = OrderCacheReader(har_file_path)
+            elif prefilter:
+                scanner = HarOrderPrefilter(har_file_path, ORDER_URL_FRAGMENT.encode('utf-8'),
+                                            use_index=offset_index)
+            elif stream:
+                scanner = HarEntryScanner(open_har(har_file_path))
+            else:
+                with open_har(har_file_path) as f:
+                    har_data = loads(f.read())
     except FileNotFoundError:
         print(f"Error: The file '{har_file_path}' was not found.")
         return
+    except HarDecompressionError as e:
+        print(f"Error: Could not decompress '{har_file_path}'. Error: {e}")
+        return
     except json.JSONDecodeError:
         print(f"Error: Could not decode the JSON from '{har_file_path}'. Is it a valid HAR file?")
         return
 
-    print("HAR file loaded. Parsing requests for order details...")
-    
-    # Check if 'log' and 'entries' keys exist
-    if 'log' not in har_data or 'entries' not in har_data['log']:
+    if cache_input:
+        logger.info("Reading the order cache '%s'...", har_file_path)
+        entries = iter(scanner)
+    elif prefilter:
+        logger.info("Scanning '%s' for order requests...", har_file_path)
+        entries = iter(scanner)
+    elif stream:
+        logger.info("Streaming '%s'. Parsing requests for order details...", har_file_path)
+        entries = iter(scanner)
+    else:
+        logger.info("Loaded '%s'. Parsing requests for order details...", har_file_path)
+
+        # Check if 'log' and 'entries' keys exist
+        if 'log' not in har_data or 'entries' not in har_data['log']:
+            print("Error: The HAR file structure is invalid. 'log' or 'entries' key is missing.")
+            return
+        entries = har_data['log']['entries']
+
+    order_cache = None
+    if order_cache_dir is not None and not cache_input:
+        order_cache = OrderCacheSink(os.path.join(order_cache_dir, har_base_name(har_file_path) + ORDER_CACHE_SUFFIX),
+                                     har_file_path, sha256=har_sha256)
+
+    def discard_outputs():
+        sink.discard()
+        if order_cache is not None:
+            order_cache.discard()
+
+    owns_category_store = category_store is None
+    if owns_category_store:
+        category_store = CategoryStore()
+
+    # Iterate through all network requests (entries) and stream the items to the sink
+    try:
+        for order_item in iter_order_items(entries, category_store, order_ids, metrics, product_index, order_cache):
+            start = perf_counter()
+            sink.write(order_item)
+            metrics.add_time('write', perf_counter() - start)
+    except json.JSONDecodeError:
+        discard_outputs()
+        print(f"Error: Could not decode the JSON from '{har_file_path}'. Is it a valid HAR file?")
+        return
+    except HarDecompressionError as e:
+        discard_outputs()
+        print(f"Error: Could not decompress '{har_file_path}'. Error: {e}")
+        return
+    except OSError as e:
+        discard_outputs()
+        print(f"Error: Could not write the order items. Error: {e}")
+        return
+    except BaseException:
+        # Anything else is the caller's to handle, but not with a temp file or transaction left open
+        discard_outputs()
+        raise
+    finally:
+        if scanner is not None:
+            scanner.close()
+        if owns_category_store:
+            category_store.flush()
+
+    if scanner is not None and not scanner.found_entries:
+        discard_outputs()
         print("Error: The HAR file structure is invalid. 'log' or 'entries' key is missing.")
         return
 
-    # A recursive function to find and remove 'callFrames'
-    def remove_callframes_recursive(d):
-        if isinstance(d, dict):
-            if 'callFrames' in d:
-                del d['callFrames']
-            for key, value in d.items():
-                remove_callframes_recursive(value)
+    order_cache_path = None
+    if order_cache is not None:
+        try:
+            with metrics.timer('cache'):
+                order_cache_path = order_cache.close()
+        except OSError as e:
+            order_cache.discard()
+            print(f"Warning: Could not write the order cache. Error: {e}")
+        except BaseException:
+            discard_outputs()
+            raise
+        if order_cache_path:
+            logger.info("Saved %d orders to '%s'.", order_cache.count, order_cache_path)
     
-    # Iterate through all network requests (entries)
-    for entry in har_data['log']['entries']:
-        url = entry['request']['url']
-        resource_type = entry.get('_resourceType', 'N/A')
+    # Check if any data was collected before finishing the output
+    if not sink.count:
+        logger.info("No item data was collected from '%s'. The CSV file was not created.", har_file_path)
+        return {'output': sink.close(), 'order_ids': order_ids, 'order_cache': order_cache_path}
 
-        # Check if the URL and resource type match our criteria
-        if ('/orchestra/orders/graphql/getOrder/' in url and
-            resource_type in ['xhr', 'fetch']):
-            print(f"Found a matching request: {url}")
-            
-            # Remove header and call stack information to make the file cleaner
-            if 'headers' in entry['request']:
-                del entry['request']['headers']
-            if 'headers' in entry['response']:
-                del entry['response']['headers']
-            if '_initiator' in entry:
-                remove_callframes_recursive(entry['_initiator'])
-
-            try:
-                # The order data is a JSON string located in the 'text' key
-                response_json_text = entry['response']['content']['text']
-                response_json = json.loads(response_json_text)
-                
-                # Navigate to the order data within the JSON
-                order_data = response_json.get('data', {}).get('order', {})
-                order_id = order_data.get('id')
-                
-                # Get the order date from the 'title' field
-                order_title = order_data.get('title')
-
-                if not order_id or not order_title:
-                    print("Could not find order ID or title. Skipping this request.")
-                    continue
-
-                # Use a regular expression to extract only the date portion
-                date_match = re.search(r'([A-Za-z]+\s+\d{1,2},\s+\d{4})', order_title)
-                order_date = date_match.group(1) if date_match else order_title
-
-                print(f"--> Successfully extracted data for Order ID: {order_id}")
-                
-                # We need to loop through the order groups to find the items
-                groups = order_data.get('groups_2101', [])
-                for group in groups:
-                    items = group.get('items', [])
-                    
-                    for item in items:
-                        item_name = item.get('productInfo', {}).get('name')
-                        quantity = item.get('quantity')
-                        price = item.get('priceInfo', {}).get('linePrice', {}).get('value')
-                        
-                        if item_name and quantity is not None and price is not None:
-                            # Use the new function to get the item type
-                            item_type = get_item_type(item_name)
-                            all_order_items.append({
-                                'order_id': order_id,
-                                'order_date': order_date,
-                                'item_name': item_name,
-                                'is_food': item_type,
-                                'quantity': quantity,
-                                'price': price
-                            })
-                            print(f"----> Collected item: {item_name} (Type: {item_type})")
-                
-                # Add the date string to our list for filename creation
-                order_dates.append(order_date)
-
-            except (KeyError, json.JSONDecodeError) as e:
-                print(f"Warning: Failed to parse data from a matching request. Error: {e}")
-                continue
-    
-    # Check if any data was collected before trying to write the CSV
-    if not all_order_items:
-        print("\nNo item data was collected. The CSV file was not created.")
+    try:
+        with metrics.timer('write'):
+            output = sink.close()
+    except (OSError, sqlite3.Error) as e:
+        sink.discard()
+        print(f"Error: Could not write the order items. Error: {e}")
         return
-        
-    # Dynamically generate the output filename based on min/max dates
-    if order_dates:
-        # We need to parse the date strings to find the min and max
-        # The format is now guaranteed to be 'Mon DD, YYYY'
-        date_objects = [datetime.strptime(d, '%b %d, %Y') for d in order_dates]
-        start_date = min(date_objects).strftime('%Y-%m-%d')
-        end_date = max(date_objects).strftime('%Y-%m-%d')
-        output_csv_filename = f"{start_date}_{end_date}_walmart_order_items.csv"
-    else:
-        output_csv_filename = "walmart_order_items.csv" # Fallback filename
+    except BaseException:
+        sink.discard()
+        raise
 
-    # Create the output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
-    output_csv_path = os.path.join(output_dir, output_csv_filename)
-    
-    # Write the data to a CSV file
+    if isinstance(output, str):
+        logger.info("Successfully saved all item data to '%s'.", output)
+    return {'output': output, 'order_ids': order_ids, 'order_cache': order_cache_path}
+
+HAR_FILE_PATTERNS = ('*.har', '*.har.gz', '*.har.bz2', '*.har.xz', '*.zip')
+COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.xz', '.zip')
+
+def find_har_files(inputs):
+    """
+    Expands a list of HAR files, directories and glob patterns into HAR file paths.
+
+    Args:
+        inputs (list): File paths, directories (searched for HAR files matching
+            HAR_FILE_PATTERNS, compressed or not) or glob patterns.
+
+    Returns:
+        list: The matching file paths, in a stable order and without duplicates.
+    """
+    har_file_paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            matches = sorted(match for pattern in HAR_FILE_PATTERNS
+                             for match in glob.glob(os.path.join(path, pattern)))
+        elif glob.has_magic(path):
+            matches = sorted(glob.glob(path))
+        else:
+            matches = [path]
+        for match in matches:
+            if match not in har_file_paths:
+                har_file_paths.append(match)
+    return har_file_paths
+
+def har_base_name(har_file_path):
+    """
+    Returns the HAR's file name without its extension or compression suffix.
+    """
+    har_name = os.path.basename(har_file_path)
+    if har_name.lower().endswith(COMPRESSED_SUFFIXES):
+        har_name = os.path.splitext(har_name)[0]
+    return os.path.splitext(har_name)[0]
+
+def make_sink(output_format, har_file_path, output_dir):
+    """
+    Creates the sink for one HAR file's items.
+
+    Args:
+        output_format (str): 'csv' for a date-range CSV, 'jsonl' for a JSON
+            Lines file named after the HAR file, or 'sqlite' to upsert into
+            the shared database in output_dir.
+        har_file_path (str): The path to the .har file.
+        output_dir (str): The directory where the file will be created.
+    """
+    if output_format == 'sqlite':
+        return SqliteSink(os.path.join(output_dir, SQLITE_FILE))
+    if output_format == 'jsonl':
+        return JsonLinesSink(os.path.join(output_dir, f"{har_base_name(har_file_path)}_walmart_order_items.jsonl"))
+    return CsvSink(output_dir)
+
+def _parse_har_in_worker(har_file_path, output_dir, category_file, rules_file, output_format, parse_options,
+                         log_level):
+    """
+    Parses one HAR file in a worker process.
+
+    The worker classifies items against its own read-only copy of the category
+    file and hands the names it has added or classified back to the parent,
+    which is the only process that writes the file. The item IDs it finds go
+    back the same way, for the parent to merge into the product index.
+
+    An unexpected error is reported and the file counted as failed, like a
+    file that can't be read, so one bad capture doesn't stop the batch.
+
+    Returns:
+        tuple: The result of parse_walmart_har, the list of new item names, the
+            products seen (ProductIndex.products) and the run's metrics as a dict.
+    """
+    # Spawned workers (the default on Windows and macOS) don't inherit the logging setup
+    if not logging.getLogger().handlers:
+        configure_logging(log_level <= logging.DEBUG)
+    metrics = RunMetrics()
+    category_store = CategoryStore(category_file, rules_file=rules_file)
+    product_index = ProductIndex()
     try:
-        with open(output_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['order_id', 'order_date', 'item_name', 'is_food', 'quantity', 'price']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            writer.writerows(all_order_items)
-        
-        print(f"\nSuccessfully saved all item data to '{output_csv_path}'.")
-    except IOError as e:
-        print(f"Error: Could not write to file '{output_csv_path}'. Error: {e}")
+        sink = make_sink(output_format, har_file_path, output_dir)
+        result = parse_walmart_har(har_file_path, output_dir, category_store=category_store, sink=sink,
+                                   metrics=metrics, product_index=product_index, **parse_options)
+    except Exception as e:
+        print(f"Error: Could not parse '{har_file_path}'. Error: {e}")
+        return None, [], {}, metrics.to_dict()
+    return result, category_store.new_items, product_index.products, metrics.to_dict()
+
+def parse_har_batch(har_file_paths, output_dir, jobs=None, category_file=CATEGORY_FILE, rules_file=RULES_FILE,
+                    use_manifest=False, force=False, output_format='csv', metrics=None, **parse_options):
+    """
+    Parses many HAR files concurrently, one CSV per HAR, using a process pool.
+
+    New item names found by the workers are merged into the category file once,
+    in input order, after every file has been parsed, and their item IDs into
+    the product index in the output directory (see ProductIndex).
+
+    Args:
+        har_file_paths (list): The .har files to parse.
+        output_dir (str): The directory where the CSV files will be created.
+        jobs (int): The number of worker processes. Defaults to the CPU count;
+            1 parses the files in this process.
+        category_file (str): The path to the category JSON file.
+        rules_file (str): The classification rules, or None to record new items as 'unknown'.
+        use_manifest (bool): Skip HAR files recorded as already processed in the
+            output directory's manifest, and record the ones parsed now.
+        force (bool): With use_manifest, parse recorded files again anyway.
+        output_format (str): 'csv', 'jsonl' or 'sqlite', see make_sink().
+        metrics (RunMetrics): Collects the metrics of every file, plus the
+            number of files parsed, skipped and failed.
+        **parse_options: Passed through to parse_walmart_har (stream, prefilter, ...).
+
+    Returns:
+        dict: The result of parse_walmart_har for each HAR file that was parsed.
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    manifest = HarManifest(output_dir) if use_manifest else None
+    file_hashes = {}
+    if manifest:
+        pending_paths = []
+        for har_file_path in har_file_paths:
+            if not os.path.exists(har_file_path):
+                # Let parse_walmart_har report the missing file.
+                pending_paths.append(har_file_path)
+                continue
+            with metrics.timer('manifest'):
+                record, file_hashes[har_file_path] = manifest.find(har_file_path)
+            if record and not force:
+                logger.info("Skipping '%s': already processed into '%s'.", har_file_path, record['csv_path'])
+                metrics.count('files_skipped')
+                continue
+            pending_paths.append(har_file_path)
+        har_file_paths = pending_paths
+
+    jobs = jobs or os.cpu_count() or 1
+    log_level = logger.getEffectiveLevel()
+    # The manifest has already hashed the files, so the order cache can reuse the hashes
+    worker_args = [(path, output_dir, category_file, rules_file, output_format,
+                    dict(parse_options, har_sha256=file_hashes.get(path)), log_level)
+                   for path in har_file_paths]
+
+    if jobs == 1 or len(har_file_paths) < 2:
+        results = [_parse_har_in_worker(*args) for args in worker_args]
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(har_file_paths))) as executor:
+            results = list(executor.map(_parse_har_in_worker, *zip(*worker_args)))
+
+    category_store = CategoryStore(category_file, rules_file=rules_file)
+    product_index = ProductIndex(os.path.join(output_dir, PRODUCT_INDEX_FILE))
+    har_results = {}
+    for har_file_path, (result, new_items, products, file_metrics) in zip(har_file_paths, results):
+        har_results[har_file_path] = result
+        metrics.merge(file_metrics)
+        metrics.count('files_parsed' if result is not None else 'files_failed')
+        metrics.count('items_new', len(new_items))
+        for item_name in new_items:
+            category_store.get_type(item_name)
+        product_index.merge(products)
+        if manifest and result is not None:
+            manifest.record(har_file_path, file_hashes.get(har_file_path), result['output'], result['order_ids'])
+    metrics.count('items_classified', len(category_store.matched_rules))
+    metrics.count('products_indexed', len(product_index.products))
+    category_store.flush()
+    product_index.save()
+    if manifest:
+        manifest.save()
+
+    written = sum(1 for result in har_results.values() if result and result['output'])
+    logger.info("Parsed %d HAR files and wrote %d files to '%s'.", len(har_file_paths), written, output_dir)
+    return har_results
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python har_parser.py <input_har_file.har>")
-        sys.exit(1)
-    
-    input_har_file = sys.argv[1]
-    output_dir = "output"
-    parse_walmart_har(input_har_file, output_dir)
+    arg_parser = argparse.ArgumentParser(description="Extract Walmart order items from HAR files into CSVs.")
+    arg_parser.add_argument('inputs', nargs='+', help="The .har files to parse (optionally gzip, bzip2, xz or zip compressed), "
+                                                         "or directories / glob patterns of them.")
+    arg_parser.add_argument('--output-dir', default="output", help="Directory for the CSV file (default: output).")
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="Read the HAR one entry at a time to keep memory bounded on large captures.")
+    arg_parser.add_argument('--prefilter', action='store_true',
+                            help="Scan the raw bytes for getOrder entries and only decode those.")
+    arg_parser.add_argument('--index', action='store_true',
+                            help="With --prefilter, save order entry offsets next to the HAR and reuse them.")
+    arg_parser.add_argument('--jobs', type=int, default=None,
+                            help="Worker processes for parsing several HARs (default: CPU count).")
+    arg_parser.add_argument('--format', choices=['csv', 'jsonl', 'sqlite'], default='csv',
+                            help="Write a date-range CSV (default) or a JSON Lines file per HAR, "
+                                 f"or upsert into {SQLITE_FILE} in the output directory.")
+    arg_parser.add_argument('--order-cache', action='store_true',
+                            help="Also save each HAR's getOrder responses to '<name>.orders.jsonl' in the output "
+                                 "directory. Pass those files as inputs later to parse the orders again quickly.")
+    arg_parser.add_argument('--force', action='store_true',
+                            help="Parse HAR files again even if the manifest says they were already processed.")
+    arg_parser.add_argument('--rules', default=RULES_FILE,
+                            help=f"Classify new items with the rules in this file (default: {RULES_FILE}).")
+    arg_parser.add_argument('-v', '--verbose', action='store_true',
+                            help="Log every matching request and collected item.")
+    arg_parser.add_argument('--profile', metavar='PATH',
+                            help="Save per-stage timings and counters for the run to this JSON file.")
+    arg_parser.add_argument('--cprofile', action='store_true',
+                            help="With --profile, also run under cProfile and save the stats next to the JSON. "
+                                 "Only this process is profiled, so use --jobs 1 to profile the parsing itself.")
+    args = arg_parser.parse_args()
+    configure_logging(args.verbose)
+
+    parse_options = {'stream': args.stream, 'prefilter': args.prefilter, 'offset_index': args.index,
+                     'order_cache_dir': args.output_dir if args.order_cache else None}
+    har_file_paths = find_har_files(args.inputs)
+    if not har_file_paths:
+        print("Error: No HAR files matched the given inputs.")
+    else:
+        metrics = RunMetrics()
+        run = lambda: parse_har_batch(har_file_paths, args.output_dir, jobs=args.jobs, rules_file=args.rules,
+                                      use_manifest=True, force=args.force, output_format=args.format,
+                                      metrics=metrics, **parse_options)
+        if args.profile:
+            run_with_profile(run, metrics, args.profile, use_cprofile=args.cprofile)
+        else:
+            run()
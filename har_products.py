@@ -0,0 +1,136 @@
+import json
+import os
+
+from har_files import atomic_write
+
+PRODUCT_INDEX_FILE = 'product_index.json'
+# The getOrder item fields that identify a product, most stable first
+ITEM_ID_FIELDS = ('usItemId', 'offerId')
+
+def get_item_id(item):
+    """
+    Finds the Walmart product ID of a getOrder line item.
+
+    Args:
+        item (dict): One entry of an order group's 'items' list.
+
+    Returns:
+        str: The item's usItemId, or its offerId if it has no usItemId, or ''
+            if it has neither.
+    """
+    product_info = item.get('productInfo') or {}
+    for field in ITEM_ID_FIELDS:
+        item_id = product_info.get(field) or item.get(field)
+        if item_id:
+            return str(item_id)
+    return ''
+
+class ProductIndex:
+    """
+    Maps Walmart item IDs to the names each product has been sold under.
+
+    Walmart renames listings ("Great Value Milk 1 gal" becomes "Great Value
+    Whole Milk, 1 Gallon"), which splits one product's price history across
+    several names. The index records, for every item ID, each name it has
+    appeared under with the date of the latest order that used it. The
+    canonical name is the one on the most recent order, and the others are
+    its aliases.
+
+    The index is a JSON file in the output directory, read once when the index
+    is created and written back by save().
+
+    Args:
+        index_path (str): The path to the index JSON file, or None to keep the
+            index in memory only.
+    """
+
+    def __init__(self, index_path=None):
+        self.index_path = index_path
+        self.products = self._load()
+        self._unsaved = False
+
+    def _load(self):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('products', {})
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read the product index '{self.index_path}'. Starting a new one. Error: {e}")
+            return {}
+
+    def add(self, item_id, item_name, order_day):
+        """
+        Records that a product was ordered under a name.
+
+        Args:
+            item_id (str): The Walmart item ID.
+            item_name (str): The name on the order.
+            order_day (str): The order date in ISO format.
+        """
+        product = self.products.get(item_id)
+        if product is None:
+            product = self.products[item_id] = {'name': item_name, 'names': {}}
+        names = product['names']
+        if order_day <= names.get(item_name, ''):
+            return
+        names[item_name] = order_day
+        if order_day >= names.get(product['name'], ''):
+            product['name'] = item_name
+        self._unsaved = True
+
+    def merge(self, products):
+        """
+        Adds the products recorded by another index, such as a worker's.
+
+        Args:
+            products (dict): The other index's 'products'.
+        """
+        for item_id, product in products.items():
+            for item_name, order_day in product['names'].items():
+                self.add(item_id, item_name, order_day)
+
+    def canonical_name(self, item_id):
+        """
+        Returns:
+            str: The name on the product's most recent order, or None for an unknown ID.
+        """
+        product = self.products.get(item_id)
+        return product['name'] if product else None
+
+    def aliases(self, item_id):
+        """
+        Returns:
+            list: The product's other names, most recently used first.
+        """
+        product = self.products.get(item_id)
+        if not product:
+            return []
+        names = product['names']
+        return sorted((name for name in names if name != product['name']), key=names.get, reverse=True)
+
+    def ids_by_name(self):
+        """
+        Returns:
+            dict: {item_name: item_id} for every name in the index. A name used
+                by several products belongs to the one that used it most recently.
+        """
+        ids = {}
+        last_used = {}
+        for item_id, product in self.products.items():
+            for item_name, order_day in product['names'].items():
+                if order_day >= last_used.get(item_name, ''):
+                    ids[item_name] = item_id
+                    last_used[item_name] = order_day
+        return ids
+
+    def save(self):
+        """
+        Writes the index, if it changed.
+        """
+        if not self.index_path or not self._unsaved:
+            return
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        with atomic_write(self.index_path) as f:
+            json.dump({'products': self.products}, f, indent=2, sort_keys=True)
+        self._unsaved = False
@@ -0,0 +1,149 @@
+import json
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple, Any
+
+from har_products import get_item_id
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The date part of an order title such as 'Jan 5, 2024 order'
+ORDER_DATE_PATTERN = re.compile(r'([A-Za-z]+\s+\d{1,2},\s+\d{4})')
+
+# Shared by the lookups below, so a missing field doesn't allocate a new dict
+_EMPTY = {}
+
+def loads(text):
+    """
+    Decodes JSON text or bytes with orjson when it is installed, or the json
+    module otherwise.
+
+    orjson rejects some JSON the json module accepts, such as lone surrogate
+    escapes, NaN and (in some releases) integers over 64 bits, so text it
+    can't decode is tried again with the json module. orjson's decode errors subclass json.JSONDecodeError, so
+    callers handle both the same way.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError as e:
+            try:
+                return json.loads(text)
+            except ValueError:
+                raise e from None
+    return json.loads(text)
+
+@lru_cache(maxsize=None)
+def parse_order_date(order_date):
+    """
+    Parses an order date such as 'Jan 1, 2024'. Orders share a handful of dates,
+    so the results are cached.
+    """
+    return datetime.strptime(order_date, '%b %d, %Y')
+
+@lru_cache(maxsize=None)
+def order_date_ordinal(order_date):
+    """
+    Converts an order date such as 'Jan 01, 2024' to a proleptic Gregorian ordinal.
+    """
+    return parse_order_date(order_date).toordinal()
+
+@lru_cache(maxsize=4096)
+def order_date_from_title(order_title):
+    """
+    Returns:
+        str: The date in an order title, or the whole title if it has none.
+    """
+    date_match = ORDER_DATE_PATTERN.search(order_title)
+    return date_match.group(1) if date_match else order_title
+
+class OrderItem(NamedTuple):
+    """
+    A single line item extracted from a getOrder response.
+
+    'item_id' is Walmart's product ID, which stays the same when the listing
+    is renamed. It is empty if the response didn't include one.
+
+    'line_number' is the line's position in its order, so line 0 starts a new
+    capture of the order. It is None for records that didn't come from a
+    getOrder response, such as ones built by hand.
+    """
+    order_id: str
+    order_date: str
+    item_name: str
+    is_food: str
+    quantity: Any
+    price: Any
+    item_id: str = ''
+    line_number: Any = None
+
+class Order:
+    """
+    The fields of a getOrder response that the parser and analytics use.
+
+    Args:
+        order_id (str): The order ID.
+        order_date (str): The order date as shown in the title, such as 'Jan 5, 2024'.
+        line_items (list): The order's OrderItem records.
+    """
+
+    __slots__ = ('order_id', 'order_date', 'line_items')
+
+    def __init__(self, order_id, order_date, line_items):
+        self.order_id = order_id
+        self.order_date = order_date
+        self.line_items = line_items
+
+    def __repr__(self):
+        return f"Order(order_id={self.order_id!r}, order_date={self.order_date!r}, line_items={self.line_items!r})"
+
+    @property
+    def order_day(self):
+        """
+        Returns:
+            str: The order date in ISO format, or None if the title had no
+                recognisable date.
+        """
+        try:
+            return parse_order_date(self.order_date).date().isoformat()
+        except ValueError:
+            return None
+
+def extract_order(response_json, classify=None):
+    """
+    Pulls the order ID, date and line items out of a decoded getOrder response.
+
+    Only the fields that are used are read, and line items without a name,
+    quantity or price are left out. Each line item becomes the OrderItem that
+    the sinks write, so nothing is copied between record types.
+
+    Args:
+        response_json (dict): The decoded response text of a getOrder request.
+        classify (callable): Returns the 'is_food' type of an item name. Items
+            are 'unknown' without it.
+
+    Returns:
+        Order: The order, or None if the response has no order ID or title.
+    """
+    order_data = (response_json.get('data') or _EMPTY).get('order') or _EMPTY
+    order_id = order_data.get('id')
+    order_title = order_data.get('title')
+    if not order_id or not order_title:
+        return None
+
+    order_date = order_date_from_title(order_title)
+    line_items = []
+    for group in order_data.get('groups_2101') or ():
+        for item in group.get('items') or ():
+            item_name = (item.get('productInfo') or _EMPTY).get('name')
+            quantity = item.get('quantity')
+            price = ((item.get('priceInfo') or _EMPTY).get('linePrice') or _EMPTY).get('value')
+            if item_name and quantity is not None and price is not None:
+                item_type = classify(item_name) if classify else 'unknown'
+                line_items.append(OrderItem(order_id, order_date, item_name, item_type, quantity, price,
+                                            get_item_id(item), len(line_items)))
+    return Order(order_id, order_date, line_items)
@@ -0,0 +1,296 @@
+import csv
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from har_records import OrderItem, parse_order_date
+
+CSV_FIELDNAMES = list(OrderItem._fields)
+
+class ListSink:
+    """
+    Collects order items in memory, for using the parser as a library.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.count = 0
+
+    def write(self, item):
+        self.items.append(item)
+        self.count += 1
+
+    def close(self):
+        """
+        Returns:
+            list: The collected OrderItem records.
+        """
+        return self.items
+
+    def discard(self):
+        self.items = []
+
+class _TempFileSink:
+    """
+    Base class for sinks that stream rows to a temp file and rename it on close.
+
+    The temp file is only created on the first write and is created in the
+    destination directory, so the final rename never crosses file systems.
+    """
+
+    suffix = '.tmp'
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.count = 0
+        self._file = None
+        self._temp_path = None
+
+    def _open(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        # The process ID keeps concurrent batch workers from sharing a temp file.
+        temp_name = f".{type(self).__name__.lower()}.{os.getpid()}.{id(self)}{self.suffix}"
+        self._temp_path = os.path.join(self.output_dir, temp_name)
+        self._file = open(self._temp_path, 'w', newline='', encoding='utf-8')
+
+    def write(self, item):
+        if self._file is None:
+            self._open()
+        self._write(item)
+        self.count += 1
+
+    def _write(self, item):
+        raise NotImplementedError
+
+    def _final_path(self):
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Moves the temp file into place.
+
+        Returns:
+            str: The path of the file that was written, or None if no items were written.
+        """
+        if self._file is None:
+            return None
+        self._file.close()
+        output_path = self._final_path()
+        os.replace(self._temp_path, output_path)
+        self._file = None
+        return output_path
+
+    def discard(self):
+        """
+        Closes and removes the temp file without moving it into place.
+        """
+        if self._file is not None:
+            self._file.close()
+            os.remove(self._temp_path)
+            self._file = None
+
+class CsvSink(_TempFileSink):
+    """
+    Streams order items to a CSV file named after the range of order dates.
+
+    Rows go to a temp file as they arrive. The earliest and latest order dates
+    are tracked along the way, and on close the file is renamed to
+    '<start>_<end>_walmart_order_items.csv'.
+
+    Args:
+        output_dir (str): The directory where the CSV file will be created.
+    """
+
+    suffix = '.csv.tmp'
+
+    def __init__(self, output_dir):
+        super().__init__(output_dir)
+        self._writer = None
+        self._start_date = None
+        self._end_date = None
+
+    def _open(self):
+        super()._open()
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(CSV_FIELDNAMES)
+
+    def _write(self, item):
+        self._writer.writerow(item)
+
+        # The format is guaranteed to be 'Mon DD, YYYY'
+        date_object = parse_order_date(item.order_date)
+        if self._start_date is None or date_object < self._start_date:
+            self._start_date = date_object
+        if self._end_date is None or date_object > self._end_date:
+            self._end_date = date_object
+
+    def _final_path(self):
+        start_date = self._start_date.strftime('%Y-%m-%d')
+        end_date = self._end_date.strftime('%Y-%m-%d')
+        return os.path.join(self.output_dir, f"{start_date}_{end_date}_walmart_order_items.csv")
+
+class JsonLinesSink(_TempFileSink):
+    """
+    Streams order items to a JSON Lines file, one object per item.
+
+    Args:
+        output_path (str): The path of the .jsonl file to write.
+    """
+
+    suffix = '.jsonl.tmp'
+
+    def __init__(self, output_path):
+        super().__init__(os.path.dirname(output_path) or '.')
+        self.output_path = output_path
+
+    def _write(self, item):
+        self._file.write(json.dumps(item._asdict()))
+        self._file.write('\n')
+
+    def _final_path(self):
+        return self.output_path
+
+LINE_ITEMS_TABLE = """
+CREATE TABLE IF NOT EXISTS line_items (
+    order_id TEXT NOT NULL REFERENCES orders(order_id),
+    line_number INTEGER NOT NULL,
+    item_name TEXT NOT NULL,
+    is_food TEXT NOT NULL,
+    quantity REAL NOT NULL,
+    price REAL NOT NULL,
+    item_id TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (order_id, line_number)
+)
+"""
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    order_date TEXT NOT NULL,
+    order_day TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_order_day ON orders(order_day);
+""" + LINE_ITEMS_TABLE + ";"
+# Databases from older versions are brought up to date on open, in this order:
+# line items gain an item_id, then are keyed on their position in the order
+# instead of their name, which merged two lines of the same item.
+SQLITE_MIGRATIONS = (
+    ('line_items', 'item_id', ("ALTER TABLE line_items ADD COLUMN item_id TEXT NOT NULL DEFAULT ''",)),
+    ('line_items', 'line_number', (
+        "ALTER TABLE line_items RENAME TO line_items_by_name",
+        LINE_ITEMS_TABLE,
+        "INSERT INTO line_items (order_id, line_number, item_name, is_food, quantity, price, item_id) "
+        "SELECT order_id, ROW_NUMBER() OVER (PARTITION BY order_id ORDER BY rowid) - 1, item_name, is_food, "
+        "quantity, price, item_id FROM line_items_by_name",
+        "DROP TABLE line_items_by_name",
+    )),
+)
+SQLITE_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_line_items_item_name ON line_items(item_name);
+CREATE INDEX IF NOT EXISTS idx_line_items_is_food ON line_items(is_food);
+CREATE INDEX IF NOT EXISTS idx_line_items_item_id ON line_items(item_id);
+"""
+
+class SqliteSink:
+    """
+    Upserts order items into a SQLite database.
+
+    Orders are keyed on order_id and line items on (order_id, line_number),
+    the line's position in its order, so two lines of the same item are both
+    kept. The lines written for an order replace the ones already stored for
+    it, so parsing overlapping captures again updates rows instead of
+    duplicating them, and an order captured twice in one HAR keeps its later
+    capture. A capture starts at line 0 (see OrderItem); items without a line
+    number start one whenever the order ID changes. 'order_day' holds the order date in ISO format so it sorts and
+    indexes properly.
+
+    Items are buffered until close() and then written in one short
+    transaction, so batch workers sharing the database only hold its write
+    lock while their own rows are inserted.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if missing.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.count = 0
+        # {order_id: (order_date, order_day, [line, ...])}
+        self._orders = {}
+        self._last_order_id = None
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        # Batch workers may share the database, so wait for each other's transactions.
+        # Transactions are begun explicitly, to take the write lock before reading anything.
+        self._connection = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self._connection.executescript(SQLITE_SCHEMA)
+        self._migrate()
+        self._connection.executescript(SQLITE_INDEXES)
+
+    def _migrate(self):
+        with self._transaction():
+            for table, column, statements in SQLITE_MIGRATIONS:
+                columns = [row[1] for row in self._connection.execute(f"PRAGMA table_info({table})")]
+                if column not in columns:
+                    for statement in statements:
+                        self._connection.execute(statement)
+
+    @contextmanager
+    def _transaction(self):
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def write(self, item):
+        if item.line_number is None:
+            new_capture = item.order_id != self._last_order_id
+        else:
+            new_capture = int(item.line_number) == 0
+        if new_capture:
+            order_day = parse_order_date(item.order_date).date().isoformat()
+            self._orders[item.order_id] = (item.order_date, order_day, [])
+            self._last_order_id = item.order_id
+        self._orders[item.order_id][2].append(
+            (item.item_name, item.is_food, float(item.quantity), float(item.price), item.item_id))
+        self.count += 1
+
+    def close(self):
+        """
+        Writes the buffered items in a single transaction.
+
+        Returns:
+            str: The path of the database.
+        """
+        if self._connection is None:
+            return self.db_path
+        try:
+            if self._orders:
+                with self._transaction():
+                    self._write_orders()
+        finally:
+            self.discard()
+        return self.db_path
+
+    def _write_orders(self):
+        for order_id, (order_date, order_day, lines) in self._orders.items():
+            self._connection.execute(
+                "INSERT INTO orders (order_id, order_date, order_day) VALUES (?, ?, ?) "
+                "ON CONFLICT(order_id) DO UPDATE SET order_date = excluded.order_date, order_day = excluded.order_day",
+                (order_id, order_date, order_day))
+            self._connection.execute("DELETE FROM line_items WHERE order_id = ?", (order_id,))
+            self._connection.executemany(
+                "INSERT INTO line_items (order_id, line_number, item_name, is_food, quantity, price, item_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(order_id, line_number) + line for line_number, line in enumerate(lines)])
+
+    def discard(self):
+        """
+        Drops the buffered items without writing them.
+        """
+        self._orders = {}
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,628 @@
+import bz2
+import gzip
+import json
+import lzma
+import mmap
+import os
+import re
+import zipfile
+
+from har_files import atomic_write
+from har_records import loads
+
+CHUNK_SIZE = 1024 * 1024
+
+# The leading bytes of each compressed format open_har() can read
+COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'PK\x03\x04', 'zip'),
+)
+MAGIC_SIZE = max(len(magic) for magic, _ in COMPRESSION_MAGIC)
+# What the stdlib codecs raise for corrupt or truncated data
+DECOMPRESSION_ERRORS = (OSError, EOFError, lzma.LZMAError, zipfile.BadZipFile)
+
+# The tokenizer runs over a copy of the bytes with escaped characters blanked
+# out (see _mask_escapes), so every quote in it delimits a string.
+# Outside of an entry we need every token to follow the 'log' -> 'entries' keys.
+_TOKEN = re.compile(rb'[{}\[\]":,]')
+# Inside an entry only brackets matter for finding where it ends. This matches
+# everything up to the next bracket, whole strings included.
+_ENTRY_SKIP = re.compile(rb'[^"{}\[\]]*(?:"[^"]*"[^"{}\[\]]*)*')
+# Every token that opens or closes something
+_STRUCTURE = re.compile(rb'[{}\[\]"]')
+# Objects and arrays nested up to this deep are matched whole by _ENTRY and
+# _VALUE in one call. Deeper or unfinished ones are walked a bracket at a time.
+NESTING_DEPTH = 16
+
+
+def _nested_pattern(opening, closing, depth=NESTING_DEPTH):
+    plain = rb'[^"{}\[\]]*'
+    value = plain
+    for _ in range(depth):
+        value = plain + rb'(?:(?:"[^"]*"|[{\[]' + value + rb'[}\]])' + plain + rb')*'
+    return re.compile(opening + value + closing)
+
+
+_ENTRY = _nested_pattern(rb'\{', rb'\}')
+_VALUE = _nested_pattern(rb'[{\[]', rb'[}\]]')
+
+# The bytes JSON allows outside of strings. A marker with any other byte in it
+# can only ever match inside a string.
+_NON_STRING_BYTES = frozenset(b' \t\r\n{}[]:,+-.0123456789eEtrufalsn')
+
+_QUOTE = ord('"')
+_BACKSLASH = ord('\\')
+_OPEN_OBJECT = ord('{')
+_OPEN_ARRAY = ord('[')
+_CLOSE_OBJECT = ord('}')
+_CLOSE_ARRAY = ord(']')
+_COLON = ord(':')
+_COMMA = ord(',')
+
+
+class HarDecompressionError(ValueError):
+    """
+    Raised when a compressed HAR is corrupt, truncated or has no single HAR inside.
+    """
+
+
+def detect_compression(har_file_path):
+    """
+    Identifies a compressed HAR by its leading bytes, whatever its extension.
+
+    Args:
+        har_file_path (str): The path to the file.
+
+    Returns:
+        str: 'gzip', 'bz2', 'xz' or 'zip', or None for an uncompressed file.
+    """
+    with open(har_file_path, 'rb') as f:
+        magic = f.read(MAGIC_SIZE)
+    for prefix, compression in COMPRESSION_MAGIC:
+        if magic[:len(prefix)] == prefix:
+            return compression
+    return None
+
+
+class CompressedHarFile:
+    """
+    A binary stream of the decompressed contents of a compressed HAR.
+
+    Decompression happens as the stream is read, so nothing is written to
+    disk and only the chunk being read is held in memory. Errors from the
+    codec are raised as HarDecompressionError, so they can't be mistaken for
+    errors writing the output.
+
+    Args:
+        stream: The decompressing file object.
+        compression (str): The format, as returned by detect_compression().
+    """
+
+    def __init__(self, stream, compression):
+        self._stream = stream
+        self.compression = compression
+
+    def read(self, size=-1):
+        try:
+            return self._stream.read(size)
+        except DECOMPRESSION_ERRORS as e:
+            raise HarDecompressionError(f"Invalid {self.compression} data: {e}") from e
+
+    def close(self):
+        self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _open_zip_member(har_file_path):
+    with zipfile.ZipFile(har_file_path) as archive:
+        names = [info.filename for info in archive.infolist() if not info.is_dir()]
+        har_names = [name for name in names if name.lower().endswith('.har')] or names
+        if len(har_names) != 1:
+            raise HarDecompressionError(f"Expected one .har file in the zip archive, found {len(har_names)}")
+        # The member keeps the archive file open after the ZipFile is closed
+        return archive.open(har_names[0])
+
+
+def open_har(har_file_path):
+    """
+    Opens a HAR file for reading in binary mode, decompressing it if needed.
+
+    Files compressed with gzip, bzip2 or xz, and zip archives holding a single
+    .har file, are detected by their magic bytes and decompressed while they
+    are read. Any other file is opened as it is.
+
+    Args:
+        har_file_path (str): The path to the .har, .har.gz, .har.bz2, .har.xz or .zip file.
+
+    Returns:
+        A binary file object, or a CompressedHarFile.
+    """
+    compression = detect_compression(har_file_path)
+    if compression is None:
+        return open(har_file_path, 'rb')
+    try:
+        if compression == 'gzip':
+            stream = gzip.open(har_file_path, 'rb')
+        elif compression == 'bz2':
+            stream = bz2.open(har_file_path, 'rb')
+        elif compression == 'xz':
+            stream = lzma.open(har_file_path, 'rb')
+        else:
+            stream = _open_zip_member(har_file_path)
+    except DECOMPRESSION_ERRORS as e:
+        raise HarDecompressionError(f"Invalid {compression} data: {e}") from e
+    return CompressedHarFile(stream, compression)
+
+
+def _mask_escapes(data):
+    """
+    Replaces each escaped backslash and quote with underscores, so that every
+    quote left delimits a string. `data` must not start inside an escape.
+
+    Backslashes only appear inside strings, where they pair up from the left,
+    so removing the escaped backslashes first leaves exactly the escaped quotes
+    behind a backslash.
+    """
+    if b'\\' not in data:
+        return data
+    return data.replace(b'\\\\', b'__').replace(b'\\"', b'__')
+
+
+def _unclosed_brackets(view):
+    """
+    Finds the brackets still open at the end of a masked stretch of JSON that
+    ends inside a string.
+
+    Returns:
+        tuple: The positions of the open brackets, outermost first, and whether
+            a bracket opened before the stretch began was closed in it.
+    """
+    quotes = view.count(b'"')
+    if not quotes:
+        return [], False
+    # An even number of quotes means the stretch starts inside a string as well
+    pos = 0 if quotes % 2 else view.find(b'"') + 1
+    opened = []
+    closed_outer = False
+    while True:
+        token = _STRUCTURE.search(view, pos)
+        if token is None:
+            return opened, closed_outer
+        char = view[token.start()]
+        if char == _QUOTE:
+            end = view.find(b'"', token.end())
+            if end == -1:
+                return opened, closed_outer
+            pos = end + 1
+        elif char == _OPEN_OBJECT or char == _OPEN_ARRAY:
+            value = _VALUE.match(view, token.start())
+            if value is None:
+                opened.append(token.start())
+                pos = token.end()
+            else:
+                pos = value.end()
+        else:
+            # Closing brackets opened before the stretch began are only noted
+            if opened:
+                opened.pop()
+            else:
+                closed_outer = True
+            pos = token.end()
+
+
+def _is_entry(raw_entry):
+    """
+    Checks for the 'request' and 'response' fields every HAR entry has.
+    """
+    try:
+        entry = loads(raw_entry)
+    except json.JSONDecodeError:
+        return False
+    return isinstance(entry, dict) and 'request' in entry and 'response' in entry
+
+
+class HarEntryScanner:
+    """
+    Walks the 'log.entries' array of a HAR file one entry at a time.
+
+    The file is read in chunks and tokenized just far enough to find where each
+    entry starts and ends. Bytes outside the entry currently being read are
+    discarded, so memory stays bounded by the largest single entry instead of
+    the size of the whole capture.
+
+    Each chunk is also kept with its escaped characters blanked out. Strings,
+    however long, are then skipped with a single find() for their closing
+    quote, and most entries are matched whole by one regular expression, so
+    the scan runs in C rather than a Python step per token.
+
+    Args:
+        har_file: A HAR file opened in binary mode.
+        chunk_size (int): How many bytes to read at a time.
+    """
+
+    def __init__(self, har_file, chunk_size=CHUNK_SIZE):
+        self.har_file = har_file
+        self.chunk_size = chunk_size
+        self.found_entries = False
+        self._base = 0
+        self._buf = bytearray()
+        # The buffer with escaped characters blanked out, position for position
+        self._view = bytearray()
+        # Whether the last chunk ended on a backslash that escapes the next byte
+        self._escaped = False
+        self._eof = False
+
+    def close(self):
+        self.har_file.close()
+
+    def _fill(self):
+        """
+        Appends the next chunk of the file to the buffer.
+
+        Returns:
+            bool: False once the end of the file has been reached.
+        """
+        if self._eof:
+            return False
+        chunk = self.har_file.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf.extend(chunk)
+        self._view.extend(self._mask(chunk))
+        return True
+
+    def _mask(self, chunk):
+        """
+        Masks the escapes in a chunk, carrying over an escape that was split
+        between this chunk and the last.
+        """
+        if self._escaped:
+            chunk = b'_' + chunk[1:]
+        chunk = _mask_escapes(chunk)
+        self._escaped = chunk.endswith(b'\\')
+        return chunk
+
+    def _discard(self, pos):
+        """
+        Drops everything before `pos` from the buffer and returns the new position.
+        """
+        if pos:
+            del self._buf[:pos]
+            del self._view[:pos]
+            self._base += pos
+        return 0
+
+    def _string_end(self, pos):
+        """
+        Finds the closing quote of the string whose body starts at `pos`.
+
+        Returns:
+            int: The position of the closing quote.
+        """
+        view = self._view
+        while True:
+            end = view.find(b'"', pos)
+            if end != -1:
+                return end
+            pos = len(view)
+            if not self._fill():
+                raise json.JSONDecodeError("Unterminated string", '', self._base + pos)
+
+    def _entry_end(self, pos):
+        """
+        Finds the end of the entry whose opening brace is at `pos`.
+
+        Returns:
+            int: The position just after the entry's closing brace.
+        """
+        view = self._view
+        entry = _ENTRY.match(view, pos)
+        if entry is not None:
+            return entry.end()
+
+        pos += 1
+        depth = 1
+        while True:
+            pos = _ENTRY_SKIP.match(view, pos).end()
+            if pos == len(view):
+                if not self._fill():
+                    raise json.JSONDecodeError("Unexpected end of file", '', self._base + pos)
+                continue
+            char = view[pos]
+            if char == _QUOTE:
+                # A string that runs past the end of the buffer
+                pos = self._string_end(pos + 1) + 1
+            elif char == _OPEN_OBJECT or char == _OPEN_ARRAY:
+                depth += 1
+                pos += 1
+            else:
+                depth -= 1
+                pos += 1
+                if not depth:
+                    return pos
+
+    def _iter_spans(self):
+        """
+        Yields the start and end of each entry in 'log.entries' within the buffer.
+
+        The positions are only valid until the generator is resumed, because the
+        buffer is trimmed once an entry has been passed.
+        """
+        buf = self._buf
+        view = self._view
+        # One [kind, key] pair per open container. The 'log.entries' array is
+        # marked with kind 'entries' so we know when its elements start.
+        stack = []
+        expect_key = False
+        pos = 0
+
+        while True:
+            if pos >= self.chunk_size:
+                pos = self._discard(pos)
+
+            token = _TOKEN.search(view, pos)
+            if token is None:
+                pos = self._discard(len(view))
+                if not self._fill():
+                    break
+                continue
+
+            char = view[token.start()]
+            pos = token.end()
+
+            if char == _QUOTE:
+                end = self._string_end(pos)
+                if expect_key:
+                    stack[-1][1] = buf[pos:end].decode('utf-8')
+                pos = end + 1
+            elif char == _OPEN_OBJECT:
+                if stack and stack[-1][0] == 'entries':
+                    entry_start = token.start()
+                    pos = self._entry_end(entry_start)
+                    yield entry_start, pos
+                    pos = self._discard(pos)
+                    expect_key = False
+                    continue
+                stack.append(['object', None])
+                expect_key = True
+            elif char == _OPEN_ARRAY:
+                is_entries = len(stack) == 2 and stack[0][1] == 'log' and stack[1][1] == 'entries'
+                if is_entries:
+                    self.found_entries = True
+                stack.append(['entries' if is_entries else 'array', None])
+                expect_key = False
+            elif char == _CLOSE_OBJECT or char == _CLOSE_ARRAY:
+                if not stack:
+                    raise json.JSONDecodeError("Unexpected closing bracket", '', self._base + token.start())
+                stack.pop()
+                expect_key = False
+            elif char == _COLON:
+                expect_key = False
+            elif char == _COMMA:
+                expect_key = bool(stack) and stack[-1][0] == 'object'
+
+        if stack:
+            raise json.JSONDecodeError("Unexpected end of file", '', self._base + len(buf))
+
+    def iter_raw_entries(self, marker=None):
+        """
+        Yields the raw bytes of each entry in 'log.entries'.
+
+        Args:
+            marker (bytes): When given, only entries whose raw bytes contain it
+                are copied out of the buffer and yielded.
+
+        Yields:
+            tuple: The byte offset of the entry in the file and its raw JSON bytes.
+        """
+        for start, end in self._iter_spans():
+            if marker is None or self._buf.find(marker, start, end) != -1:
+                yield self._base + start, bytes(self._buf[start:end])
+
+    def __iter__(self):
+        for _, raw_entry in self.iter_raw_entries():
+            yield loads(raw_entry)
+
+
+class HarOrderPrefilter:
+    """
+    Yields only the HAR entries whose raw bytes contain `marker`.
+
+    The file is memory-mapped and the marker is found with mmap.find(), so the
+    scan runs at memory speed and unrelated entries are never tokenized,
+    copied or decoded. Around each match, only the bytes just before it are
+    tokenized to find the entry the match is in. This needs the marker to be
+    one that can only match inside a string, such as a URL fragment. Other
+    markers, and files that can't be mapped, are scanned entry by entry with
+    HarEntryScanner instead. Callers still apply their own checks to the
+    decoded entries.
+
+    With `use_index`, the offsets of the candidates are saved to a sidecar file
+    next to the HAR. A later run on the unchanged file seeks straight to them
+    instead of scanning again.
+
+    Compressed captures (see open_har) can neither be mapped nor seeked into,
+    so they are scanned as a decompressed stream, still decoding only the
+    candidates, and `use_index` is ignored for them.
+
+    Args:
+        har_file_path (str): The path to the .har file.
+        marker (bytes): The byte string a candidate entry must contain.
+        use_index (bool): Read and write the sidecar offset index.
+    """
+
+    INDEX_SUFFIX = '.orders.idx'
+    # How many bytes before a match to tokenize at first when looking for its
+    # entry. The window grows until the entry is found.
+    WINDOW_SIZE = 4 * 1024
+
+    def __init__(self, har_file_path, marker, use_index=False):
+        self.har_file_path = har_file_path
+        self.marker = marker
+        self.compression = detect_compression(har_file_path)
+        self.index_path = har_file_path + self.INDEX_SUFFIX if use_index and not self.compression else None
+        self.found_entries = False
+        self.used_index = False
+        self._in_strings = any(byte not in _NON_STRING_BYTES for byte in marker)
+        self._har_file = open_har(har_file_path)
+        stat = os.stat(har_file_path)
+        self._signature = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'marker': marker.decode('utf-8'),
+        }
+
+    def close(self):
+        self._har_file.close()
+
+    def _read_index(self):
+        """
+        Loads the sidecar index if it exists and still matches the HAR file.
+
+        Returns:
+            dict: The index contents, or None if it is missing or stale.
+        """
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get('har_file') != self._signature:
+            return None
+        return index
+
+    def _write_index(self, spans):
+        index = {
+            'har_file': self._signature,
+            'found_entries': self.found_entries,
+            'spans': spans,
+        }
+        try:
+            with atomic_write(self.index_path) as f:
+                json.dump(index, f)
+        except OSError as e:
+            print(f"Warning: Could not write the offset index '{self.index_path}'. Error: {e}")
+
+    def iter_raw_entries(self):
+        """
+        Yields the raw bytes of each candidate entry.
+
+        Yields:
+            tuple: The byte offset of the entry in the file and its raw JSON bytes.
+        """
+        index = self._read_index() if self.index_path else None
+        if index is not None:
+            self.used_index = True
+            self.found_entries = index['found_entries']
+            for start, end in index['spans']:
+                self._har_file.seek(start)
+                yield start, self._har_file.read(end - start)
+            return
+
+        buffer = None
+        if not self.compression and self._in_strings:
+            try:
+                buffer = mmap.mmap(self._har_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # Empty files and some file systems can't be mapped; scan them in chunks instead.
+                pass
+
+        spans = []
+        if buffer is None:
+            scanner = HarEntryScanner(self._har_file)
+            for offset, raw_entry in scanner.iter_raw_entries(self.marker):
+                spans.append([offset, offset + len(raw_entry)])
+                yield offset, raw_entry
+            self.found_entries = scanner.found_entries
+        else:
+            try:
+                for start, end in self._iter_matching_spans(buffer):
+                    spans.append([start, end])
+                    yield start, buffer[start:end]
+            finally:
+                buffer.close()
+
+        if self.index_path:
+            self._write_index(spans)
+
+    def _iter_matching_spans(self, buffer):
+        """
+        Yields the start and end of each entry in a mapped HAR that contains the marker.
+
+        Only the first entry is walked with HarEntryScanner, which finds where
+        'log.entries' is. From then on the end of the last entry found is a
+        known boundary between entries, and the next match is found with
+        buffer.find().
+        """
+        # The map is read like a file, from its current position
+        scanner = HarEntryScanner(buffer, chunk_size=self.WINDOW_SIZE)
+        first = next(scanner._iter_spans(), None)
+        self.found_entries = scanner.found_entries
+        if first is None:
+            return
+        start, end = scanner._base + first[0], scanner._base + first[1]
+        if buffer.find(self.marker, start, end) != -1:
+            yield start, end
+
+        boundary = search_from = end
+        while True:
+            match = buffer.find(self.marker, search_from)
+            if match == -1:
+                return
+            span = self._entry_around(buffer, match, boundary)
+            if span is None:
+                # Outside of the entries, such as in a page title
+                search_from = match + len(self.marker)
+                continue
+            yield span
+            boundary = search_from = span[1]
+
+    def _entry_around(self, buffer, match, boundary):
+        """
+        Finds the entry holding a match of the marker.
+
+        The bytes before the match are masked and tokenized to find the
+        brackets that are still open at it. Tokenized from `boundary`, which
+        lies between entries, the outermost one is the entry itself, unless
+        'log.entries' was closed on the way and the match is in a later member
+        of 'log'. A shorter window may have started inside the entry, so what
+        it finds is only taken if it has an entry's 'request' and 'response'
+        fields, and the window grows otherwise.
+
+        Returns:
+            tuple: The start and end of the entry, or None if the match isn't
+                inside one.
+        """
+        window = self.WINDOW_SIZE
+        while True:
+            window_start = max(boundary, match - window)
+            # Never start in the middle of a run of backslashes
+            while window_start > boundary and buffer[window_start - 1] == _BACKSLASH:
+                window_start -= 1
+            opened, closed_outer = _unclosed_brackets(_mask_escapes(buffer[window_start:match]))
+            if window_start == boundary and closed_outer:
+                # Past the end of 'log.entries'
+                return None
+            if opened and buffer[window_start + opened[0]] == _OPEN_OBJECT:
+                start = window_start + opened[0]
+                buffer.seek(start)
+                scanner = HarEntryScanner(buffer, chunk_size=self.WINDOW_SIZE)
+                scanner._fill()
+                end = start + scanner._entry_end(0)
+                if window_start == boundary or _is_entry(buffer[start:end]):
+                    return start, end
+            if window_start == boundary:
+                return None
+            window *= 4
+
+    def __iter__(self):
+        for _, raw_entry in self.iter_raw_entries():
+            yield loads(raw_entry)
@@ -0,0 +1,227 @@
+import argparse
+import fnmatch
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from analytics.historical_prices import process_and_save_data
+from analytics.spend_rollups import update_spend_rollups
+from har_classifier import RULES_FILE
+from har_metrics import RunMetrics, configure_logging
+from har_parser import CATEGORY_FILE, HAR_FILE_PATTERNS, SQLITE_FILE, parse_har_batch
+
+logger = logging.getLogger(__name__)
+
+# Seconds between scans of the watched directory
+POLL_INTERVAL = 1.0
+# Scans a file's size and mtime must stay the same for before it is parsed
+SETTLE_POLLS = 1
+
+def is_har_file_name(file_name):
+    """
+    Checks whether a file name matches HAR_FILE_PATTERNS. Hidden files, such as
+    partial copies, never match.
+    """
+    if file_name.startswith('.'):
+        return False
+    file_name = file_name.lower()
+    return any(fnmatch.fnmatchcase(file_name, pattern) for pattern in HAR_FILE_PATTERNS)
+
+class HarWatcher:
+    """
+    Finds HAR files in a directory that are new or changed and fully written.
+
+    Each poll() takes one os.scandir snapshot of the size and mtime of the
+    HAR files in the directory. A file is only ready once its size and mtime
+    have stayed the same for `settle_polls` polls in a row, so a capture that
+    is still being saved or copied in is not parsed half-written. A ready file
+    is reported once, and again only if it changes.
+
+    Args:
+        watch_dir (str): The directory to watch. Subdirectories are not searched.
+        settle_polls (int): The number of polls a file must stay unchanged for.
+    """
+
+    def __init__(self, watch_dir, settle_polls=SETTLE_POLLS):
+        self.watch_dir = watch_dir
+        self.settle_polls = settle_polls
+        # {path: ((size, mtime_ns), polls unchanged)} for files not reported yet
+        self._pending = {}
+        # {path: (size, mtime_ns)} as last reported
+        self._reported = {}
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {path: (size, mtime_ns)} for every HAR file in the directory.
+        """
+        files = {}
+        try:
+            with os.scandir(self.watch_dir) as entries:
+                for entry in entries:
+                    if not is_har_file_name(entry.name):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        # Deleted or renamed since the directory was listed
+                        continue
+                    files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            print(f"Warning: The directory '{self.watch_dir}' was not found.")
+        return files
+
+    def poll(self):
+        """
+        Takes a snapshot and returns the files that have become ready since the last poll.
+
+        Returns:
+            list: The paths of the ready files, sorted by name.
+        """
+        files = self.snapshot()
+        ready = []
+        for path, signature in files.items():
+            if self._reported.get(path) == signature:
+                continue
+            pending = self._pending.get(path)
+            if pending is None or pending[0] != signature:
+                self._pending[path] = (signature, 0)
+                continue
+            polls = pending[1] + 1
+            if polls < self.settle_polls:
+                self._pending[path] = (signature, polls)
+                continue
+            del self._pending[path]
+            self._reported[path] = signature
+            ready.append(path)
+        # Forget files that are gone, so they are picked up again if they come back
+        for state in (self._pending, self._reported):
+            for path in [path for path in state if path not in files]:
+                del state[path]
+        return sorted(ready)
+
+def ingest(har_file_paths, output_dir, analytics_dir=None, refresh_analytics=True, **batch_options):
+    """
+    Parses HAR files and brings the analytics up to date with them.
+
+    The files go through parse_har_batch with the manifest, so files that were
+    already parsed are skipped. If any items were written, the price history
+    and spend rollups are refreshed, and both only re-read what changed (see
+    AggregationCache and SpendRollups).
+
+    Args:
+        har_file_paths (list): The HAR files to parse.
+        output_dir (str): The directory the parser writes to and the analytics read from.
+        analytics_dir (str): Write the analytics to this directory instead of 'analytics'.
+        refresh_analytics (bool): Refresh the analytics after parsing.
+        **batch_options: Passed through to parse_har_batch (jobs, output_format, stream, ...).
+
+    Returns:
+        dict: The result of parse_walmart_har for each HAR file that was parsed.
+    """
+    start = perf_counter()
+    results = parse_har_batch(har_file_paths, output_dir, use_manifest=True, **batch_options)
+    if not refresh_analytics or not any(result and result['output'] for result in results.values()):
+        return results
+
+    db_path = os.path.join(output_dir, SQLITE_FILE) if batch_options.get('output_format') == 'sqlite' else None
+    metrics = RunMetrics()
+    process_and_save_data(db_path=db_path, output_dir=output_dir, analytics_dir=analytics_dir, metrics=metrics)
+    update_spend_rollups(db_path=db_path, output_dir=output_dir, analytics_dir=analytics_dir, metrics=metrics)
+    logger.info("Ingested %d HAR files and refreshed the analytics in %.1fs.", len(results), perf_counter() - start)
+    return results
+
+def _report_batch(batch):
+    # A failed batch must not stop the watcher; its files are retried once they change
+    try:
+        batch.result()
+    except Exception as e:
+        print(f"Error: Could not ingest the new HAR files. Error: {e}")
+
+def watch(watch_dir, output_dir, interval=POLL_INTERVAL, settle_polls=SETTLE_POLLS, max_polls=None,
+          **ingest_options):
+    """
+    Watches a directory and ingests new HAR files as they are fully written.
+
+    Ingestion runs in a background thread, so the directory keeps being
+    polled while files are parsed. Files that become ready meanwhile are
+    ingested together as soon as the current batch finishes. When idle, each
+    poll is a single directory scan.
+
+    Args:
+        watch_dir (str): The directory to watch.
+        output_dir (str): The directory the parser writes to.
+        interval (float): Seconds between polls.
+        settle_polls (int): See HarWatcher.
+        max_polls (int): Stop after this many polls, once the batch being
+            ingested is finished. Files still waiting are left for the next
+            run, as the manifest has no record of them. None watches until
+            interrupted.
+        **ingest_options: Passed through to ingest().
+    """
+    watcher = HarWatcher(watch_dir, settle_polls)
+    queued = []
+    batch = None
+    polls = 0
+    logger.info("Watching '%s' for new HAR files.", watch_dir)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        while True:
+            queued.extend(path for path in watcher.poll() if path not in queued)
+            polls += 1
+
+            if batch is not None and batch.done():
+                _report_batch(batch)
+                batch = None
+            if queued and batch is None:
+                logger.info("Ingesting %d new HAR files.", len(queued))
+                batch = executor.submit(ingest, queued, output_dir, **ingest_options)
+                queued = []
+
+            if max_polls is not None and polls >= max_polls:
+                break
+            time.sleep(interval)
+        if batch is not None:
+            _report_batch(batch)
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Watch a directory for new HAR captures, parse them and refresh the analytics.")
+    arg_parser.add_argument('watch_dir', help="The directory new HAR files are saved or copied into.")
+    arg_parser.add_argument('--output-dir', default="output", help="Directory for the CSV files (default: output).")
+    arg_parser.add_argument('--interval', type=float, default=POLL_INTERVAL,
+                            help=f"Seconds between scans of the directory (default: {POLL_INTERVAL:g}).")
+    arg_parser.add_argument('--settle', type=int, default=SETTLE_POLLS,
+                            help="Scans a file's size and mtime must stay the same for before it is parsed "
+                                 f"(default: {SETTLE_POLLS}).")
+    arg_parser.add_argument('--format', choices=['csv', 'sqlite'], default='csv',
+                            help=f"Write a CSV per HAR (default) or upsert into {SQLITE_FILE} in the output directory.")
+    arg_parser.add_argument('--jobs', type=int, default=None,
+                            help="Worker processes for parsing several HARs at once (default: CPU count).")
+    arg_parser.add_argument('--prefilter', action='store_true',
+                            help="Scan the raw bytes for getOrder entries and only decode those.")
+    arg_parser.add_argument('--order-cache', action='store_true',
+                            help="Also save each HAR's getOrder responses to '<name>.orders.jsonl' in the output "
+                                 "directory.")
+    arg_parser.add_argument('--rules', default=RULES_FILE,
+                            help=f"Classify new items with the rules in this file (default: {RULES_FILE}).")
+    arg_parser.add_argument('--no-analytics', action='store_true',
+                            help="Only parse the new files, without refreshing the analytics.")
+    arg_parser.add_argument('-v', '--verbose', action='store_true',
+                            help="Log every matching request and collected item.")
+    args = arg_parser.parse_args()
+    configure_logging(args.verbose)
+
+    if not os.path.isdir(args.watch_dir):
+        print(f"Error: The directory '{args.watch_dir}' was not found.")
+    else:
+        try:
+            watch(args.watch_dir, args.output_dir, interval=args.interval, settle_polls=args.settle,
+                  refresh_analytics=not args.no_analytics, jobs=args.jobs, output_format=args.format,
+                  category_file=CATEGORY_FILE, rules_file=args.rules, prefilter=args.prefilter,
+                  order_cache_dir=args.output_dir if args.order_cache else None)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,128 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import SyntheticCorpus
+from benchmarks.run import PARSE_STAGES, compare_results, run_benchmarks
+from har_metrics import RunMetrics
+from har_parser import CategoryStore, parse_walmart_har
+from har_sinks import ListSink
+
+class TestSyntheticCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.corpus = SyntheticCorpus(orders=12, items_per_order=4, noise_entries=2, noise_size=500, seed=7)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read_files(self, paths):
+        contents = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                contents.append(f.read())
+        return contents
+
+    def test_same_seed_same_bytes(self):
+        """Test that the same arguments always generate identical files."""
+        first = self.corpus.write_hars(os.path.join(self.temp_dir, "a"), files=2)
+        second = SyntheticCorpus(orders=12, items_per_order=4, noise_entries=2, noise_size=500, seed=7).write_hars(
+            os.path.join(self.temp_dir, "b"), files=2)
+        self.assertEqual(self.read_files(first), self.read_files(second))
+
+        other = SyntheticCorpus(orders=12, items_per_order=4, noise_entries=2, noise_size=500, seed=8).write_hars(
+            os.path.join(self.temp_dir, "c"), files=2)
+        self.assertNotEqual(self.read_files(first), self.read_files(other))
+
+    @patch('builtins.print')
+    def test_parser_finds_every_order(self, mock_print):
+        """Test that every parsing mode recovers exactly the generated items."""
+        har_paths = self.corpus.write_hars(os.path.join(self.temp_dir, "har"), files=3)
+        self.assertEqual(len(har_paths), 3)
+        expected = [item for _, _, order_items in self.corpus.iter_orders() for item in order_items]
+
+        for options in ({}, {'stream': True}, {'prefilter': True}):
+            category_store = CategoryStore(os.path.join(self.temp_dir, "categories.json"), rules_file=None)
+            items = []
+            for har_path in har_paths:
+                sink = ListSink()
+                parse_walmart_har(har_path, self.temp_dir, category_store=category_store, sink=sink, **options)
+                items.extend(sink.items)
+            self.assertEqual(items, expected, options)
+
+    @patch('builtins.print')
+    def test_csvs_match_the_parser_output(self, mock_print):
+        """Test that the generated CSVs are byte-identical to what the parser writes."""
+        har_paths = self.corpus.write_hars(os.path.join(self.temp_dir, "har"), files=2)
+        csv_paths = self.corpus.write_csvs(os.path.join(self.temp_dir, "csv"), files=2)
+        parsed_dir = os.path.join(self.temp_dir, "parsed")
+        category_store = CategoryStore(os.path.join(self.temp_dir, "categories.json"), rules_file=None)
+        parsed_paths = [parse_walmart_har(path, parsed_dir, category_store=category_store)['output']
+                        for path in har_paths]
+        self.assertEqual([os.path.basename(path) for path in parsed_paths],
+                         [os.path.basename(path) for path in csv_paths])
+        self.assertEqual(self.read_files(parsed_paths), self.read_files(csv_paths))
+
+
+class TestBenchmarkRunner(unittest.TestCase):
+
+    def test_run_benchmarks(self):
+        """Test that every stage is measured at every size."""
+        results = run_benchmarks(sizes=[3, 5], repeat=1, files=2,
+                                 corpus_options={'noise_entries': 1, 'noise_size': 200})
+        stages = ['parse_load', 'parse_stream', 'parse_prefilter', 'analytics']
+        self.assertEqual(sorted(results), sorted(f"{stage}@{size}" for stage in stages for size in (3, 5)))
+        self.assertEqual(results['parse_load@3']['entries'], 6)
+        for result in results.values():
+            self.assertGreater(result['wall_time'], 0)
+            self.assertGreater(result['peak_memory'], 0)
+            self.assertGreater(result['mb_per_second'], 0)
+
+    @patch('builtins.print')
+    def test_prefilter_matches_load(self, mock_print):
+        """Test that the prefilter parses the same items as loading the capture whole, decoding fewer entries."""
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        har_path = SyntheticCorpus(orders=150).write_hars(os.path.join(temp_dir, "har"), files=1)[0]
+        items = {}
+        counters = {}
+        for name in ('parse_load', 'parse_prefilter'):
+            sink = ListSink()
+            metrics = RunMetrics()
+            category_store = CategoryStore(os.path.join(temp_dir, "categories.json"), rules_file=None)
+            parse_walmart_har(har_path, temp_dir, category_store=category_store, sink=sink, metrics=metrics,
+                              **PARSE_STAGES[name])
+            items[name] = sink.items
+            counters[name] = metrics.counters
+        self.assertEqual(items['parse_prefilter'], items['parse_load'])
+        self.assertEqual(counters['parse_prefilter']['orders_parsed'], 150)
+        self.assertEqual(counters['parse_load']['orders_parsed'], 150)
+        self.assertEqual(counters['parse_prefilter']['entries_matched'], counters['parse_load']['entries_matched'])
+        # The noise entries are never decoded
+        self.assertLess(counters['parse_prefilter']['entries_scanned'], counters['parse_load']['entries_scanned'])
+
+    def test_compare_results(self):
+        """Test that only increases beyond the tolerance are reported."""
+        baseline = {
+            'parse_load@100': {'wall_time': 1.0, 'peak_memory': 1000},
+            'analytics@100': {'wall_time': 1.0, 'peak_memory': None},
+        }
+        results = {
+            'parse_load@100': {'wall_time': 1.2, 'peak_memory': 1500},
+            'analytics@100': {'wall_time': 2.0, 'peak_memory': 1000},
+            'analytics@1000': {'wall_time': 9.0, 'peak_memory': 1000},
+        }
+        regressions = compare_results(baseline, results, tolerance=0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("parse_load@100: peak_memory"))
+        self.assertTrue(regressions[1].startswith("analytics@100: wall_time"))
+        self.assertEqual(compare_results(baseline, results, tolerance=1.5), [])
+
+if __name__ == '__main__':
+    unittest.main()
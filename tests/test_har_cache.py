@@ -0,0 +1,62 @@
+import unittest
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from har_cache import OrderCacheReader, OrderCacheSink, is_order_cache, slim_order_entry
+
+class TestOrderCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.har_file_path = os.path.join(self.temp_dir, "capture.har")
+        self.cache_path = os.path.join(self.temp_dir, "capture.orders.jsonl")
+        with open(self.har_file_path, 'w', encoding='utf-8') as f:
+            f.write('{"log": {"entries": []}}')
+        self.entry = {
+            "_resourceType": "fetch",
+            "_initiator": {"stack": {"callFrames": [{"url": "app.js"}]}},
+            "request": {"url": "https://www.walmart.com/orchestra/orders/graphql/getOrder/1", "headers": [{}]},
+            "response": {"status": 200, "content": {"mimeType": "application/json", "text": "{\"data\": \"café\"}"}},
+            "timings": {"wait": 12.5},
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_slim_order_entry(self):
+        """Test that only the resource type, URL and response text are kept."""
+        self.assertEqual(slim_order_entry(self.entry), {
+            "_resourceType": "fetch",
+            "request": {"url": "https://www.walmart.com/orchestra/orders/graphql/getOrder/1"},
+            "response": {"content": {"text": "{\"data\": \"café\"}"}},
+        })
+        self.assertEqual(slim_order_entry({"request": {"url": "u"}, "response": {}})["response"], {"content": {}})
+
+    def test_round_trip(self):
+        """Test that the reader yields the slimmed entries and the header names the source."""
+        sink = OrderCacheSink(self.cache_path, self.har_file_path, sha256="abc")
+        sink.write(self.entry)
+        sink.write(self.entry)
+        self.assertEqual(sink.close(), self.cache_path)
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ["capture.har", "capture.orders.jsonl"])
+
+        self.assertTrue(is_order_cache(self.cache_path))
+        self.assertFalse(is_order_cache(self.har_file_path))
+        reader = OrderCacheReader(self.cache_path)
+        self.assertEqual(reader.header, {"walmart_order_cache": 1, "source": "capture.har", "sha256": "abc"})
+        self.assertEqual(list(reader), [slim_order_entry(self.entry)] * 2)
+        reader.close()
+
+    def test_empty_cache_is_not_written(self):
+        """Test that a HAR without orders leaves no cache or temp file behind."""
+        sink = OrderCacheSink(self.cache_path, self.har_file_path)
+        self.assertIsNone(sink.close())
+        self.assertEqual(os.listdir(self.temp_dir), ["capture.har"])
+
+if __name__ == '__main__':
+    unittest.main()
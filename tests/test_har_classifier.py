@@ -0,0 +1,197 @@
+import unittest
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from har_classifier import RuleClassifier, RULES_FILE, write_audit
+from har_parser import CategoryStore
+
+RULES = [
+    {"name": "cleaning", "type": "nonfood", "keywords": ["dish soap", "paper towel"]},
+    {"name": "food-brands", "type": "food", "brands": ["Marketside", "Great Value"]},
+    {"name": "produce", "type": "food", "keywords": ["apple", "peach"]},
+    {"name": "frozen", "type": "food", "patterns": [r"\(frozen\)"]},
+]
+
+class TestRuleClassifier(unittest.TestCase):
+
+    def setUp(self):
+        self.classifier = RuleClassifier(RULES)
+
+    def test_first_matching_rule_wins(self):
+        """Test that rule order decides between several matching rules."""
+        self.assertEqual(self.classifier.classify("Great Value Dish Soap"), ("nonfood", "cleaning"))
+        self.assertEqual(self.classifier.classify("Great Value Corn"), ("food", "food-brands"))
+        self.assertEqual(self.classifier.classify("Apple Scented Paper Towels"), ("nonfood", "cleaning"))
+
+    def test_keywords_brands_and_patterns(self):
+        """Test whole-word, plural and case-insensitive keywords, anchored brands and patterns."""
+        self.assertEqual(self.classifier.classify("Fresh Peaches, each"), ("food", "produce"))
+        self.assertEqual(self.classifier.classify("APPLES 3 lb"), ("food", "produce"))
+        self.assertIsNone(self.classifier.classify("Pineapple Chunks"))
+        self.assertIsNone(self.classifier.classify("Sauce from Marketside"))
+        self.assertEqual(self.classifier.classify("Mixed Vegetables (Frozen)"), ("food", "frozen"))
+        self.assertIsNone(self.classifier.classify("Phone Charger"))
+
+    def test_results_are_memoized(self):
+        """Test that a name is only matched against the rules once."""
+        self.classifier.classify("Fresh Peaches, each")
+        with patch.object(self.classifier, '_first_rule') as mock_first_rule:
+            self.assertEqual(self.classifier.classify("Fresh Peaches, each"), ("food", "produce"))
+            mock_first_rule.assert_not_called()
+
+    def test_overlapping_and_multiword_matches(self):
+        """Test that the first rule wins when its keyword overlaps or is inside another rule's match."""
+        classifier = RuleClassifier([
+            {"name": "butter", "type": "food", "keywords": ["butter"]},
+            {"name": "peanut", "type": "nonfood", "keywords": ["peanut butter", "peanut"]},
+            {"name": "glass", "type": "nonfood", "keywords": ["glasses"]},
+            {"name": "glass-2", "type": "food", "keywords": ["glass"]},
+            {"name": "brand", "type": "food", "brands": ["Onn.", "Mr. Clean"]},
+        ])
+        self.assertEqual(classifier.classify("Peanut Butter, 16 oz"), ("food", "butter"))
+        self.assertEqual(classifier.classify("Peanut Brittle"), ("nonfood", "peanut"))
+        self.assertEqual(classifier.classify("Wine Glasses"), ("nonfood", "glass"))
+        self.assertEqual(classifier.classify("Glass Jar"), ("food", "glass-2"))
+        self.assertEqual(classifier.classify("onn. TV"), ("food", "brand"))
+        self.assertEqual(classifier.classify("Mr. Clean Spray"), ("food", "brand"))
+        self.assertIsNone(classifier.classify("Mr. Cleaner"))
+
+    def test_patterns_with_braces_and_no_rules(self):
+        """Test that regex quantifiers survive compilation and an empty rule list matches nothing."""
+        classifier = RuleClassifier([{"name": "sku", "type": "nonfood", "patterns": [r"\bsku\d{3}\b"]}])
+        self.assertEqual(classifier.classify("Widget SKU123"), ("nonfood", "sku"))
+        self.assertIsNone(RuleClassifier([]).classify("Anything"))
+
+    def test_invalid_rules(self):
+        """Test that rules with a bad type or pattern are rejected."""
+        with self.assertRaises(ValueError):
+            RuleClassifier([{"name": "bad", "type": "drink", "keywords": ["soda"]}])
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            rules_file = os.path.join(temp_dir, "rules.json")
+            with open(rules_file, 'w', encoding='utf-8') as f:
+                json.dump({"rules": [{"name": "bad", "type": "food", "patterns": ["("]}]}, f)
+            with patch("builtins.print") as mock_print:
+                self.assertIsNone(RuleClassifier.from_file(rules_file))
+            self.assertTrue(mock_print.call_args[0][0].startswith("Warning: Could not load the classification rules"))
+            self.assertIsNone(RuleClassifier.from_file(os.path.join(temp_dir, "missing.json")))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_default_rules(self):
+        """Test that the shipped rules load and classify the sample items."""
+        classifier = RuleClassifier.from_file(RULES_FILE)
+        with open("food_or_non_food_SAMPLE.json", 'r', encoding='utf-8') as f:
+            sample = json.load(f)
+        for item_name, item_type in sample.items():
+            self.assertEqual(classifier.classify(item_name)[0], item_type, item_name)
+        self.assertEqual(classifier.classify("Great Value Ultra Strong Paper Towels")[0], "nonfood")
+
+    def test_default_rules_nonfood_before_food_keywords(self):
+        """Test that pet supplies, electronics and kitchen tools aren't taken for the food they mention."""
+        classifier = RuleClassifier.from_file(RULES_FILE)
+        expected = {
+            "Apple AirPods Pro": "nonfood",
+            "Pedigree Dry Dog Food Chicken Flavor": "nonfood",
+            "Milk-Bone Dog Treats": "nonfood",
+            "Hamilton Beach Bread Maker": "nonfood",
+            "Cheese Grater": "nonfood",
+            "Ball Park Hot Dog Buns": "food",
+            "Kettle Cooked Potato Chips": "food",
+            "Pet Evaporated Milk": "food",
+            "Pillsbury Toaster Strudel": "food",
+            "Microwave Popcorn": "food",
+        }
+        for item_name, item_type in expected.items():
+            self.assertEqual(classifier.classify(item_name)[0], item_type, item_name)
+
+
+class TestCategoryStoreRules(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.json_file_path = os.path.join(self.temp_dir, "food_or_non_food.json")
+        self.rules_file = os.path.join(self.temp_dir, "rules.json")
+        with open(self.json_file_path, 'w', encoding='utf-8') as f:
+            json.dump({"Apple Pie Candle": "nonfood", "Fresh Apple": "unknown", "Mystery Box": "unknown"}, f)
+        with open(self.rules_file, 'w', encoding='utf-8') as f:
+            json.dump({"rules": RULES}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_type_uses_rules(self):
+        """Test that new and unknown items are classified while manual types are kept."""
+        store = CategoryStore(self.json_file_path, rules_file=self.rules_file)
+        self.assertEqual(store.get_type("Apple Pie Candle"), "nonfood")
+        self.assertEqual(store.get_type("Fresh Apple"), "food")
+        self.assertEqual(store.get_type("Great Value Corn"), "food")
+        self.assertEqual(store.get_type("Mystery Box"), "unknown")
+        self.assertEqual(store.get_type("Another Mystery"), "unknown")
+        self.assertEqual(store.new_items, ["Fresh Apple", "Great Value Corn", "Another Mystery"])
+        self.assertEqual(store.matched_rules, {"Fresh Apple": "produce", "Great Value Corn": "food-brands"})
+
+    def test_reclassify(self):
+        """Test that one pass classifies the unknown items and the audit records the rules."""
+        store = CategoryStore(self.json_file_path, rules_file=self.rules_file)
+        matched_items = store.reclassify()
+        self.assertEqual(matched_items, {"Fresh Apple": ("food", "produce")})
+        store.flush()
+        with open(self.json_file_path, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {"Apple Pie Candle": "nonfood", "Fresh Apple": "food",
+                                            "Mystery Box": "unknown"})
+
+        with open(os.path.join(self.temp_dir, "food_or_non_food.classified.json"), 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {"Fresh Apple": ["food", "produce"]})
+
+        audit_path = os.path.join(self.temp_dir, "audit.csv")
+        write_audit(audit_path, matched_items)
+        with open(audit_path, 'r', newline='', encoding='utf-8') as f:
+            self.assertEqual(list(csv.reader(f)), [["item_name", "type", "rule"], ["Fresh Apple", "food", "produce"]])
+
+    def test_rule_types_are_recorded_and_rerun(self):
+        """Test that types set by rules are kept apart from hand-set ones and can be classified again."""
+        store = CategoryStore(self.json_file_path, rules_file=self.rules_file)
+        for item_name in ("Great Value Corn", "Marketside Peach Candle", "Fresh Apple"):
+            store.get_type(item_name)
+        store.flush()
+        self.assertEqual(store.classified, {"Great Value Corn": ["food", "food-brands"],
+                                            "Marketside Peach Candle": ["food", "food-brands"],
+                                            "Fresh Apple": ["food", "produce"]})
+
+        # A type changed by hand is no longer the rule's
+        with open(self.json_file_path, 'r', encoding='utf-8') as f:
+            item_data = json.load(f)
+        item_data["Marketside Peach Candle"] = "nonfood"
+        with open(self.json_file_path, 'w', encoding='utf-8') as f:
+            json.dump(item_data, f)
+        store = CategoryStore(self.json_file_path, rules_file=self.rules_file)
+        self.assertNotIn("Marketside Peach Candle", store.classified)
+
+        # The rules change: candles are nonfood and Great Value is no longer a food brand
+        rules = [{"name": "candles", "type": "nonfood", "keywords": ["candle"]}] + \
+            [rule for rule in RULES if rule["name"] != "food-brands"]
+        with open(self.rules_file, 'w', encoding='utf-8') as f:
+            json.dump({"rules": rules}, f)
+        store = CategoryStore(self.json_file_path, rules_file=self.rules_file)
+        self.assertEqual(store.reclassify(), {})
+        self.assertEqual(store.reclassify(rerun=True), {"Fresh Apple": ("food", "produce")})
+        store.flush()
+        with open(self.json_file_path, 'r', encoding='utf-8') as f:
+            item_data = json.load(f)
+        self.assertEqual(item_data["Great Value Corn"], "unknown")
+        self.assertEqual(item_data["Marketside Peach Candle"], "nonfood")
+        self.assertEqual(item_data["Apple Pie Candle"], "nonfood")
+        self.assertEqual(CategoryStore(self.json_file_path, rules_file=None).classified,
+                         {"Fresh Apple": ["food", "produce"]})
+
+if __name__ == '__main__':
+    unittest.main()
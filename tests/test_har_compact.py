@@ -0,0 +1,92 @@
+import unittest
+import csv
+import os
+import shutil
+import sys
+import tempfile
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from har_compact import compact_csvs, find_csv_files
+from har_metrics import RunMetrics
+from har_sinks import CSV_FIELDNAMES
+
+class TestCompactCsvs(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.temp_dir, "compacted", "items.csv")
+        # Two overlapping captures, the older one written before item IDs were recorded
+        self.write_csv("2024-01-01_2024-02-02_walmart_order_items.csv", [
+            ["2", "Feb 2, 2024", "Bread", "food", "1", "2.50"],
+            ["1", "Jan 1, 2024", "Soap", "nonfood", "2", "4.00"],
+            ["1", "Jan 1, 2024", "Apples", "food", "3", "1.00"],
+        ])
+        self.write_csv("2024-02-02_2024-03-03_walmart_order_items.csv", [
+            ["3", "Mar 3, 2024", "Apples", "food", "3", "1.20", "101"],
+            ["2", "Feb 2, 2024", "Bread", "food", "1", "2.50", "202"],
+            ["2", "Feb 2, 2024", "Milk", "food", "1", "3.00", "303"],
+            ["4", "Not a date", "Milk", "food", "1", "3.00", "303"],
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_csv(self, file_name, rows):
+        with open(os.path.join(self.temp_dir, file_name), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDNAMES[:len(rows[0])])
+            writer.writerows(rows)
+
+    def read_output(self):
+        with open(self.output_path, 'r', newline='', encoding='utf-8') as f:
+            return list(csv.reader(f))
+
+    @patch("builtins.print")
+    def test_merge_and_dedupe(self, mock_print):
+        """Test that rows come out sorted by date, once each, whether or not they spill to disk."""
+        # The duplicate Bread row keeps the older file's position and gains the newer one's item ID
+        csv_paths = find_csv_files(self.temp_dir)
+        expected = [
+            CSV_FIELDNAMES,
+            ["1", "Jan 1, 2024", "Soap", "nonfood", "2", "4.00", "", "0"],
+            ["1", "Jan 1, 2024", "Apples", "food", "3", "1.00", "", "1"],
+            ["2", "Feb 2, 2024", "Bread", "food", "1", "2.50", "202", "0"],
+            ["2", "Feb 2, 2024", "Milk", "food", "1", "3.00", "303", "1"],
+            ["3", "Mar 3, 2024", "Apples", "food", "3", "1.20", "101", "0"],
+        ]
+        for run_rows, fan_in in ((100, 64), (1, 2), (2, 3)):
+            metrics = RunMetrics()
+            self.assertEqual(compact_csvs(csv_paths, self.output_path, metrics, run_rows=run_rows, fan_in=fan_in),
+                             self.output_path)
+            self.assertEqual(self.read_output(), expected, (run_rows, fan_in))
+            self.assertEqual(os.listdir(os.path.dirname(self.output_path)), ["items.csv"])
+            self.assertEqual(metrics.counters, {'csv_files_read': 2, 'rows_read': 6, 'rows_written': 5,
+                                                'rows_duplicate': 1, 'rows_skipped': 1})
+        self.assertTrue(mock_print.call_args[0][0].startswith("Skipping row due to formatting error"))
+
+    def test_identical_lines_are_kept(self):
+        """Test that two identical lines of one order are both kept, while a repeat capture of it is dropped."""
+        lines = [["5", "Apr 4, 2024", "Yogurt", "food", "1", "0.80", "404", "0"],
+                 ["5", "Apr 4, 2024", "Yogurt", "food", "1", "0.80", "404", "1"]]
+        csv_path = os.path.join(self.temp_dir, "repeat.csv")
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDNAMES)
+            writer.writerows(lines + lines)
+        metrics = RunMetrics()
+        compact_csvs([csv_path], self.output_path, metrics)
+        self.assertEqual(self.read_output(), [CSV_FIELDNAMES] + lines)
+        self.assertEqual(metrics.counters['rows_duplicate'], 2)
+
+    def test_no_rows(self):
+        """Test that nothing is written when the CSVs have no rows."""
+        empty_path = os.path.join(self.temp_dir, "empty.csv")
+        with open(empty_path, 'w', encoding='utf-8') as f:
+            f.write(",".join(CSV_FIELDNAMES) + "\n")
+        self.assertIsNone(compact_csvs([empty_path], self.output_path))
+        self.assertEqual(os.listdir(os.path.dirname(self.output_path)), [])
+
+if __name__ == '__main__':
+    unittest.main()
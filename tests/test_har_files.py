@@ -0,0 +1,57 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from har_files import atomic_write
+
+class TestAtomicWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, "state.json")
+        with open(self.file_path, 'w', encoding='utf-8') as f:
+            f.write("old")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read(self):
+        with open(self.file_path, 'rb') as f:
+            return f.read()
+
+    def test_replaces_the_file(self):
+        """Test that text is written as UTF-8, bytes as they are, and no temp file is left."""
+        with atomic_write(self.file_path) as f:
+            f.write("café")
+        self.assertEqual(self.read(), "café".encode('utf-8'))
+        with atomic_write(self.file_path, 'wb') as f:
+            f.write(b'\x00\x01')
+        self.assertEqual(self.read(), b'\x00\x01')
+        self.assertEqual(os.listdir(self.temp_dir), ["state.json"])
+
+    def test_failed_write_keeps_the_old_file(self):
+        """Test that an error while writing leaves the old file and removes the temp file."""
+        with self.assertRaises(ValueError):
+            with atomic_write(self.file_path) as f:
+                f.write("partial")
+                raise ValueError("not serializable")
+        self.assertEqual(self.read(), b'old')
+        self.assertEqual(os.listdir(self.temp_dir), ["state.json"])
+
+    def test_overlapping_writes_use_their_own_temp_files(self):
+        """Test that two writers of the same file don't share a temp file and the last one to finish wins."""
+        with atomic_write(self.file_path) as first:
+            with atomic_write(self.file_path) as second:
+                self.assertNotEqual(first.name, second.name)
+                first.write("first")
+                second.write("second")
+            self.assertEqual(self.read(), b'second')
+        self.assertEqual(self.read(), b'first')
+        self.assertEqual(os.listdir(self.temp_dir), ["state.json"])
+
+if __name__ == "__main__":
+    unittest.main()
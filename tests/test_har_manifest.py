@@ -0,0 +1,64 @@
+import unittest
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from unittest.mock import patch
+from har_manifest import HarManifest, file_sha256, MANIFEST_FILE
+
+class TestHarManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.temp_dir, "output")
+        self.har_file_path = os.path.join(self.temp_dir, "capture.har")
+        with open(self.har_file_path, 'w', encoding='utf-8') as f:
+            json.dump({"log": {"entries": []}}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_file_sha256(self):
+        """Test that the chunked hash matches hashing the whole file."""
+        with open(self.har_file_path, 'rb') as f:
+            expected = hashlib.sha256(f.read()).hexdigest()
+        self.assertEqual(file_sha256(self.har_file_path, chunk_size=3), expected)
+
+    def test_record_and_reload(self):
+        """Test that a recorded file is found after saving and reloading the manifest."""
+        manifest = HarManifest(self.output_dir)
+        self.assertEqual(manifest.find(self.har_file_path)[0], None)
+
+        manifest.record(self.har_file_path, None, "output/a.csv", ["1", "2"])
+        manifest.save()
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, MANIFEST_FILE)))
+
+        manifest = HarManifest(self.output_dir)
+        with patch("har_manifest.file_sha256") as mock_sha256:
+            record, _ = manifest.find(self.har_file_path)
+            mock_sha256.assert_not_called()
+        self.assertEqual(record['csv_path'], "output/a.csv")
+        self.assertEqual(record['order_ids'], ["1", "2"])
+
+    def test_copied_file_is_found_by_hash(self):
+        """Test that the same content under another path or mtime is recognised."""
+        manifest = HarManifest(self.output_dir)
+        manifest.record(self.har_file_path, None, "output/a.csv", ["1"])
+
+        copy_path = os.path.join(self.temp_dir, "copy.har")
+        shutil.copyfile(self.har_file_path, copy_path)
+        record, sha256 = manifest.find(copy_path)
+        self.assertEqual(record['csv_path'], "output/a.csv")
+        self.assertEqual(sha256, file_sha256(copy_path))
+
+    def test_changed_file_is_not_found(self):
+        """Test that a file whose content changed is treated as new."""
+        manifest = HarManifest(self.output_dir)
+        manifest.record(self.har_file_path, None, "output/a.csv", ["1"])
+        with open(self.har_file_path, 'a', encoding='utf-8') as f:
+            f.write("\n\n")
+        self.assertEqual(manifest.find(self.har_file_path)[0], None)
+
+if __name__ == "__main__":
+    unittest.main()
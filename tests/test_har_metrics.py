@@ -0,0 +1,78 @@
+import unittest
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from har_metrics import RunMetrics, run_with_profile
+
+class TestRunMetrics(unittest.TestCase):
+
+    def test_counters_and_timers(self):
+        """Test that counts and times accumulate per name."""
+        metrics = RunMetrics()
+        metrics.count('entries_scanned')
+        metrics.count('entries_scanned', 2)
+        metrics.add_time('load', 0.5)
+        with metrics.timer('load'):
+            pass
+        data = metrics.to_dict()
+        self.assertEqual(data['counters'], {'entries_scanned': 3})
+        self.assertGreaterEqual(data['timers']['load'], 0.5)
+        self.assertGreaterEqual(data['wall_time'], 0)
+
+    def test_timed_iter(self):
+        """Test that timed_iter yields every item and records a timer."""
+        metrics = RunMetrics()
+        self.assertEqual(list(metrics.timed_iter(iter([1, 2, 3]), 'load')), [1, 2, 3])
+        self.assertIn('load', metrics.timers)
+
+    def test_merge(self):
+        """Test that worker metrics are added to the totals."""
+        metrics = RunMetrics()
+        metrics.count('items_collected', 2)
+        metrics.add_time('write', 1.0)
+        metrics.merge({'counters': {'items_collected': 3, 'orders_parsed': 1}, 'timers': {'write': 0.5}})
+        self.assertEqual(metrics.counters, {'items_collected': 5, 'orders_parsed': 1})
+        self.assertEqual(metrics.timers['write'], 1.5)
+
+
+class TestRunWithProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.profile_path = os.path.join(self.temp_dir, "profile.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_profile_json(self):
+        """Test that the metrics are saved as JSON and the return value passed through."""
+        metrics = RunMetrics()
+        def run():
+            metrics.count('files_parsed')
+            return 'done'
+        with self.assertLogs('har_metrics', level='INFO'):
+            self.assertEqual(run_with_profile(run, metrics, self.profile_path), 'done')
+        with open(self.profile_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertEqual(data['counters'], {'files_parsed': 1})
+        self.assertNotIn('cprofile', data)
+
+    def test_cprofile(self):
+        """Test that cProfile stats are saved next to the JSON and summarised in it."""
+        metrics = RunMetrics()
+        with self.assertLogs('har_metrics', level='INFO'):
+            run_with_profile(lambda: sorted(range(1000), key=str), metrics, self.profile_path, use_cprofile=True)
+        with open(self.profile_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "profile.prof")))
+        self.assertTrue(data['cprofile']['top_functions'])
+        self.assertEqual(set(data['cprofile']['top_functions'][0]),
+                         {'function', 'calls', 'total_time', 'cumulative_time'})
+
+if __name__ == '__main__':
+    unittest.main()
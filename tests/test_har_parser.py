@@ -1,14 +1,22 @@
 
 import unittest
+import os
 import json
+import shutil
+import tempfile
 from unittest.mock import patch, mock_open
-from har_parser import get_item_type
+from har_parser import get_item_type, CategoryStore
+
+TEMP_PATH = './.food_or_non_food.json.abc123.tmp'
 
 class TestGetItemType(unittest.TestCase):
 
+    @patch("os.replace")
+    @patch("os.fdopen", new_callable=mock_open)
+    @patch("tempfile.mkstemp", return_value=(3, TEMP_PATH))
     @patch("os.path.exists")
     @patch("builtins.open", new_callable=mock_open)
-    def test_get_item_type_new_item(self, mock_file, mock_exists):
+    def test_get_item_type_new_item(self, mock_file, mock_exists, mock_mkstemp, mock_fdopen, mock_replace):
         """Test that a new item is added as 'unknown'."""
         mock_exists.return_value = True
         mock_file.return_value.read.return_value = json.dumps({})
@@ -16,7 +24,9 @@ class TestGetItemType(unittest.TestCase):
         item_type = get_item_type("new_item")
         
         self.assertEqual(item_type, "unknown")
-        mock_file.assert_called_with('food_or_non_food.json', 'w', encoding='utf-8')
+        mock_mkstemp.assert_called_with(prefix='.food_or_non_food.json.', suffix='.tmp', dir='.')
+        mock_fdopen.assert_called_with(3, 'w', newline=None, encoding='utf-8')
+        mock_replace.assert_called_with(TEMP_PATH, 'food_or_non_food.json')
 
     @patch("os.path.exists")
     @patch("builtins.open", new_callable=mock_open)
@@ -29,16 +39,69 @@ class TestGetItemType(unittest.TestCase):
         
         self.assertEqual(item_type, "food")
 
+    @patch("os.replace")
+    @patch("os.fdopen", new_callable=mock_open)
+    @patch("tempfile.mkstemp", return_value=(3, TEMP_PATH))
     @patch("os.path.exists")
     @patch("builtins.open", new_callable=mock_open)
-    def test_get_item_type_file_not_found(self, mock_file, mock_exists):
+    def test_get_item_type_file_not_found(self, mock_file, mock_exists, mock_mkstemp, mock_fdopen, mock_replace):
         """Test that a new file is created if it doesn't exist."""
         mock_exists.return_value = False
         
         item_type = get_item_type("any_item")
         
         self.assertEqual(item_type, "unknown")
-        mock_file.assert_called_with('food_or_non_food.json', 'w', encoding='utf-8')
+        mock_mkstemp.assert_called_with(prefix='.food_or_non_food.json.', suffix='.tmp', dir='.')
+        mock_fdopen.assert_called_with(3, 'w', newline=None, encoding='utf-8')
+        mock_replace.assert_called_with(TEMP_PATH, 'food_or_non_food.json')
+
+
+class TestCategoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.json_file_path = os.path.join(self.temp_dir, "food_or_non_food.json")
+        with open(self.json_file_path, 'w', encoding='utf-8') as f:
+            json.dump({"existing_item": "food"}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read_json_file(self):
+        with open(self.json_file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_lookups_do_not_touch_the_file(self):
+        """Test that the file is only read once and new items wait for flush()."""
+        store = CategoryStore(self.json_file_path)
+        with patch("builtins.open") as mock_file:
+            self.assertEqual(store.get_type("existing_item"), "food")
+            self.assertEqual(store.get_type("new_item"), "unknown")
+            self.assertEqual(store.get_type("new_item"), "unknown")
+            mock_file.assert_not_called()
+
+        self.assertEqual(store.new_items, ["new_item"])
+        self.assertEqual(self.read_json_file(), {"existing_item": "food"})
+
+        store.flush()
+        self.assertEqual(self.read_json_file(), {"existing_item": "food", "new_item": "unknown"})
+        self.assertEqual(os.listdir(self.temp_dir), ["food_or_non_food.json"])
+
+    def test_flush_every(self):
+        """Test that the store writes back after every N new items."""
+        store = CategoryStore(self.json_file_path, flush_every=2)
+        store.get_type("first_item")
+        self.assertNotIn("first_item", self.read_json_file())
+
+        store.get_type("second_item")
+        self.assertIn("second_item", self.read_json_file())
+
+    def test_get_item_type_with_store(self):
+        """Test that get_item_type uses an injected store without writing the file."""
+        store = CategoryStore(self.json_file_path)
+        with patch("os.replace") as mock_replace:
+            self.assertEqual(get_item_type("new_item", store), "unknown")
+            mock_replace.assert_not_called()
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import json
+import os
+import shutil
+import sys
+import tempfile
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from har_products import ProductIndex, get_item_id
+
+class TestGetItemId(unittest.TestCase):
+
+    def test_get_item_id(self):
+        """Test that usItemId is preferred over offerId and a missing ID is empty."""
+        self.assertEqual(get_item_id({"productInfo": {"usItemId": 123, "offerId": "ABC"}}), "123")
+        self.assertEqual(get_item_id({"productInfo": {"offerId": "ABC"}}), "ABC")
+        self.assertEqual(get_item_id({"usItemId": "456", "productInfo": {"name": "Soap"}}), "456")
+        self.assertEqual(get_item_id({"productInfo": None}), "")
+
+
+class TestProductIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.temp_dir, "product_index.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_canonical_name_is_latest(self):
+        """Test that the name on the most recent order is canonical, whatever the order they are added in."""
+        index = ProductIndex()
+        index.add("555", "Whole Milk, 1 Gallon", "2024-04-04")
+        index.add("555", "Milk 1 gal", "2024-01-05")
+        index.add("555", "Great Value Milk", "2024-02-01")
+        self.assertEqual(index.canonical_name("555"), "Whole Milk, 1 Gallon")
+        self.assertEqual(index.aliases("555"), ["Great Value Milk", "Milk 1 gal"])
+        self.assertIsNone(index.canonical_name("999"))
+        self.assertEqual(index.aliases("999"), [])
+
+    def test_merge_and_ids_by_name(self):
+        """Test that merging a worker's products gives the same index, and shared names go to the latest user."""
+        worker = ProductIndex()
+        worker.add("555", "Milk", "2024-01-05")
+        worker.add("777", "Milk", "2024-03-01")
+        index = ProductIndex()
+        index.add("555", "Whole Milk", "2024-04-04")
+        index.merge(worker.products)
+        self.assertEqual(index.canonical_name("555"), "Whole Milk")
+        self.assertEqual(index.ids_by_name(), {"Whole Milk": "555", "Milk": "777"})
+
+    def test_save_and_load(self):
+        """Test that the index round-trips through its file and is only written when it changed."""
+        index = ProductIndex(self.index_path)
+        index.save()
+        self.assertFalse(os.path.exists(self.index_path))
+
+        index.add("555", "Milk", "2024-01-05")
+        index.save()
+        self.assertEqual(ProductIndex(self.index_path).products, index.products)
+        self.assertEqual(os.listdir(self.temp_dir), ["product_index.json"])
+
+    def test_invalid_file(self):
+        """Test that an unreadable index is replaced with an empty one."""
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            f.write("{not json")
+        with patch("builtins.print") as mock_print:
+            index = ProductIndex(self.index_path)
+        self.assertEqual(index.products, {})
+        self.assertTrue(mock_print.call_args[0][0].startswith("Warning: Could not read the product index"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import json
+import os
+import sys
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import har_records
+from har_records import Order, OrderItem, extract_order, loads, order_date_from_title, order_date_ordinal
+
+class TestExtractOrder(unittest.TestCase):
+
+    def test_extracts_needed_fields(self):
+        """Test that the ID, title date and complete line items are extracted."""
+        response_json = {"data": {"order": {
+            "id": "123",
+            "title": "Jan 5, 2024 order",
+            "groups_2101": [
+                {"items": [
+                    {"productInfo": {"name": "Milk", "usItemId": 555}, "quantity": 2,
+                     "priceInfo": {"linePrice": {"value": 6.4}}},
+                    {"productInfo": {"name": "No Price"}, "quantity": 1},
+                    {"productInfo": None, "quantity": 1, "priceInfo": {"linePrice": {"value": 1.0}}},
+                ]},
+                {"items": None},
+            ],
+        }}}
+        order = extract_order(response_json)
+        self.assertIsInstance(order, Order)
+        self.assertEqual((order.order_id, order.order_date, order.order_day), ("123", "Jan 5, 2024", "2024-01-05"))
+        self.assertEqual(order.line_items, [OrderItem("123", "Jan 5, 2024", "Milk", "unknown", 2, 6.4, "555", 0)])
+        with self.assertRaises(AttributeError):
+            order.extra = True
+
+        order = extract_order(response_json, classify=lambda item_name: "food")
+        self.assertEqual(order.line_items[0].is_food, "food")
+
+    def test_missing_order(self):
+        """Test that responses without an order ID or title give None."""
+        self.assertIsNone(extract_order({}))
+        self.assertIsNone(extract_order({"data": None}))
+        self.assertIsNone(extract_order({"data": {"order": {"id": "1"}}}))
+
+    def test_title_without_date(self):
+        """Test that a title without a date is kept whole and has no order day."""
+        order = Order("1", order_date_from_title("Store purchase"), [])
+        self.assertEqual(order.order_date, "Store purchase")
+        self.assertIsNone(order.order_day)
+
+
+class TestDates(unittest.TestCase):
+
+    def test_order_date_ordinal(self):
+        """Test that dates with and without a leading zero give the same ordinal."""
+        self.assertEqual(order_date_ordinal("Jan 01, 2024"), order_date_ordinal("Jan 1, 2024"))
+        with self.assertRaises(ValueError):
+            order_date_ordinal("2024-01-01")
+
+
+class TestLoads(unittest.TestCase):
+
+    def test_decodes_text_and_bytes(self):
+        """Test that text and bytes decode to the same objects as json.loads."""
+        text = '{"a": [1, 2.5, "\\u00e9"], "b": null}'
+        self.assertEqual(loads(text), json.loads(text))
+        self.assertEqual(loads(text.encode('utf-8')), json.loads(text))
+
+    def test_json_module_only_values(self):
+        """Test that JSON orjson rejects decodes as it does with json.loads, and invalid JSON still raises."""
+        for text in ('{"name": "\\ud800"}', '[NaN, Infinity, -Infinity]'):
+            for data in (text, text.encode('utf-8')):
+                with self.subTest(data=data):
+                    self.assertEqual(repr(loads(data)), repr(json.loads(text)))
+        with self.assertRaises(json.JSONDecodeError):
+            loads(b'{"a": ')
+
+    @unittest.skipIf(har_records.orjson is None, "orjson is not installed")
+    def test_orjson_errors_fall_back(self):
+        """Test that any orjson decode error, such as an integer over 64 bits, retries with json.loads."""
+        text = '{"id": %d}' % 2 ** 70
+        error = har_records.orjson.JSONDecodeError("Integer exceeds 64-bit range", text, 7)
+        with patch.object(har_records.orjson, 'loads', side_effect=error):
+            self.assertEqual(loads(text), {"id": 2 ** 70})
+            with self.assertRaises(har_records.orjson.JSONDecodeError):
+                loads('{"id": ')
+
+    def test_json_module_fallback(self):
+        """Test that invalid JSON raises json.JSONDecodeError without orjson."""
+        with patch.object(har_records, 'orjson', None):
+            with self.assertRaises(json.JSONDecodeError):
+                loads('{"a": ')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+import os
+import csv
+import json
+import shutil
+import sqlite3
+import tempfile
+from har_sinks import OrderItem, CsvSink, JsonLinesSink, ListSink, SqliteSink, CSV_FIELDNAMES
+
+class TestSinks(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.items = [
+            OrderItem("2", "Feb 2, 2024", "Bread", "food", 1, "2.50", "101"),
+            OrderItem("1", "Jan 1, 2024", "Soap", "nonfood", 2, "4.00"),
+            OrderItem("3", "Mar 3, 2024", "Apples", "food", 3, "1.00"),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_csv_sink(self):
+        """Test that the CSV is named after the date range and only appears on close."""
+        sink = CsvSink(self.output_dir)
+        for item in self.items:
+            sink.write(item)
+        self.assertFalse(any(f.endswith('.csv') for f in os.listdir(self.output_dir)))
+
+        output_path = sink.close()
+        self.assertEqual(os.path.basename(output_path), "2024-01-01_2024-03-03_walmart_order_items.csv")
+        self.assertEqual(os.listdir(self.output_dir), [os.path.basename(output_path)])
+        with open(output_path, 'r', newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], CSV_FIELDNAMES)
+        self.assertEqual(rows[1], ["2", "Feb 2, 2024", "Bread", "food", "1", "2.50", "101", ""])
+        self.assertEqual(sink.count, 3)
+
+    def test_csv_sink_without_items(self):
+        """Test that an empty sink writes nothing."""
+        sink = CsvSink(os.path.join(self.output_dir, "never_created"))
+        self.assertIsNone(sink.close())
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+    def test_csv_sink_discard(self):
+        """Test that discarding removes the temp file."""
+        sink = CsvSink(self.output_dir)
+        sink.write(self.items[0])
+        sink.discard()
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+    def test_json_lines_sink(self):
+        """Test that each item becomes one JSON object per line."""
+        output_path = os.path.join(self.output_dir, "items.jsonl")
+        sink = JsonLinesSink(output_path)
+        for item in self.items:
+            sink.write(item)
+        self.assertEqual(sink.close(), output_path)
+        with open(output_path, 'r', encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(lines[0], self.items[0]._asdict())
+        self.assertEqual(len(lines), 3)
+
+    def test_list_sink(self):
+        """Test that the list sink returns the items it was given."""
+        sink = ListSink()
+        for item in self.items:
+            sink.write(item)
+        self.assertEqual(sink.close(), self.items)
+
+    def test_sqlite_sink_upserts(self):
+        """Test that writing overlapping items again updates rows instead of adding them."""
+        db_path = os.path.join(self.output_dir, "orders.db")
+        for price in ("2.50", "2.75"):
+            sink = SqliteSink(db_path)
+            for item in self.items[:2]:
+                sink.write(item)
+            sink.write(self.items[0]._replace(price=price))
+            self.assertEqual(sink.close(), db_path)
+
+        connection = sqlite3.connect(db_path)
+        rows = connection.execute(
+            "SELECT orders.order_day, item_name, quantity, price FROM line_items "
+            "JOIN orders USING (order_id) ORDER BY order_day").fetchall()
+        indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        connection.close()
+        self.assertEqual(rows, [("2024-01-01", "Soap", 2.0, 4.0), ("2024-02-02", "Bread", 1.0, 2.75)])
+        self.assertTrue({"idx_orders_order_day", "idx_line_items_item_name", "idx_line_items_is_food"} <= indexes)
+
+    def test_sqlite_sink_keeps_repeated_lines(self):
+        """Test that two lines of the same item in one order are both kept, and a later capture replaces them."""
+        db_path = os.path.join(self.output_dir, "orders.db")
+        lines = [self.items[0], self.items[0]._replace(quantity=2), self.items[1]]
+        for written in (lines, lines[:1]):
+            sink = SqliteSink(db_path)
+            for item in written:
+                sink.write(item)
+            sink.close()
+            connection = sqlite3.connect(db_path)
+            rows = connection.execute(
+                "SELECT order_id, line_number, item_name, quantity FROM line_items ORDER BY order_id, line_number")
+            self.assertEqual(rows.fetchall(), [
+                ("1", 0, "Soap", 2.0), ("2", 0, "Bread", 1.0), ("2", 1, "Bread", 2.0)
+            ] if written is lines else [("1", 0, "Soap", 2.0), ("2", 0, "Bread", 1.0)])
+            connection.close()
+
+    def test_sqlite_sink_adjacent_captures(self):
+        """Test that an order captured twice in a row keeps only its later capture."""
+        db_path = os.path.join(self.output_dir, "orders.db")
+        first = [self.items[0]._replace(line_number=0), self.items[0]._replace(item_name="Rolls", line_number=1)]
+        second = [self.items[0]._replace(price="2.75", line_number=0)]
+        sink = SqliteSink(db_path)
+        for item in first + second:
+            sink.write(item)
+        sink.close()
+        connection = sqlite3.connect(db_path)
+        rows = connection.execute("SELECT line_number, item_name, price FROM line_items").fetchall()
+        connection.close()
+        self.assertEqual(rows, [(0, "Bread", 2.75)])
+
+    def test_sqlite_sinks_do_not_block_each_other(self):
+        """Test that a sink holds no lock until it is closed, so batch workers can share the database."""
+        db_path = os.path.join(self.output_dir, "orders.db")
+        sinks = [SqliteSink(db_path) for _ in self.items]
+        for sink, item in zip(sinks, self.items):
+            sink.write(item)
+        for sink in reversed(sinks):
+            sink.close()
+        connection = sqlite3.connect(db_path, timeout=0)
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM line_items").fetchone(), (3,))
+        connection.close()
+
+    def test_sqlite_sink_migrates_old_databases(self):
+        """Test that a database from before item IDs and line numbers is brought up to date when opened."""
+        db_path = os.path.join(self.output_dir, "orders.db")
+        connection = sqlite3.connect(db_path)
+        connection.executescript(
+            "CREATE TABLE orders (order_id TEXT PRIMARY KEY, order_date TEXT NOT NULL, order_day TEXT NOT NULL);"
+            "CREATE TABLE line_items (order_id TEXT NOT NULL, item_name TEXT NOT NULL, is_food TEXT NOT NULL, "
+            "quantity REAL NOT NULL, price REAL NOT NULL, PRIMARY KEY (order_id, item_name));"
+            "CREATE INDEX idx_line_items_item_name ON line_items(item_name);"
+            "INSERT INTO orders VALUES ('1', 'Jan 1, 2024', '2024-01-01');"
+            "INSERT INTO line_items VALUES ('1', 'Soap', 'nonfood', 2, 4.0), ('1', 'Towels', 'nonfood', 1, 3.0);")
+        connection.close()
+
+        sink = SqliteSink(db_path)
+        sink.write(self.items[0])
+        sink.close()
+        connection = sqlite3.connect(db_path)
+        self.assertEqual(connection.execute(
+            "SELECT order_id, line_number, item_name, item_id FROM line_items ORDER BY order_id, line_number"
+        ).fetchall(), [("1", 0, "Soap", ""), ("1", 1, "Towels", ""), ("2", 0, "Bread", "101")])
+        indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        connection.close()
+        self.assertTrue({"idx_line_items_item_name", "idx_line_items_is_food", "idx_line_items_item_id"} <= indexes)
+
+    def test_sqlite_sink_discard(self):
+        """Test that discarded items are never written."""
+        db_path = os.path.join(self.output_dir, "orders.db")
+        sink = SqliteSink(db_path)
+        sink.write(self.items[0])
+        sink.discard()
+
+        connection = sqlite3.connect(db_path)
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM line_items").fetchone(), (0,))
+        connection.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,257 @@
+import unittest
+import bz2
+import gzip
+import io
+import lzma
+import os
+import json
+import shutil
+import tempfile
+import zipfile
+from unittest.mock import patch
+from har_records import loads
+from har_stream import HarDecompressionError, HarEntryScanner, HarOrderPrefilter, detect_compression, open_har
+
+class TestHarEntryScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.entries = [
+            {"request": {"url": "https://example.com/a"}, "response": {"content": {"text": "{\"x\": [1, 2]}"}}},
+            {"request": {"url": "https://example.com/b"}, "response": {"content": {"text": "quote \" brace } bracket ] \\\\"}}},
+            {"request": {"url": "https://example.com/c"}, "_resourceType": "xhr", "response": {"content": {"text": "x" * 5000}}},
+        ]
+        self.har_data = {
+            "log": {
+                "version": "1.2",
+                "pages": [{"title": "entries", "id": "page_1"}],
+                "entries": self.entries,
+            }
+        }
+
+    def scan(self, text, chunk_size=7):
+        scanner = HarEntryScanner(io.BytesIO(text.encode('utf-8')), chunk_size=chunk_size)
+        return scanner, list(scanner)
+
+    def test_yields_every_entry(self):
+        """Test that entries come back unchanged regardless of chunk boundaries."""
+        for chunk_size in (1, 7, 64, 1024 * 1024):
+            scanner, entries = self.scan(json.dumps(self.har_data), chunk_size)
+            self.assertTrue(scanner.found_entries)
+            self.assertEqual(entries, self.entries)
+
+    def test_pretty_printed_file(self):
+        """Test that whitespace and key order around 'entries' don't matter."""
+        har_data = {"log": {"entries": self.entries, "creator": {"name": "entries"}}}
+        scanner, entries = self.scan(json.dumps(har_data, indent=2))
+        self.assertEqual(entries, self.entries)
+
+    def test_raw_entry_offsets(self):
+        """Test that raw entries are reported at their offset in the file."""
+        text = json.dumps(self.har_data)
+        scanner = HarEntryScanner(io.BytesIO(text.encode('utf-8')), chunk_size=16)
+        for offset, raw_entry in scanner.iter_raw_entries():
+            self.assertEqual(text.encode('utf-8')[offset:offset + len(raw_entry)], raw_entry)
+
+    def test_missing_entries(self):
+        """Test that a HAR without 'log.entries' yields nothing."""
+        scanner, entries = self.scan(json.dumps({"log": {"pages": [], "other": {"entries": []}}}))
+        self.assertFalse(scanner.found_entries)
+        self.assertEqual(entries, [])
+
+    def test_truncated_file(self):
+        """Test that a truncated HAR raises a JSONDecodeError."""
+        text = json.dumps(self.har_data)
+        with self.assertRaises(json.JSONDecodeError):
+            self.scan(text[:len(text) // 2])
+
+
+class TestHarOrderPrefilter(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.har_file_path = os.path.join(self.temp_dir, "capture.har")
+        self.order_entry = {
+            "_resourceType": "fetch",
+            "request": {"url": "https://www.walmart.com/orchestra/orders/graphql/getOrder/1"},
+            "response": {"content": {"text": "{}"}},
+        }
+        self.noise_entry = {
+            "_resourceType": "image",
+            "request": {"url": "https://i5.walmartimages.com/a.png"},
+            "response": {"content": {"text": "A" * 10000}},
+        }
+        with open(self.har_file_path, 'w', encoding='utf-8') as f:
+            json.dump({"log": {"entries": [self.noise_entry, self.order_entry, self.noise_entry]}}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def prefilter(self, use_index=False):
+        return HarOrderPrefilter(self.har_file_path, b'/orchestra/orders/graphql/getOrder/', use_index=use_index)
+
+    def test_only_candidates_are_decoded(self):
+        """Test that entries without the marker are never decoded."""
+        prefilter = self.prefilter()
+        with patch("har_stream.loads", wraps=loads) as mock_loads:
+            entries = list(prefilter)
+        prefilter.close()
+        self.assertEqual(entries, [self.order_entry])
+        self.assertEqual(mock_loads.call_count, 1)
+        self.assertTrue(prefilter.found_entries)
+
+    def test_matches_are_found_in_any_entry(self):
+        """Test that jumping between matches finds the same entries as walking every entry."""
+        order_url = self.order_entry["request"]["url"]
+        # Matches far into an entry, after escapes and brackets in strings and
+        # nested objects, and long after the last entry with a match
+        call_frames = [{"url": f"https://example.com/{n}.js", "text": "\\\"]} " * 20} for n in range(400)]
+        call_frames.append({"url": order_url})
+        initiator = {"type": "script", "stack": {"parent": {"callFrames": call_frames}}}
+        escaped_entry = {"request": {"url": "https://example.com/"},
+                         "response": {"content": {"text": "{\"a\": \"[\\\\\"]\"} " * 20000}}}
+        entries = [
+            self.order_entry,
+            escaped_entry,
+            {"_initiator": initiator, "request": {"url": order_url}, "response": {"content": {"text": "{}"}}},
+            {"request": {"url": "https://www.walmart.com/"},
+             "response": {"content": {"text": json.dumps({"next": [order_url, "{\\"]})}}},
+            self.noise_entry,
+            {"request": {"url": order_url}},
+        ]
+        har_data = {"log": {"pages": [{"title": order_url}], "entries": entries, "comment": order_url}}
+        marker = b'/orchestra/orders/graphql/getOrder/'
+        for indent in (None, 2):
+            with open(self.har_file_path, 'w', encoding='utf-8') as f:
+                json.dump(har_data, f, indent=indent)
+            with open(self.har_file_path, 'rb') as f:
+                expected = list(HarEntryScanner(f).iter_raw_entries(marker))
+            prefilter = self.prefilter()
+            self.assertEqual(list(prefilter.iter_raw_entries()), expected)
+            prefilter.close()
+            self.assertEqual([loads(raw_entry) for _, raw_entry in expected], entries[:1] + entries[2:4] + entries[5:])
+
+        # A file cut off inside an entry holding a match
+        with open(self.har_file_path, 'r+', encoding='utf-8') as f:
+            text = f.read()
+            f.truncate(text.rindex(order_url, 0, text.index('"comment"')) + len(order_url))
+        prefilter = self.prefilter()
+        with self.assertRaises(json.JSONDecodeError):
+            list(prefilter)
+        prefilter.close()
+
+    def test_matches_after_the_entries_are_skipped(self):
+        """Test that a marker in a 'log' member after 'entries' is not taken for an entry."""
+        order_url = self.order_entry["request"]["url"]
+        for noise_count in (0, 40):
+            entries = [self.order_entry] + [self.noise_entry] * noise_count
+            har_data = {"log": {"entries": entries, "_extra": {"lastUrl": order_url, "list": [{"url": order_url}]}}}
+            with open(self.har_file_path, 'w', encoding='utf-8') as f:
+                json.dump(har_data, f)
+            prefilter = self.prefilter()
+            self.assertEqual(list(prefilter), [self.order_entry])
+            prefilter.close()
+
+    def test_offset_index_is_reused(self):
+        """Test that a second run reads the offsets from the sidecar index."""
+        prefilter = self.prefilter(use_index=True)
+        self.assertEqual(list(prefilter), [self.order_entry])
+        prefilter.close()
+        self.assertFalse(prefilter.used_index)
+        self.assertTrue(os.path.exists(self.har_file_path + HarOrderPrefilter.INDEX_SUFFIX))
+
+        prefilter = self.prefilter(use_index=True)
+        with patch("har_stream.HarEntryScanner") as mock_scanner:
+            self.assertEqual(list(prefilter), [self.order_entry])
+            mock_scanner.assert_not_called()
+        prefilter.close()
+        self.assertTrue(prefilter.used_index)
+
+    def test_stale_offset_index_is_ignored(self):
+        """Test that the index is rebuilt when the HAR file changes."""
+        prefilter = self.prefilter(use_index=True)
+        list(prefilter)
+        prefilter.close()
+
+        with open(self.har_file_path, 'w', encoding='utf-8') as f:
+            json.dump({"log": {"entries": [self.order_entry, self.order_entry]}}, f)
+
+        prefilter = self.prefilter(use_index=True)
+        self.assertEqual(list(prefilter), [self.order_entry, self.order_entry])
+        prefilter.close()
+        self.assertFalse(prefilter.used_index)
+
+    def test_empty_file(self):
+        """Test that a file that can't be memory-mapped falls back to reading it."""
+        open(self.har_file_path, 'w').close()
+        prefilter = self.prefilter()
+        self.assertEqual(list(prefilter), [])
+        prefilter.close()
+        self.assertFalse(prefilter.found_entries)
+
+    def test_compressed_file(self):
+        """Test that a compressed HAR is scanned as a stream and never indexed."""
+        with open(self.har_file_path, 'rb') as f:
+            compressed = gzip.compress(f.read())
+        with open(self.har_file_path, 'wb') as f:
+            f.write(compressed)
+        prefilter = self.prefilter(use_index=True)
+        with patch("har_stream.loads", wraps=loads) as mock_loads:
+            self.assertEqual(list(prefilter), [self.order_entry])
+        prefilter.close()
+        self.assertEqual(mock_loads.call_count, 1)
+        self.assertEqual(prefilter.compression, 'gzip')
+        self.assertFalse(os.path.exists(self.har_file_path + HarOrderPrefilter.INDEX_SUFFIX))
+
+
+class TestOpenHar(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.content = json.dumps({"log": {"entries": [{"request": {"url": "https://example.com/"}}]}}).encode('utf-8')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, file_name, content):
+        file_path = os.path.join(self.temp_dir, file_name)
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        return file_path
+
+    def read(self, file_path):
+        with open_har(file_path) as f:
+            return f.read()
+
+    def test_formats_are_detected_by_magic_bytes(self):
+        """Test that every format is decompressed whatever the file is called."""
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("notes.txt", "not a capture")
+            archive.writestr("captures/orders.har", self.content)
+        files = {
+            'plain': (None, self.content),
+            'gzip': ('gzip', gzip.compress(self.content)),
+            'bz2': ('bz2', bz2.compress(self.content)),
+            'xz': ('xz', lzma.compress(self.content)),
+            'zip': ('zip', zip_buffer.getvalue()),
+        }
+        for name, (compression, content) in files.items():
+            file_path = self.write(f"{name}.har", content)
+            self.assertEqual(detect_compression(file_path), compression, name)
+            self.assertEqual(self.read(file_path), self.content, name)
+
+    def test_invalid_archives(self):
+        """Test that corrupt, truncated and ambiguous archives raise HarDecompressionError."""
+        corrupt_path = self.write("corrupt.har.gz", b'\x1f\x8b' + b'\x00' * 32)
+        truncated_path = self.write("truncated.har.xz", lzma.compress(self.content)[:-20])
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w') as archive:
+            archive.writestr("a.har", self.content)
+            archive.writestr("b.har", self.content)
+        ambiguous_path = self.write("two.zip", zip_buffer.getvalue())
+        for file_path in (corrupt_path, truncated_path, ambiguous_path):
+            with self.assertRaises(HarDecompressionError):
+                self.read(file_path)
+
+if __name__ == "__main__":
+    unittest.main()
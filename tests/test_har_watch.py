@@ -0,0 +1,121 @@
+import unittest
+import json
+import os
+import shutil
+import sys
+import tempfile
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analytics.spend_rollups import ROLLUP_FILE
+from har_watch import HarWatcher, is_har_file_name, watch
+
+def write_har(har_file_path, order_id, order_title, item_names):
+    """Writes a minimal HAR with one getOrder entry holding the given items."""
+    items = [{"productInfo": {"name": name}, "quantity": 1, "priceInfo": {"linePrice": {"value": "2.00"}}}
+             for name in item_names]
+    order = {"data": {"order": {"id": order_id, "title": order_title, "groups_2101": [{"items": items}]}}}
+    entry = {
+        "_resourceType": "fetch",
+        "request": {"url": f"https://www.walmart.com/orchestra/orders/graphql/getOrder/{order_id}"},
+        "response": {"content": {"text": json.dumps(order)}},
+    }
+    with open(har_file_path, 'w', encoding='utf-8') as f:
+        json.dump({"log": {"entries": [entry]}}, f)
+
+class TestHarWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.watch_dir = tempfile.mkdtemp()
+        self.har_file_path = os.path.join(self.watch_dir, "capture.har")
+
+    def tearDown(self):
+        shutil.rmtree(self.watch_dir)
+
+    def test_is_har_file_name(self):
+        """Test that HAR files match whether compressed or not, and partial or other files don't."""
+        for file_name in ("a.har", "B.HAR", "a.har.gz", "a.har.xz", "a.zip"):
+            self.assertTrue(is_har_file_name(file_name), file_name)
+        for file_name in ("a.csv", "a.har.crdownload", ".a.har", "a.orders.jsonl"):
+            self.assertFalse(is_har_file_name(file_name), file_name)
+
+    def test_file_is_ready_once_its_size_is_stable(self):
+        """Test that a file is reported after it stops changing, once, and again after it changes."""
+        watcher = HarWatcher(self.watch_dir, settle_polls=1)
+        with open(self.har_file_path, 'w', encoding='utf-8') as f:
+            f.write('{"log": ')
+        with open(os.path.join(self.watch_dir, "notes.txt"), 'w', encoding='utf-8') as f:
+            f.write("not a capture")
+
+        self.assertEqual(watcher.poll(), [])
+        # Still being written
+        with open(self.har_file_path, 'a', encoding='utf-8') as f:
+            f.write('{"entries": []}}')
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(watcher.poll(), [self.har_file_path])
+        self.assertEqual(watcher.poll(), [])
+
+        with open(self.har_file_path, 'a', encoding='utf-8') as f:
+            f.write('\n')
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(watcher.poll(), [self.har_file_path])
+
+        # A file that is removed and copied in again is picked up again
+        os.remove(self.har_file_path)
+        self.assertEqual(watcher.poll(), [])
+        write_har(self.har_file_path, "1", "Jan 1, 2024", ["Milk"])
+        watcher.poll()
+        self.assertEqual(watcher.poll(), [self.har_file_path])
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.watch_dir = os.path.join(self.temp_dir, "captures")
+        self.output_dir = os.path.join(self.temp_dir, "output")
+        self.analytics_dir = os.path.join(self.temp_dir, "analytics")
+        for directory in (self.watch_dir, self.output_dir, self.analytics_dir):
+            os.makedirs(directory)
+        self.category_file = os.path.join(self.temp_dir, "food_or_non_food.json")
+        with open(self.category_file, 'w', encoding='utf-8') as f:
+            json.dump({"Milk": "food"}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def watch(self, max_polls=3):
+        watch(self.watch_dir, self.output_dir, interval=0, max_polls=max_polls, analytics_dir=self.analytics_dir,
+              jobs=1, category_file=self.category_file, rules_file=None)
+
+    @patch("builtins.print")
+    def test_new_captures_are_ingested(self, mock_print):
+        """Test that a new HAR is parsed and the price history and spend rollups are refreshed."""
+        write_har(os.path.join(self.watch_dir, "a.har"), "1", "Jan 1, 2024", ["Milk"])
+        self.watch()
+        csv_files = [f for f in os.listdir(self.output_dir) if f.endswith('.csv')]
+        self.assertEqual(len(csv_files), 1)
+        with open(os.path.join(self.analytics_dir, "historical_prices_data.json"), 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {})  # Items need two observations to be ranked
+        self.assertTrue(os.path.exists(os.path.join(self.analytics_dir, ROLLUP_FILE)))
+
+        # A later run skips the parsed capture and only adds the new one
+        write_har(os.path.join(self.watch_dir, "b.har"), "2", "Feb 1, 2024", ["Milk"])
+        self.watch()
+        csv_files = [f for f in os.listdir(self.output_dir) if f.endswith('.csv')]
+        self.assertEqual(len(csv_files), 2)
+        with open(os.path.join(self.analytics_dir, "historical_prices_data.json"), 'r', encoding='utf-8') as f:
+            self.assertEqual([p["cost"] for p in json.load(f)["Milk"]], [2.0, 2.0])
+
+    @patch("builtins.print")
+    def test_failed_batch_keeps_watching(self, mock_print):
+        """Test that an error while ingesting is reported without stopping the watcher."""
+        write_har(os.path.join(self.watch_dir, "a.har"), "1", "Jan 1, 2024", ["Milk"])
+        with patch("har_watch.ingest", side_effect=OSError("disk full")) as mock_ingest:
+            self.watch(max_polls=5)
+        mock_ingest.assert_called_once()
+        mock_print.assert_any_call("Error: Could not ingest the new HAR files. Error: disk full")
+
+if __name__ == "__main__":
+    unittest.main()
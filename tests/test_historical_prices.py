@@ -1,6 +1,10 @@
 
 import unittest
+import io
 import os
+import gzip
+import shutil
+import tempfile
 import sys
 import csv
 import json
@@ -9,30 +13,43 @@ from unittest.mock import patch
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from analytics.historical_prices import read_csv, process_and_save_data
+from analytics.historical_prices import (read_csv, read_csv_series, read_sqlite, process_and_save_data,
+                                         write_price_json, series_stats, rank_items, PriceSeries, AggregationCache,
+                                         aggregation_cache_path, CACHE_PREFIX, DASHBOARD_DATA_DIR)
+from har_compact import compact_csvs
+from har_metrics import RunMetrics
+from har_products import PRODUCT_INDEX_FILE, ProductIndex
+from har_sinks import OrderItem, SqliteSink, CSV_FIELDNAMES
 
 class TestProcessAndSaveData(unittest.TestCase):
 
     def setUp(self):
-        self.output_dir = "output"
-        self.analytics_dir = "analytics"
-        os.makedirs(self.output_dir, exist_ok=True)
-        os.makedirs(self.analytics_dir, exist_ok=True)
+        self.temp_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.temp_dir, "output")
+        self.analytics_dir = os.path.join(self.temp_dir, "analytics")
+        os.makedirs(self.output_dir)
+        os.makedirs(self.analytics_dir)
 
     def tearDown(self):
-        if os.path.exists(self.output_dir):
-            for f in os.listdir(self.output_dir):
-                os.remove(os.path.join(self.output_dir, f))
-            os.rmdir(self.output_dir)
-        
-        json_file_path = os.path.join(self.analytics_dir, "historical_prices_data.json")
-        if os.path.exists(json_file_path):
-            os.remove(json_file_path)
+        shutil.rmtree(self.temp_dir)
+
+    def process(self, **kwargs):
+        process_and_save_data(output_dir=self.output_dir, analytics_dir=self.analytics_dir, **kwargs)
+
+    def write_csv(self, file_name, rows):
+        with open(os.path.join(self.output_dir, file_name), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDNAMES[:len(rows[0])])
+            writer.writerows(rows)
+
+    def read_json_bytes(self):
+        with open(os.path.join(self.analytics_dir, "historical_prices_data.json"), 'rb') as f:
+            return f.read()
 
     @patch("builtins.print")
     def test_process_and_save_data_no_csv_files(self, mock_print):
         """Test that no CSV files are found."""
-        process_and_save_data()
+        self.process()
         mock_print.assert_any_call("No CSV files found in the 'output' directory.")
 
     def test_process_and_save_data_valid_csv_files(self):
@@ -48,7 +65,7 @@ class TestProcessAndSaveData(unittest.TestCase):
             writer.writerow(["order_id", "order_date", "item_name", "is_food", "quantity", "price"])
             writer.writerow(["12345", "Jan 02, 2024", "Test Item", "unknown", "1", "12.00"])
 
-        process_and_save_data()
+        self.process()
 
         # Check that the JSON file was created
         json_file_path = os.path.join(self.analytics_dir, "historical_prices_data.json")
@@ -61,15 +78,231 @@ class TestProcessAndSaveData(unittest.TestCase):
             self.assertEqual(data["Test Item"][0]["cost"], 10.00)
             self.assertEqual(data["Test Item"][1]["cost"], 12.00)
 
+    def test_process_and_save_data_dashboard_shards(self):
+        """Test that the index lists every item and each item's series is in its shard."""
+        rows = []
+        for i in range(100):
+            rows.append([str(i), "Jan 01, 2024", f"Item {i}", "unknown", "1", "1.00"])
+            rows.append([str(i), "Jan 02, 2024", f"Item {i}", "unknown", "2", f"{i + 1}.00"])
+        self.write_csv("sample.csv", rows)
+        self.process()
+
+        with open(os.path.join(self.analytics_dir, "historical_prices_data.json"), 'r', encoding='utf-8') as f:
+            full_data = json.load(f)
+
+        data_dir = os.path.join(self.analytics_dir, DASHBOARD_DATA_DIR)
+        with open(os.path.join(data_dir, "index.json"), 'rb') as f:
+            index_bytes = f.read()
+        with gzip.open(os.path.join(data_dir, "index.json.gz"), 'rb') as f:
+            self.assertEqual(f.read(), index_bytes)
+        self.assertNotIn(b'\n', index_bytes)
+
+        index = json.loads(index_bytes)
+        self.assertEqual(index['shard_count'], 2)
+        items = [dict(zip(index['fields'], row)) for row in index['items']]
+        self.assertEqual([item['name'] for item in items], list(full_data))
+        self.assertEqual(items[0]['rank'], 1)
+        self.assertEqual(items[0]['last_unit_cost'], 50.0)
+
+        for item in items:
+            with open(os.path.join(data_dir, index['shard_dir'], f"{item['shard']}.json"), 'r', encoding='utf-8') as f:
+                self.assertEqual(json.load(f)[item['name']], full_data[item['name']])
+
+        # A run with fewer shards writes a new generation and removes the old one
+        self.write_csv("sample.csv", rows[:20])
+        self.process()
+        with open(os.path.join(data_dir, "index.json"), 'r', encoding='utf-8') as f:
+            new_index = json.load(f)
+        self.assertEqual(new_index['shard_count'], 1)
+        self.assertNotEqual(new_index['shard_dir'], index['shard_dir'])
+        self.assertEqual(os.listdir(os.path.join(data_dir, "shards")), [os.path.basename(new_index['shard_dir'])])
+        with open(os.path.join(data_dir, new_index['shard_dir'], "0.json"), 'r', encoding='utf-8') as f:
+            self.assertEqual(len(json.load(f)), 10)
+
+    def test_process_and_save_data_cache(self):
+        """Test that only changed CSV files are re-read and the output matches a full rebuild."""
+        self.write_csv("sample1.csv", [["1", "Jan 01, 2024", "Test Item", "unknown", "1", "10.00"],
+                                       ["1", "Jan 01, 2024", "Other Item", "unknown", "2", "3.00"]])
+        self.write_csv("sample2.csv", [["2", "Jan 02, 2024", "Test Item", "unknown", "1", "12.00"]])
+        self.process()
+
+        with patch("analytics.historical_prices.read_csv_series") as mock_read_csv, \
+                patch("analytics.historical_prices.rank_items") as mock_rank_items:
+            self.process()
+            mock_read_csv.assert_not_called()
+            # Nothing changed, so the outputs are left as they are
+            mock_rank_items.assert_not_called()
+
+        self.write_csv("sample3.csv", [["3", "Jan 03, 2024", "Other Item", "unknown", "1", "1.75"]])
+        metrics = RunMetrics()
+        with patch("analytics.historical_prices.read_csv_series", wraps=read_csv_series) as mock_read_csv:
+            self.process(metrics=metrics)
+            mock_read_csv.assert_called_once()
+            self.assertEqual(os.path.basename(mock_read_csv.call_args[0][0]), "sample3.csv")
+        cached_output = self.read_json_bytes()
+        self.assertEqual(metrics.counters, {
+            'csv_files_cached': 2, 'csv_files_read': 1, 'rows_read': 4, 'items': 2, 'items_ranked': 2
+        })
+        self.assertTrue({'read_cache', 'read_csv', 'merge', 'rank', 'write_json', 'write_dashboard'}
+                        <= set(metrics.timers))
+
+        self.process(use_cache=False)
+        self.assertEqual(self.read_json_bytes(), cached_output)
+
+        # A changed file and a backfilled one that sorts first are the only ones read
+        self.write_csv("sample1.csv", [["1", "Jan 01, 2024", "Test Item", "unknown", "1", "9.00"]])
+        self.write_csv("sample0.csv", [["0", "Dec 31, 2023", "Test Item", "unknown", "1", "8.00"]])
+        metrics = RunMetrics()
+        with patch("analytics.historical_prices.read_csv_series", wraps=read_csv_series) as mock_read_csv:
+            self.process(metrics=metrics)
+            self.assertEqual(sorted(os.path.basename(call[0][0]) for call in mock_read_csv.call_args_list),
+                             ["sample0.csv", "sample1.csv"])
+        self.assertEqual(metrics.counters['csv_files_cached'], 2)
+        cached_output = self.read_json_bytes()
+        self.assertEqual([p["cost"] for p in json.loads(cached_output)["Test Item"]], [8.00, 9.00, 12.00])
+        self.process(use_cache=False)
+        self.assertEqual(self.read_json_bytes(), cached_output)
+
+        # A removed file is dropped from the output and the cache
+        os.remove(os.path.join(self.output_dir, "sample0.csv"))
+        self.process()
+        self.assertEqual([p["cost"] for p in json.loads(self.read_json_bytes())["Test Item"]], [9.00, 12.00])
+        cache = AggregationCache(aggregation_cache_path(self.analytics_dir, self.output_dir))
+        self.assertEqual(sorted(os.path.basename(path) for path in cache.files),
+                         ["sample1.csv", "sample2.csv", "sample3.csv"])
+
+    def test_process_and_save_data_cache_per_source(self):
+        """Test that the output directory and the compacted CSV keep separate caches."""
+        self.write_csv("sample1.csv", [["1", "Jan 01, 2024", "Test Item", "unknown", "1", "10.00"]])
+        self.write_csv("sample2.csv", [["1", "Jan 01, 2024", "Test Item", "unknown", "1", "10.00"],
+                                       ["2", "Jan 02, 2024", "Test Item", "unknown", "1", "12.00"]])
+        # Outside the output directory, so the default runs don't read it
+        csv_path = os.path.join(self.temp_dir, "compacted.csv")
+        compact_csvs([os.path.join(self.output_dir, f) for f in ("sample1.csv", "sample2.csv")], csv_path)
+        self.process()
+        from_output_dir = self.read_json_bytes()
+        self.process(csv_path=csv_path)
+        from_compacted = self.read_json_bytes()
+        self.assertNotEqual(from_compacted, from_output_dir)
+
+        with patch("analytics.historical_prices.read_csv_series") as mock_read_csv:
+            self.process()
+            # The outputs were overwritten by the compacted run, so they are written again
+            self.assertEqual(self.read_json_bytes(), from_output_dir)
+            self.process(csv_path=csv_path)
+            self.assertEqual(self.read_json_bytes(), from_compacted)
+            mock_read_csv.assert_not_called()
+
+    def test_aggregation_cache_round_trip(self):
+        """Test that each file's series and names are saved and loaded unchanged."""
+        cache_path = os.path.join(self.analytics_dir, CACHE_PREFIX + "test.json")
+        csv_path = os.path.join(self.output_dir, "a.csv")
+        self.write_csv("a.csv", [["1", "Jan 01, 2024", "Milk", "food", "2", "3.00", "555"]])
+        stat = os.stat(csv_path)
+        cache = AggregationCache(cache_path)
+        series = PriceSeries()
+        series.append(738886, 3.0, 2.0)
+        cache.put(csv_path, stat, {"555": series}, {"555": (738886, "Milk")})
+        cache.save()
+
+        cache = AggregationCache(cache_path)
+        self.assertFalse(cache.changed)
+        file_series, file_names = cache.get(csv_path, stat)
+        self.assertEqual(file_names, {"555": (738886, "Milk")})
+        self.assertEqual(file_series["555"].to_lists(), series.to_lists())
+
+        # Touching the file makes its entry stale
+        os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        self.assertIsNone(cache.get(csv_path, os.stat(csv_path)))
+
+    def test_process_and_save_data_from_sqlite(self):
+        """Test that the JSON can be built from the SQLite database instead of CSV files."""
+        db_path = os.path.join(self.output_dir, "walmart_orders.db")
+        sink = SqliteSink(db_path)
+        sink.write(OrderItem("2", "Jan 2, 2024", "Test Item", "unknown", 1, "12.00"))
+        sink.write(OrderItem("1", "Jan 1, 2024", "Test Item", "unknown", 1, "10.00"))
+        sink.write(OrderItem("1", "Jan 1, 2024", "Single Item", "unknown", 1, "3.00"))
+        sink.close()
+
+        self.process(db_path=db_path)
+
+        json_file_path = os.path.join(self.analytics_dir, "historical_prices_data.json")
+        with open(json_file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertEqual(list(data), ["Test Item"])
+        self.assertEqual([p["cost"] for p in data["Test Item"]], [10.00, 12.00])
+        self.assertEqual(data["Test Item"][0]["date"], "2024-01-01T00:00:00")
+
+        self.assertEqual(list(read_sqlite(db_path, item_name="Single Item")), ["Single Item"])
+
+    def test_process_and_save_data_groups_by_item_id(self):
+        """Test that a renamed product keeps one series under its latest name, including rows without an ID."""
+        self.write_csv("sample1.csv", [["1", "Jan 01, 2024", "Milk 1 gal", "food", "1", "3.00"]])
+        self.write_csv("sample2.csv", [["2", "Feb 01, 2024", "Milk 1 gal", "food", "1", "3.25", "555"],
+                                       ["3", "Mar 01, 2024", "Whole Milk, 1 Gallon", "food", "1", "3.50", "555"],
+                                       ["3", "Mar 01, 2024", "Soap", "nonfood", "1", "2.00", "777"],
+                                       ["4", "Mar 02, 2024", "Soap", "nonfood", "1", "2.50", "777"]])
+
+        # Without the index, the ID's latest name is used and the old rows stay separate
+        self.process(use_cache=False)
+        data = json.loads(self.read_json_bytes())
+        self.assertEqual(sorted(data), ["Soap", "Whole Milk, 1 Gallon"])
+
+        product_index = ProductIndex(os.path.join(self.output_dir, PRODUCT_INDEX_FILE))
+        product_index.add("555", "Milk 1 gal", "2024-02-01")
+        product_index.add("555", "Whole Milk, 1 Gallon", "2024-03-01")
+        product_index.save()
+        metrics = RunMetrics()
+        self.process(metrics=metrics)
+        data = json.loads(self.read_json_bytes())
+        self.assertEqual(list(data), ["Whole Milk, 1 Gallon", "Soap"])
+        self.assertEqual([p["cost"] for p in data["Whole Milk, 1 Gallon"]], [3.00, 3.25, 3.50])
+        self.assertEqual(metrics.counters['series_merged'], 1)
+
+    def test_process_and_save_data_from_compacted_csv(self):
+        """Test that the compacted CSV is read on its own, without the rows it deduplicated."""
+        self.write_csv("sample1.csv", [["1", "Jan 01, 2024", "Test Item", "unknown", "1", "10.00"]])
+        self.write_csv("sample2.csv", [["1", "Jan 01, 2024", "Test Item", "unknown", "1", "10.00"],
+                                       ["2", "Jan 02, 2024", "Test Item", "unknown", "1", "12.00"]])
+        self.process(use_cache=False)
+        data = json.loads(self.read_json_bytes())
+        self.assertEqual([p["cost"] for p in data["Test Item"]], [10.00, 10.00, 12.00])
+
+        csv_path = os.path.join(self.output_dir, "compacted.csv")
+        compact_csvs([os.path.join(self.output_dir, f) for f in ("sample1.csv", "sample2.csv")], csv_path)
+        self.process(use_cache=False, csv_path=csv_path)
+        data = json.loads(self.read_json_bytes())
+        self.assertEqual([p["cost"] for p in data["Test Item"]], [10.00, 12.00])
+
+    def test_process_and_save_data_from_order_items(self):
+        """Test that OrderItem records give the same JSON as the CSV they would be written to."""
+        rows = [["1", "Jan 01, 2024", "Test Item", "unknown", "1", "10.00", "555"],
+                ["2", "Jan 02, 2024", "Renamed Item", "unknown", "2", "12.00", "555"],
+                ["2", "Jan 02, 2024", "Other Item", "unknown", "1", "3.00", ""]]
+        self.write_csv("sample1.csv", rows)
+        self.process(use_cache=False)
+        from_csv = self.read_json_bytes()
+
+        items = [OrderItem(order_id, order_date, item_name, is_food, int(quantity), float(price), item_id)
+                 for order_id, order_date, item_name, is_food, quantity, price, item_id in rows]
+        metrics = RunMetrics()
+        self.process(order_items=items, metrics=metrics)
+        self.assertEqual(self.read_json_bytes(), from_csv)
+        self.assertEqual(metrics.counters['rows_read'], 3)
+        self.assertNotIn('csv_files_read', metrics.counters)
+
+    @patch("builtins.print")
+    def test_process_and_save_data_compacted_csv_not_found(self, mock_print):
+        """Test that a missing compacted CSV is reported."""
+        self.process(csv_path=os.path.join(self.output_dir, "missing.csv"))
+        mock_print.assert_any_call(f"Error: The file was not found at '{os.path.join(self.output_dir, 'missing.csv')}'")
+
     @patch("builtins.print")
     def test_process_and_save_data_output_dir_not_found(self, mock_print):
         """Test that the output directory not found is handled."""
-        # Temporarily rename the output directory
-        os.rename(self.output_dir, "output_temp")
-        process_and_save_data()
-        # Rename it back
-        os.rename("output_temp", self.output_dir)
-        mock_print.assert_any_call(f"Error: The directory '{os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), self.output_dir)}' was not found.")
+        os.rmdir(self.output_dir)
+        self.process()
+        mock_print.assert_any_call(f"Error: The directory '{self.output_dir}' was not found.")
 
 
 class TestReadCsv(unittest.TestCase):
@@ -123,5 +356,92 @@ class TestReadCsv(unittest.TestCase):
         data = read_csv(empty_csv_path)
         self.assertEqual(data, {})
 
+
+class TestPriceSeries(unittest.TestCase):
+
+    def setUp(self):
+        self.series = PriceSeries()
+        self.series.append(datetime(2024, 1, 3).toordinal(), 4.0, 2.0)
+        self.series.append(datetime(2024, 1, 1).toordinal(), 1.0, 1.0)
+        self.series.append(datetime(2024, 1, 3).toordinal(), 3.0, 0.0)
+
+    def test_sorted_by_date_is_stable(self):
+        """Test that sorting orders by date and keeps same-day observations in order."""
+        sorted_series = self.series.sorted_by_date()
+        self.assertEqual(list(sorted_series.costs), [1.0, 4.0, 3.0])
+        self.assertEqual(list(self.series.costs), [4.0, 1.0, 3.0])
+
+    def test_to_records(self):
+        """Test that records have the same shape as before the columnar storage."""
+        self.assertEqual(self.series.to_records()[0], {
+            "date": "2024-01-03T00:00:00", "cost": 4.0, "quantity": 2.0, "normalized_cost": 2.0
+        })
+        self.assertEqual(self.series.to_records()[2]["normalized_cost"], 0)
+
+    def test_to_lists_round_trip(self):
+        """Test that the cached list form restores the same series."""
+        restored = PriceSeries.from_lists(self.series.to_lists())
+        self.assertEqual(restored.to_records(), self.series.to_records())
+
+    def test_write_price_json_matches_json_dump(self):
+        """Test that streaming the JSON writes the same bytes as json.dump with indent=4."""
+        other = PriceSeries()
+        other.append(1, 2.5, 1.0)
+        items = [("Caf\u00e9 \"Item\"", self.series), ("Other", other)]
+        for expected_items in (items, []):
+            buffer = io.StringIO()
+            write_price_json(buffer, expected_items)
+            expected = json.dumps({item: series.to_records() for item, series in expected_items}, indent=4)
+            self.assertEqual(buffer.getvalue(), expected)
+
+
+class TestRanking(unittest.TestCase):
+
+    def make_series(self, observations):
+        series = PriceSeries()
+        for day, cost, quantity in observations:
+            series.append(datetime(2024, 1, day).toordinal(), cost, quantity)
+        return series
+
+    def test_series_stats(self):
+        """Test each metric on a series given out of date order."""
+        series = self.make_series([(3, 6.0, 2.0), (1, 2.0, 1.0), (2, 4.0, 2.0)])
+        stats = series_stats(series)
+        self.assertEqual(stats['first_cost'], 2.0)
+        self.assertEqual(stats['last_cost'], 6.0)
+        self.assertEqual(stats['absolute_change'], 4.0)
+        self.assertEqual(stats['percent_change'], 200.0)
+        self.assertEqual(stats['unit_change'], 1.0)
+        self.assertAlmostEqual(stats['volatility'], 0.4714045207910317)
+        self.assertAlmostEqual(stats['slope'], 0.5)
+
+    def test_series_stats_same_day(self):
+        """Test that same-day observations resolve first and last like a stable sort."""
+        series = self.make_series([(1, 1.0, 1.0), (1, 2.0, 1.0), (2, 3.0, 1.0), (2, 5.0, 1.0)])
+        sorted_series = series.sorted_by_date()
+        stats = series_stats(series)
+        self.assertEqual(stats['first_cost'], sorted_series.costs[0])
+        self.assertEqual(stats['last_cost'], sorted_series.costs[-1])
+
+    def test_rank_items(self):
+        """Test that the top-K selection matches a full sort, ties included."""
+        all_prices = {
+            "Flat": self.make_series([(1, 1.0, 1.0), (2, 1.0, 1.0)]),
+            "Up": self.make_series([(1, 1.0, 1.0), (2, 3.0, 1.0)]),
+            "Down": self.make_series([(1, 3.0, 1.0), (2, 1.0, 1.0)]),
+            "Single": self.make_series([(1, 9.0, 1.0)]),
+            "Small": self.make_series([(1, 1.0, 1.0), (2, 1.5, 1.0)]),
+        }
+        ranked = [item for item, _ in rank_items(all_prices)]
+        self.assertEqual(ranked, ["Up", "Down", "Small", "Flat"])
+        for limit in range(5):
+            self.assertEqual([item for item, _ in rank_items(all_prices, limit=limit)], ranked[:limit])
+
+        ranked = [item for item, _ in rank_items(all_prices, metric='percent_change', limit=2)]
+        self.assertEqual(ranked, ["Up", "Down"])
+
+        with self.assertRaises(ValueError):
+            rank_items(all_prices, metric='unknown')
+
 if __name__ == "__main__":
     unittest.main()
@@ -2,8 +2,14 @@
 import unittest
 import os
 import csv
+import gzip
+import sqlite3
 from unittest.mock import patch, mock_open
-from har_parser import parse_walmart_har
+from har_parser import parse_walmart_har, parse_har_batch, find_har_files, iter_order_items, CategoryStore
+from har_manifest import file_sha256
+from har_metrics import RunMetrics
+from har_products import PRODUCT_INDEX_FILE, ProductIndex
+from har_sinks import ListSink, OrderItem, SqliteSink
 
 import json
 
@@ -69,6 +75,14 @@ class TestParseWalmartHar(unittest.TestCase):
             os.remove(os.path.join(self.har_dir, f))
         os.rmdir(self.har_dir)
 
+    def read_output_csv(self):
+        """Reads the single CSV in the output directory and removes it."""
+        output_csv_path = os.path.join(self.output_dir, os.listdir(self.output_dir)[0])
+        with open(output_csv_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        os.remove(output_csv_path)
+        return content
+
     @patch("har_parser.get_item_type", return_value="unknown")
     def test_parse_walmart_har_valid_file(self, mock_get_item_type):
         """Test that a valid HAR file is parsed correctly."""
@@ -86,6 +100,173 @@ class TestParseWalmartHar(unittest.TestCase):
             self.assertEqual(rows[0]['item_name'], "Test Item")
             self.assertEqual(rows[1]['item_name'], "Another Item")
 
+    def test_parse_walmart_har_shared_category_store(self):
+        """Test that an injected category store is used and left unflushed."""
+        store = CategoryStore(os.path.join(self.har_dir, "food_or_non_food.json"))
+        store.item_data["Test Item"] = "food"
+
+        parse_walmart_har(self.har_file_path, self.output_dir, category_store=store)
+
+        self.assertEqual(store.new_items, ["Another Item"])
+        self.assertFalse(os.path.exists(store.json_file_path))
+
+        output_csv_path = os.path.join(self.output_dir, os.listdir(self.output_dir)[0])
+        with open(output_csv_path, 'r', newline='', encoding='utf-8') as csvfile:
+            rows = list(csv.DictReader(csvfile))
+        self.assertEqual([row['is_food'] for row in rows], ["food", "unknown"])
+
+    @patch("har_parser.get_item_type", return_value="unknown")
+    def test_parse_walmart_har_stream_matches_load(self, mock_get_item_type):
+        """Test that streaming mode writes the same CSV as loading the whole file."""
+        parse_walmart_har(self.har_file_path, self.output_dir)
+        output_csv_path = os.path.join(self.output_dir, os.listdir(self.output_dir)[0])
+        with open(output_csv_path, 'r', encoding='utf-8') as f:
+            loaded_csv = f.read()
+        os.remove(output_csv_path)
+
+        parse_walmart_har(self.har_file_path, self.output_dir, stream=True)
+        self.assertEqual(os.listdir(self.output_dir), [os.path.basename(output_csv_path)])
+        with open(output_csv_path, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), loaded_csv)
+
+    @patch("har_parser.get_item_type", return_value="unknown")
+    def test_parse_walmart_har_prefilter_matches_load(self, mock_get_item_type):
+        """Test that prefilter mode, with and without the offset index, writes the same CSV."""
+        parse_walmart_har(self.har_file_path, self.output_dir)
+        output_csv_path = os.path.join(self.output_dir, os.listdir(self.output_dir)[0])
+        with open(output_csv_path, 'r', encoding='utf-8') as f:
+            loaded_csv = f.read()
+
+        for _ in range(2):
+            os.remove(output_csv_path)
+            parse_walmart_har(self.har_file_path, self.output_dir, prefilter=True, offset_index=True)
+            with open(output_csv_path, 'r', encoding='utf-8') as f:
+                self.assertEqual(f.read(), loaded_csv)
+
+    @patch("har_parser.get_item_type", return_value="unknown")
+    def test_parse_walmart_har_list_sink(self, mock_get_item_type):
+        """Test that items can be collected in memory instead of written to a CSV."""
+        result = parse_walmart_har(self.har_file_path, self.output_dir, sink=ListSink())
+        self.assertEqual(result['output'], [
+            OrderItem("12345", "Jan 1, 2024", "Test Item", "unknown", 1, "10.00", "", 0),
+            OrderItem("12345", "Jan 1, 2024", "Another Item", "unknown", 2, "5.00", "", 1),
+        ])
+        self.assertEqual(result['order_ids'], ["12345"])
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+    @patch("har_parser.get_item_type", return_value="unknown")
+    def test_parse_walmart_har_repeat_capture_to_sqlite(self, mock_get_item_type):
+        """Test that an order captured twice in a row is stored once in the database."""
+        with open(self.har_file_path, 'r', encoding='utf-8') as f:
+            har_data = json.load(f)
+        har_data["log"]["entries"] *= 2
+        with open(self.har_file_path, 'w', encoding='utf-8') as f:
+            json.dump(har_data, f)
+        db_path = os.path.join(self.output_dir, "orders.db")
+        parse_walmart_har(self.har_file_path, self.output_dir, sink=SqliteSink(db_path))
+        connection = sqlite3.connect(db_path)
+        rows = connection.execute("SELECT line_number, item_name FROM line_items ORDER BY line_number").fetchall()
+        connection.close()
+        self.assertEqual(rows, [(0, "Test Item"), (1, "Another Item")])
+
+    @patch("har_parser.get_item_type", return_value="unknown")
+    def test_parse_walmart_har_metrics(self, mock_get_item_type):
+        """Test that every mode records its stage times and counters, without printing per item."""
+        for options in ({}, {'stream': True}, {'prefilter': True}):
+            metrics = RunMetrics()
+            with patch("builtins.print") as mock_print:
+                parse_walmart_har(self.har_file_path, self.output_dir, sink=ListSink(), metrics=metrics, **options)
+            mock_print.assert_not_called()
+            self.assertEqual(set(metrics.timers), {'load', 'filter', 'decode', 'classify', 'write'})
+            self.assertEqual(metrics.counters, {
+                'entries_scanned': 1, 'entries_matched': 1, 'orders_parsed': 1, 'items_collected': 2
+            })
+
+    @patch("har_parser.get_item_type", return_value="unknown")
+    def test_iter_order_items_is_lazy(self, mock_get_item_type):
+        """Test that items are yielded as each order is parsed."""
+        with open(self.har_file_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)['log']['entries']
+        items = iter_order_items(entries)
+        self.assertEqual(next(items).item_name, "Test Item")
+        self.assertEqual(next(items).item_name, "Another Item")
+
+    @patch("builtins.print")
+    def test_iter_order_items_skipped_orders(self, mock_print):
+        """Test that orders that can't be decoded or have no ID are reported the same way and counted."""
+        url = "https://www.walmart.com/orchestra/orders/graphql/getOrder/1"
+        entries = [
+            {"_resourceType": "fetch", "request": {"url": url}, "response": {"content": {"text": "{"}}},
+            {"_resourceType": "fetch", "request": {"url": url}, "response": {"content": {"text": "{}"}}},
+        ]
+        metrics = RunMetrics()
+        self.assertEqual(list(iter_order_items(entries, metrics=metrics)), [])
+        self.assertEqual(metrics.counters['orders_failed'], 2)
+        self.assertTrue(mock_print.call_args_list[0][0][0].startswith(
+            "Warning: Failed to parse data from a matching request."))
+        mock_print.assert_called_with("Warning: Could not find order ID or title. Skipping this request.")
+
+    @patch("har_parser.get_item_type", return_value="unknown")
+    def test_parse_walmart_har_compressed_matches_plain(self, mock_get_item_type):
+        """Test that every mode reads a gzipped capture into the same CSV as the plain file."""
+        parse_walmart_har(self.har_file_path, self.output_dir)
+        expected = self.read_output_csv()
+
+        gzip_path = self.har_file_path + ".gz"
+        with open(self.har_file_path, 'rb') as f_in, gzip.open(gzip_path, 'wb') as f_out:
+            f_out.write(f_in.read())
+        for options in ({}, {'stream': True}, {'prefilter': True}):
+            parse_walmart_har(gzip_path, self.output_dir, **options)
+            self.assertEqual(self.read_output_csv(), expected, options)
+
+    @patch("har_parser.get_item_type", return_value="unknown")
+    def test_parse_walmart_har_order_cache(self, mock_get_item_type):
+        """Test that the order cache is written in every mode and parses into the same CSV as the HAR."""
+        for options in ({}, {'stream': True}, {'prefilter': True}):
+            result = parse_walmart_har(self.har_file_path, self.output_dir, order_cache_dir=self.har_dir, **options)
+            expected = self.read_output_csv()
+            cache_path = result['order_cache']
+            self.assertEqual(cache_path, os.path.join(self.har_dir, "sample.orders.jsonl"))
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+            self.assertEqual(header['sha256'], file_sha256(self.har_file_path))
+
+            result = parse_walmart_har(cache_path, self.output_dir, order_cache_dir=self.har_dir, **options)
+            self.assertEqual(self.read_output_csv(), expected, options)
+            self.assertEqual(result['order_ids'], ["12345"])
+            self.assertIsNone(result['order_cache'])
+            os.remove(cache_path)
+
+    @patch("builtins.print")
+    def test_parse_walmart_har_corrupt_archive(self, mock_print):
+        """Test that a corrupt compressed capture is reported and writes nothing."""
+        corrupt_path = self.har_file_path + ".gz"
+        with open(corrupt_path, 'wb') as f:
+            f.write(b'\x1f\x8b' + b'\x00' * 32)
+        for options in ({}, {'stream': True}):
+            self.assertIsNone(parse_walmart_har(corrupt_path, self.output_dir, **options))
+            self.assertTrue(mock_print.call_args[0][0].startswith(f"Error: Could not decompress '{corrupt_path}'."))
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+    def test_parse_walmart_har_unexpected_error_discards_outputs(self):
+        """Test that an error without a handler of its own leaves no temp files behind."""
+        with open(self.har_file_path, 'w', encoding='utf-8') as f:
+            json.dump(make_har_data("1", "Store purchase", ["Milk"]), f)
+        for options in ({}, {'stream': True}, {'prefilter': True}):
+            with self.assertRaises(ValueError):
+                parse_walmart_har(self.har_file_path, self.output_dir, category_store=CategoryStore(rules_file=None),
+                                  order_cache_dir=self.har_dir, **options)
+            self.assertEqual(os.listdir(self.output_dir), [], options)
+            self.assertEqual(os.listdir(self.har_dir), ["sample.har"], options)
+
+    @patch("builtins.print")
+    def test_parse_walmart_har_stream_missing_entries_key(self, mock_print):
+        """Test that streaming mode reports a missing 'entries' key."""
+        with open(self.har_file_path, 'w') as f:
+            json.dump({"log": {}}, f)
+        parse_walmart_har(self.har_file_path, self.output_dir, stream=True)
+        mock_print.assert_called_with("Error: The HAR file structure is invalid. 'log' or 'entries' key is missing.")
+
     @patch("builtins.print")
     def test_parse_walmart_har_file_not_found(self, mock_print):
         """Test that a FileNotFoundError is handled."""
@@ -106,5 +287,191 @@ class TestParseWalmartHar(unittest.TestCase):
         parse_walmart_har("any_file.har", self.output_dir)
         mock_print.assert_called_with("Error: The HAR file structure is invalid. 'log' or 'entries' key is missing.")
 
+
+def make_har_data(order_id, order_title, item_names, item_ids=None):
+    """Builds a minimal HAR with one getOrder entry holding the given items."""
+    items = [
+        {"productInfo": {"name": name}, "quantity": 1, "priceInfo": {"linePrice": {"value": "1.00"}}}
+        for name in item_names
+    ]
+    for item, item_id in zip(items, item_ids or []):
+        item["productInfo"]["usItemId"] = item_id
+    order = {"data": {"order": {"id": order_id, "title": order_title, "groups_2101": [{"items": items}]}}}
+    return {
+        "log": {
+            "entries": [
+                {
+                    "_resourceType": "fetch",
+                    "request": {"url": f"https://www.walmart.com/orchestra/orders/graphql/getOrder/{order_id}"},
+                    "response": {"content": {"text": json.dumps(order)}}
+                }
+            ]
+        }
+    }
+
+
+class TestParseHarBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = "test_batch_output"
+        self.har_dir = "test_batch_hars"
+        os.makedirs(self.har_dir, exist_ok=True)
+        self.category_file = os.path.join(self.har_dir, "food_or_non_food.json")
+        with open(self.category_file, 'w', encoding='utf-8') as f:
+            json.dump({"Apples": "food"}, f)
+
+        self.har_file_paths = []
+        orders = [
+            ("1", "Jan 1, 2024", ["Apples", "Soap"]),
+            ("2", "Feb 2, 2024", ["Soap", "Bread"]),
+            ("3", "Mar 3, 2024", ["Bread", "Towels"]),
+        ]
+        for order_id, order_title, item_names in orders:
+            har_file_path = os.path.join(self.har_dir, f"capture_{order_id}.har")
+            with open(har_file_path, 'w', encoding='utf-8') as f:
+                json.dump(make_har_data(order_id, order_title, item_names), f)
+            self.har_file_paths.append(har_file_path)
+
+    def tearDown(self):
+        for directory in (self.output_dir, self.har_dir):
+            if os.path.exists(directory):
+                for f in os.listdir(directory):
+                    os.remove(os.path.join(directory, f))
+                os.rmdir(directory)
+
+    @patch("builtins.print")
+    def test_parse_har_batch(self, mock_print):
+        """Test that every HAR gets its CSV and new items are merged once, in input order."""
+        for jobs in (2, 1):
+            results = parse_har_batch(self.har_file_paths, self.output_dir, jobs=jobs,
+                                      category_file=self.category_file, rules_file=None)
+
+            self.assertEqual(list(results), self.har_file_paths)
+            self.assertEqual(sorted(os.listdir(self.output_dir)), [
+                "2024-01-01_2024-01-01_walmart_order_items.csv",
+                "2024-02-02_2024-02-02_walmart_order_items.csv",
+                "2024-03-03_2024-03-03_walmart_order_items.csv",
+            ])
+            with open(self.category_file, 'r', encoding='utf-8') as f:
+                self.assertEqual(list(json.load(f).items()), [
+                    ("Apples", "food"), ("Soap", "unknown"), ("Bread", "unknown"), ("Towels", "unknown")
+                ])
+
+            with open(results[self.har_file_paths[0]]['output'], 'r', newline='', encoding='utf-8') as csvfile:
+                rows = list(csv.DictReader(csvfile))
+            self.assertEqual([row['is_food'] for row in rows], ["food", "unknown"])
+
+    @patch("builtins.print")
+    def test_parse_har_batch_classifies_new_items(self, mock_print):
+        """Test that new items matching a rule are saved with the rule's type."""
+        rules_file = os.path.join(self.har_dir, "rules.json")
+        with open(rules_file, 'w', encoding='utf-8') as f:
+            json.dump({"rules": [{"name": "bakery", "type": "food", "keywords": ["bread"]},
+                                 {"name": "bath", "type": "nonfood", "keywords": ["soap", "towel"]}]}, f)
+        metrics = RunMetrics()
+        parse_har_batch(self.har_file_paths, self.output_dir, jobs=2, category_file=self.category_file,
+                        rules_file=rules_file, metrics=metrics)
+        with open(self.category_file, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {"Apples": "food", "Soap": "nonfood", "Bread": "food", "Towels": "nonfood"})
+        self.assertEqual(metrics.counters['items_classified'], 3)
+
+    @patch("builtins.print")
+    def test_parse_har_batch_indexes_item_ids(self, mock_print):
+        """Test that item IDs are written to the CSVs and the product index keeps the latest name."""
+        orders = [
+            ("4", "Apr 4, 2024", ["Whole Milk, 1 Gallon", "Soap"], ["555", "777"]),
+            ("5", "Jan 5, 2024", ["Milk 1 gal"], ["555"]),
+        ]
+        har_file_paths = []
+        for order_id, order_title, item_names, item_ids in orders:
+            har_file_path = os.path.join(self.har_dir, f"capture_{order_id}.har")
+            with open(har_file_path, 'w', encoding='utf-8') as f:
+                json.dump(make_har_data(order_id, order_title, item_names, item_ids), f)
+            har_file_paths.append(har_file_path)
+
+        metrics = RunMetrics()
+        results = parse_har_batch(har_file_paths, self.output_dir, jobs=2, category_file=self.category_file,
+                                  rules_file=None, metrics=metrics)
+        with open(results[har_file_paths[0]]['output'], 'r', newline='', encoding='utf-8') as csvfile:
+            self.assertEqual([row['item_id'] for row in csv.DictReader(csvfile)], ["555", "777"])
+
+        product_index = ProductIndex(os.path.join(self.output_dir, PRODUCT_INDEX_FILE))
+        self.assertEqual(product_index.canonical_name("555"), "Whole Milk, 1 Gallon")
+        self.assertEqual(product_index.aliases("555"), ["Milk 1 gal"])
+        self.assertEqual(metrics.counters['products_indexed'], 2)
+
+    @patch("builtins.print")
+    def test_parse_har_batch_skips_processed_files(self, mock_print):
+        """Test that files recorded in the manifest are only parsed again with force."""
+        results = parse_har_batch(self.har_file_paths[:2], self.output_dir, jobs=1,
+                                  category_file=self.category_file, use_manifest=True)
+        self.assertEqual(results[self.har_file_paths[0]]['order_ids'], ["1"])
+
+        metrics = RunMetrics()
+        results = parse_har_batch(self.har_file_paths, self.output_dir, jobs=1,
+                                  category_file=self.category_file, use_manifest=True, metrics=metrics)
+        self.assertEqual(list(results), self.har_file_paths[2:])
+        self.assertEqual(metrics.counters['files_skipped'], 2)
+        self.assertEqual(metrics.counters['files_parsed'], 1)
+        self.assertEqual(metrics.counters['items_collected'], 2)
+        self.assertEqual(metrics.counters['items_new'], 1)
+
+        results = parse_har_batch(self.har_file_paths, self.output_dir, jobs=1,
+                                  category_file=self.category_file, use_manifest=True, force=True)
+        self.assertEqual(list(results), self.har_file_paths)
+
+    @patch("builtins.print")
+    def test_parse_har_batch_order_cache_reuses_hash(self, mock_print):
+        """Test that the order cache gets the SHA-256 the manifest computed instead of hashing the HAR again."""
+        with patch("har_cache.file_sha256") as mock_sha256:
+            results = parse_har_batch(self.har_file_paths[:1], self.output_dir, jobs=1,
+                                      category_file=self.category_file, rules_file=None, use_manifest=True,
+                                      order_cache_dir=self.output_dir)
+        mock_sha256.assert_not_called()
+        with open(results[self.har_file_paths[0]]['order_cache'], 'r', encoding='utf-8') as f:
+            self.assertEqual(json.loads(f.readline())['sha256'], file_sha256(self.har_file_paths[0]))
+
+    @patch("builtins.print")
+    def test_parse_har_batch_failed_file(self, mock_print):
+        """Test that a file failing with an unexpected error doesn't stop the others from being saved."""
+        bad_path = os.path.join(self.har_dir, "capture_0.har")
+        with open(bad_path, 'w', encoding='utf-8') as f:
+            json.dump(make_har_data("0", "Store purchase", ["Milk"], ["999"]), f)
+        orders = [("4", "Apr 4, 2024", ["Cheese"], ["555"])]
+        good_path = os.path.join(self.har_dir, "capture_4.har")
+        with open(good_path, 'w', encoding='utf-8') as f:
+            json.dump(make_har_data(*orders[0]), f)
+
+        for jobs in (2, 1):
+            metrics = RunMetrics()
+            results = parse_har_batch([bad_path, good_path], self.output_dir, jobs=jobs,
+                                      category_file=self.category_file, rules_file=None, use_manifest=True,
+                                      force=True, metrics=metrics)
+            self.assertIsNone(results[bad_path])
+            self.assertEqual(results[good_path]['order_ids'], ["4"])
+            self.assertEqual(metrics.counters['files_failed'], 1)
+            if jobs == 1:
+                # Workers print in their own process
+                self.assertTrue(mock_print.call_args[0][0].startswith(f"Error: Could not parse '{bad_path}'."))
+
+            with open(self.category_file, 'r', encoding='utf-8') as f:
+                self.assertEqual(json.load(f), {"Apples": "food", "Cheese": "unknown"})
+            product_index = ProductIndex(os.path.join(self.output_dir, PRODUCT_INDEX_FILE))
+            self.assertEqual(list(product_index.products), ["555"])
+            with open(os.path.join(self.output_dir, ".har_manifest.json"), 'r', encoding='utf-8') as f:
+                self.assertEqual(len(json.load(f)['files']), 1)
+            self.assertFalse([f for f in os.listdir(self.output_dir) if f.endswith('.tmp')])
+
+    def test_find_har_files(self):
+        """Test that directories and glob patterns expand to HAR files without duplicates."""
+        pattern = os.path.join(self.har_dir, "capture_*.har")
+        self.assertEqual(find_har_files([self.har_dir, pattern]), self.har_file_paths)
+
+        compressed_path = os.path.join(self.har_dir, "capture_4.har.gz")
+        with gzip.open(compressed_path, 'wb') as f:
+            f.write(b'{}')
+        self.assertEqual(find_har_files([self.har_dir]), self.har_file_paths + [compressed_path])
+        self.assertEqual(find_har_files(["missing.har"]), ["missing.har"])
+
 if __name__ == "__main__":
     unittest.main()
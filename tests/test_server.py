@@ -0,0 +1,203 @@
+import unittest
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date, datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analytics.historical_prices import PriceSeries, rank_items, write_dashboard_data, DASHBOARD_DATA_DIR
+from analytics.server import DashboardServer, HttpError
+from analytics.spend_rollups import SpendRollups
+
+class TestDashboardServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.analytics_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.analytics_dir, "graph.html"), 'w', encoding='utf-8') as f:
+            f.write("<html>" + "x" * 2000 + "</html>")
+        self.write_data({
+            "Milk": [(1, 2.0, 1.0), (5, 3.0, 1.0)],
+            "Bread": [(1, 4.0, 1.0), (3, 2.0, 1.0)],
+            "Eggs": [(2, 5.0, 1.0), (4, 5.5, 1.0)],
+        })
+
+        self.server = DashboardServer(self.analytics_dir, reload_interval=0.01)
+        await self.server.reload_if_changed()
+        self.tcp_server = await asyncio.start_server(self.server.handle_connection, '127.0.0.1', 0)
+        self.port = self.tcp_server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.tcp_server.close()
+        await self.tcp_server.wait_closed()
+        shutil.rmtree(self.analytics_dir)
+
+    def write_data(self, observations):
+        all_prices = {}
+        for item, points in observations.items():
+            series = all_prices[item] = PriceSeries()
+            for day, cost, quantity in points:
+                series.append(datetime(2024, 1, day).toordinal(), cost, quantity)
+        data_dir = os.path.join(self.analytics_dir, DASHBOARD_DATA_DIR)
+        write_dashboard_data(data_dir, rank_items(all_prices), all_prices, 'absolute_change')
+
+    async def request(self, path, headers=None, connection=None):
+        """Sends one GET and returns the status, the response headers and the body."""
+        reader, writer = connection or await asyncio.open_connection('127.0.0.1', self.port)
+        lines = [f"GET {path} HTTP/1.1", "Host: localhost"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        await writer.drain()
+        status, response_headers, body = await self.read_response(reader)
+        if connection is None:
+            writer.close()
+        return status, response_headers, body
+
+    async def read_response(self, reader):
+        status = int((await reader.readline()).split()[1])
+        response_headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(response_headers['content-length']))
+        return status, response_headers, body
+
+    async def test_search_and_item(self):
+        """Test that search matches names case-insensitively and item returns the series."""
+        status, _, body = await self.request("/api/search?q=MIL")
+        self.assertEqual(status, 200)
+        self.assertEqual([stats['name'] for stats in json.loads(body)], ["Milk"])
+
+        status, _, body = await self.request("/api/item?name=Bread")
+        data = json.loads(body)
+        self.assertEqual(data['stats']['first_date'], "2024-01-01T00:00:00")
+        self.assertEqual([point['cost'] for point in data['series']], [4.0, 2.0])
+
+        status, _, body = await self.request("/api/item?name=Cheese")
+        self.assertEqual(status, 404)
+        self.assertIn("Cheese", json.loads(body)['error'])
+
+    async def test_top_and_range(self):
+        """Test the top movers by a metric and the date-range filter."""
+        _, _, body = await self.request("/api/top?metric=absolute_change&n=2")
+        self.assertEqual([stats['name'] for stats in json.loads(body)], ["Bread", "Milk"])
+
+        status, _, _ = await self.request("/api/top?metric=unknown")
+        self.assertEqual(status, 400)
+
+        _, _, body = await self.request("/api/range?start=2024-01-02&end=2024-01-04&name=Eggs&name=Milk")
+        data = json.loads(body)
+        self.assertEqual([point['cost'] for point in data['Eggs']], [5.0, 5.5])
+        self.assertNotIn('Milk', data)
+
+    async def test_spend(self):
+        """Test that the spend rollups are served and filtered by category and date."""
+        rollups = SpendRollups()
+        rollups.add_order("1", date(2024, 1, 30), [("food", "Milk", 1.0, 3.0), ("nonfood", "Soap", 1.0, 2.0)])
+        rollups.add_order("2", date(2024, 2, 2), [("food", "Milk", 1.0, 3.5)])
+        rollups.write_dashboard_data(os.path.join(self.analytics_dir, DASHBOARD_DATA_DIR))
+        await self.server.reload_if_changed()
+
+        _, _, body = await self.request("/api/spend?period=month&category=food&start=2024-02-01")
+        self.assertEqual(json.loads(body), [
+            {'period': "2024-02", 'category': "food", 'spend': 3.5, 'quantity': 1.0, 'distinct_items': 1}])
+        _, _, body = await self.request("/api/spend?period=week")
+        self.assertEqual([(bucket['category'], bucket['spend']) for bucket in json.loads(body)],
+                         [("food", 6.5), ("nonfood", 2.0)])
+
+        status, _, _ = await self.request("/api/spend?period=year")
+        self.assertEqual(status, 400)
+        status, _, _ = await self.request("/api/spend?start=January")
+        self.assertEqual(status, 400)
+
+    async def test_static_files_gzip_and_etag(self):
+        """Test the precompressed data files, gzip for graph.html and 304 on a matching ETag."""
+        status, headers, body = await self.request("/data/index.json", {'Accept-Encoding': 'gzip'})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertIn('Milk', json.loads(gzip.decompress(body))['items'][1])
+
+        status, headers, body = await self.request("/")
+        self.assertEqual(status, 200)
+        self.assertNotIn('content-encoding', headers)
+        self.assertTrue(body.startswith(b"<html>"))
+
+        status, _, body = await self.request("/", {'If-None-Match': headers['etag']})
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+        status, _, _ = await self.request("/data/../graph.html")
+        self.assertEqual(status, 404)
+
+    async def test_keep_alive_and_concurrent_clients(self):
+        """Test several requests on one connection while other clients are served."""
+        connection = await asyncio.open_connection('127.0.0.1', self.port)
+        for _ in range(3):
+            status, headers, _ = await self.request("/api/search?q=e", connection=connection)
+            self.assertEqual(status, 200)
+            self.assertEqual(headers['connection'], 'keep-alive')
+        connection[1].close()
+
+        results = await asyncio.gather(*(self.request(f"/api/item?name={name}")
+                                         for name in ["Milk", "Bread", "Eggs"] * 5))
+        self.assertTrue(all(status == 200 for status, _, _ in results))
+
+    async def test_request_bodies_are_skipped(self):
+        """Test that a POST body is read past, so the next request on the connection is answered."""
+        reader, writer = connection = await asyncio.open_connection('127.0.0.1', self.port)
+        body = b'GET /api/search?q=e HTTP/1.1\r\n\r\n' * 10000
+        writer.write(b"POST /api/search HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+        status, headers, _ = await self.read_response(reader)
+        self.assertEqual(status, 405)
+        self.assertEqual(headers['connection'], 'keep-alive')
+        status, _, body = await self.request("/api/search?q=milk", connection=connection)
+        self.assertEqual(status, 200)
+        self.assertIn(b'Milk', body)
+        writer.close()
+
+    async def test_oversized_requests(self):
+        """Test that a request line or header over the stream limit gets an error and the connection is closed."""
+        for request, expected_status in [(b"GET /" + b"a" * 70000 + b" HTTP/1.1\r\n\r\n", 414),
+                                         (b"GET / HTTP/1.1\r\nCookie: " + b"a" * 70000 + b"\r\n\r\n", 431),
+                                         (b"GET / HTTP/1.1\r\n" + b"X-A: b\r\n" * 200 + b"\r\n", 431),
+                                         (b"POST / HTTP/1.1\r\nContent-Length: ten\r\n\r\n", 400)]:
+            reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+            writer.write(request)
+            status, headers, _ = await self.read_response(reader)
+            self.assertEqual(status, expected_status)
+            self.assertEqual(headers['connection'], 'close')
+            self.assertEqual(await reader.read(), b'')
+            writer.close()
+
+    async def test_hot_reload(self):
+        """Test that a rebuilt index is picked up and changes the ETag."""
+        _, headers, _ = await self.request("/api/search?q=")
+        self.write_data({"Cheese": [(1, 1.0, 1.0), (2, 9.0, 1.0)]})
+        # Make sure the new index has a different mtime even on coarse file systems
+        index_path = os.path.join(self.analytics_dir, DASHBOARD_DATA_DIR, "index.json")
+        stat = os.stat(index_path)
+        os.utime(index_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        await self.server.reload_if_changed()
+        status, new_headers, body = await self.request("/api/search?q=", {'If-None-Match': headers['etag']})
+        self.assertEqual(status, 200)
+        self.assertNotEqual(new_headers['etag'], headers['etag'])
+        self.assertEqual([stats['name'] for stats in json.loads(body)], ["Cheese"])
+
+    async def test_no_data(self):
+        """Test that the API answers 503 until the data has been generated."""
+        server = DashboardServer(os.path.join(tempfile.gettempdir(), "missing_analytics_dir"))
+        await server.reload_if_changed()
+        with self.assertRaises(HttpError) as context:
+            server._respond('GET', '/api/search?q=', {})
+        self.assertEqual(context.exception.status, 503)
+
+if __name__ == '__main__':
+    unittest.main()
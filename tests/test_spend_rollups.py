@@ -0,0 +1,145 @@
+import unittest
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analytics.spend_rollups import (SpendRollups, update_spend_rollups, period_key, ROLLUP_FILE, SPEND_FILE,
+                                     SPEND_FIELDS)
+from analytics.historical_prices import DASHBOARD_DATA_DIR
+from har_metrics import RunMetrics
+from har_sinks import OrderItem, SqliteSink, CSV_FIELDNAMES
+
+class TestSpendRollups(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.temp_dir, "output")
+        self.analytics_dir = os.path.join(self.temp_dir, "analytics")
+        os.makedirs(self.output_dir)
+        self.rows = [
+            ["1", "Jan 30, 2024", "Milk", "food", "2", "6.40", "555"],
+            ["1", "Jan 30, 2024", "Soap", "nonfood", "1", "2.10", ""],
+            ["2", "Feb 02, 2024", "Milk", "food", "1", "3.30", "555"],
+            ["2", "Feb 02, 2024", "Bread", "food", "1", "2.50", "101"],
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_csv(self, file_name, rows):
+        with open(os.path.join(self.output_dir, file_name), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDNAMES)
+            writer.writerows(rows)
+
+    def update(self, **kwargs):
+        return update_spend_rollups(output_dir=self.output_dir, analytics_dir=self.analytics_dir, **kwargs)
+
+    def test_period_key(self):
+        """Test that weeks use ISO week numbering and both keys sort by date."""
+        self.assertEqual(period_key('week', date(2024, 1, 30)), "2024-W05")
+        self.assertEqual(period_key('week', date(2024, 12, 30)), "2025-W01")
+        self.assertEqual(period_key('month', date(2024, 2, 2)), "2024-02")
+        with self.assertRaises(ValueError):
+            period_key('year', date(2024, 1, 1))
+
+    def test_query(self):
+        """Test the weekly and monthly buckets and the category and date filters."""
+        self.write_csv("orders.csv", self.rows)
+        rollups = self.update()
+        self.assertEqual(rollups.query('month'), [
+            {'period': "2024-01", 'category': "food", 'spend': 6.40, 'quantity': 2, 'distinct_items': 1},
+            {'period': "2024-01", 'category': "nonfood", 'spend': 2.10, 'quantity': 1, 'distinct_items': 1},
+            {'period': "2024-02", 'category': "food", 'spend': 5.80, 'quantity': 2, 'distinct_items': 2},
+        ])
+        # Jan 30 and Feb 2, 2024 are in the same ISO week
+        self.assertEqual(rollups.query('week', category="food"), [
+            {'period': "2024-W05", 'category': "food", 'spend': 12.20, 'quantity': 4, 'distinct_items': 2},
+        ])
+        self.assertEqual([row['period'] for row in rollups.query('month', start=date(2024, 2, 15))], ["2024-02"])
+        self.assertEqual([row['period'] for row in rollups.query('month', end=date(2024, 1, 1))],
+                         ["2024-01", "2024-01"])
+
+        with open(os.path.join(self.analytics_dir, DASHBOARD_DATA_DIR, SPEND_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertEqual(data['fields'], list(SPEND_FIELDS))
+        self.assertEqual(data['week'], [["2024-W05", "food", 12.2, 4, 2], ["2024-W05", "nonfood", 2.1, 1, 1]])
+
+    def test_incremental_update_matches_rebuild(self):
+        """Test that new files only add their new orders and unchanged files aren't read."""
+        self.write_csv("a.csv", self.rows[:2])
+        self.update()
+
+        # b.csv repeats order 1, which must not be counted twice
+        self.write_csv("b.csv", self.rows)
+        metrics = RunMetrics()
+        rollups = self.update(metrics=metrics)
+        self.assertEqual(metrics.counters['csv_files_unchanged'], 1)
+        self.assertEqual(metrics.counters['csv_files_read'], 1)
+        self.assertEqual(metrics.counters['orders_added'], 1)
+        self.assertEqual(metrics.counters['orders_skipped'], 1)
+
+        rebuilt = self.update(rebuild=True)
+        for period in ('week', 'month'):
+            self.assertEqual(rollups.query(period), rebuilt.query(period))
+        self.assertEqual(SpendRollups(os.path.join(self.analytics_dir, ROLLUP_FILE)).query('month'),
+                         rebuilt.query('month'))
+
+        # Nothing changed, so nothing is read or written
+        rollup_path = os.path.join(self.analytics_dir, ROLLUP_FILE)
+        mtime_ns = os.stat(rollup_path).st_mtime_ns
+        metrics = RunMetrics()
+        self.update(metrics=metrics)
+        self.assertEqual(metrics.counters['csv_files_unchanged'], 2)
+        self.assertNotIn('orders_added', metrics.counters)
+        self.assertEqual(os.stat(rollup_path).st_mtime_ns, mtime_ns)
+
+    def test_repeat_captures_are_counted_once(self):
+        """Test that an order captured twice in one file only counts its last capture."""
+        order = [["3", "Mar 01, 2024", "Soap", "nonfood", "1", "3.00", "", "0"]]
+        self.write_csv("captured_twice.csv", order + order)
+        # Written before line numbers were recorded, with another order in between
+        self.write_csv("older.csv", [row[:7] for row in self.rows[:2] + self.rows[2:] + self.rows[:2]])
+        rollups = self.update()
+        self.assertEqual([(row['period'], row['category'], row['spend']) for row in rollups.query('month')], [
+            ("2024-01", "food", 6.40), ("2024-01", "nonfood", 2.10), ("2024-02", "food", 5.80),
+            ("2024-03", "nonfood", 3.00),
+        ])
+
+    def test_from_sqlite(self):
+        """Test that the database gives the same rollups as the CSV file."""
+        self.write_csv("orders.csv", self.rows)
+        from_csv = self.update()
+
+        db_path = os.path.join(self.output_dir, "walmart_orders.db")
+        sink = SqliteSink(db_path)
+        for row in self.rows:
+            sink.write(OrderItem(*row))
+        sink.close()
+        shutil.rmtree(self.analytics_dir)
+        from_sqlite = self.update(db_path=db_path)
+        for period in ('week', 'month'):
+            self.assertEqual(from_sqlite.query(period), from_csv.query(period))
+
+    @patch("builtins.print")
+    def test_invalid_rollup_file(self, mock_print):
+        """Test that an unreadable rollup file is rebuilt from the CSV files."""
+        self.write_csv("orders.csv", self.rows)
+        os.makedirs(self.analytics_dir)
+        rollup_path = os.path.join(self.analytics_dir, ROLLUP_FILE)
+        with open(rollup_path, 'w', encoding='utf-8') as f:
+            f.write("{not json")
+        rollups = self.update()
+        self.assertEqual(len(rollups.orders), 2)
+        self.assertTrue(mock_print.call_args[0][0].startswith(
+            f"Warning: Could not read the spend rollups '{rollup_path}'."))
+
+if __name__ == "__main__":
+    unittest.main()